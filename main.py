@@ -1,8 +1,52 @@
-from scripts.run_analysis import run_analysis
+import argparse
+from scripts.run_analysis import load_config, run_analysis, run_split, run_embed, run_predict, run_evaluate, run_evaluate_retrieval, run_serve, save_metrics
 
 def main():
-    config_path = 'config/config.yml'
-    run_analysis(config_path)
+    # "--resume" is defined once and accepted before or after "predict". It is suppressed when absent (False comes from the
+    # initial namespace), so the predict subparser does not reset a value given before the subcommand.
+    resume_parser = argparse.ArgumentParser(add_help=False)
+    resume_parser.add_argument('--resume', action='store_true', default=argparse.SUPPRESS, help="Skip the paragraphs already saved in the predictions checkpoint")
+    parser = argparse.ArgumentParser(description="PromiseEval baseline method (RAG through GPT-4o)", parents=[resume_parser])
+    parser.add_argument('--config', default='config/config.yml', help="Path to the configuration file")
+    subparsers = parser.add_subparsers(dest='command', help="Run a single stage (all stages are run if omitted)")
+    subparsers.add_parser('split', help="Split the raw data into search and test sets")
+    subparsers.add_parser('embed', help="Encode the search data into the embedding cache and build the index")
+    subparsers.add_parser('predict', help="Annotate the test data with the LLM", parents=[resume_parser])
+    evaluate_parser = subparsers.add_parser('evaluate', help="Evaluate the saved predictions")
+    evaluate_parser.add_argument('--allow-partial', action='store_true', help="Evaluate an incomplete predictions checkpoint on the paragraphs it covers")
+    subparsers.add_parser('evaluate-retrieval', help="Evaluate the retrieved examples and the retrieval latency without calling the LLM")
+    serve_parser = subparsers.add_parser('serve', help="Serve the retrieval and annotation of several languages with one embedding model")
+    serve_parser.add_argument('languages', nargs='+', help="Language datasets as NAME=CONFIG, e.g. ja=config/ja.yml en=config/en.yml")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8100)
+    serve_parser.add_argument('--max-batch-size', type=int, default=64, help="Maximum number of queries encoded together")
+    serve_parser.add_argument('--max-wait', type=float, default=0.005, help="Maximum time in seconds a query waits for others to join its batch")
+    args = parser.parse_args(namespace=argparse.Namespace(resume=False))
+
+    if args.command == 'serve':
+        config_paths = dict(language.split('=', 1) for language in args.languages)
+        service = run_serve(config_paths, args.host, args.port, args.max_batch_size, args.max_wait)
+        try:
+            service.thread.join()
+        except KeyboardInterrupt:
+            service.stop()
+        return
+
+    if args.command is None:
+        run_analysis(args.config, resume=args.resume)
+        return
+    config = load_config(args.config)
+    if args.command == 'split':
+        run_split(config)
+    elif args.command == 'embed':
+        run_embed(config)
+    elif args.command == 'predict':
+        run_predict(config, resume=args.resume)
+        save_metrics(config)
+    elif args.command == 'evaluate':
+        run_evaluate(config, allow_partial=args.allow_partial)
+    elif args.command == 'evaluate-retrieval':
+        run_evaluate_retrieval(config)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,69 +1,43 @@
-# 1つのファイルにまとめられていない
+import sys
+import os
 
-import pandas as pd
-import numpy as np
-import json
-
-def fleiss_kappa(ratings):
-    n_raters = ratings.shape[1]
-    n_items = ratings.shape[0]
-    
-    # すべての値を文字列に変換（NaNは'nan'として扱う）
-    str_ratings = ratings.astype(str)
-    
-    # カテゴリの数を動的に決定
-    categories = np.unique(str_ratings)
-    n_categories = len(categories)
-    
-    # カテゴリの再マッピング
-    category_mapping = {cat: i for i, cat in enumerate(categories)}
-    
-    def map_category(x):
-        return category_mapping.get(x, -1)
-    
-    mapped_ratings = np.vectorize(map_category)(str_ratings)
-    
-    # カテゴリごとの評価者数をカウント
-    category_counts = np.apply_along_axis(
-        lambda x: np.bincount(x, minlength=n_categories), 
-        axis=1, 
-        arr=mapped_ratings
-    )
-    
-    # 項目ごとの一致度を計算
-    p_i = np.sum(category_counts * (category_counts - 1), axis=1) / (n_raters * (n_raters - 1))
-    P_bar = np.mean(p_i)
-
-    # カテゴリごとの周辺確率を計算
-    p_j = np.sum(category_counts, axis=0) / (n_items * n_raters)
-    P_e = np.sum(p_j ** 2)
-
-    # Fleissのカッパ係数を計算
-    kappa = (P_bar - P_e) / (1 - P_e)
-    return kappa
-
-def process_sheet(sheet):
-    # データをそのまま使用
-    ratings = sheet.values
-    return fleiss_kappa(ratings)
-
-# Excelファイルを読み込む
-file_path = "./data/Freiss_Japanese/Freiss_1_final.xlsx"
-sheet_name = "sample200"
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# 指定された列（H, I, J）のデータを読み込む
-# Fress: HIJ RST ABACAD ALAMAN
-df = pd.read_excel(file_path, sheet_name=sheet_name, usecols="AL:AN", header=None)
-
-# Fleissのカッパ係数を計算
-kappa = process_sheet(df)
-
-# 結果を辞書形式で保存
-results = {sheet_name: kappa}
-
-# # 結果をJSONファイルに出力
-# with open("./data/Freiss_Japanese/Freiss_1_final_eq.json", "w") as f:
-#     json.dump(results, f, indent=4)
-
-# print(f"Fleissのカッパ係数の計算が完了し、結果が./data/Freiss_1.jsonに保存されました。")
-print(f"計算されたFleissのカッパ係数: {kappa}")
\ No newline at end of file
+import argparse
+import json
+from src.agreement import file_agreement
+
+# 3人の評価者のFleissのカッパ係数を全ラベルまとめて計算する（src/agreement.py を使用）
+# 欠損値はカテゴリとして数えず、評価が2つ以上ある項目だけを使う
+
+# ラベルとそれに対応する列（Excelの列名）
+LABELS = {
+    "promise_status": ["H", "I", "J"],
+    "verification_timeline": ["R", "S", "T"],
+    "evidence_status": ["AB", "AC", "AD"],
+    "evidence_quality": ["AL", "AM", "AN"],
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleissのカッパ係数")
+    parser.add_argument('--file', default="./data/Freiss_Japanese/Freiss_1_final.xlsx")
+    parser.add_argument('--sheet', default="sample200")
+    parser.add_argument('--output', help="結果を保存するJSONファイル（例: ./data/Freiss_Japanese/Freiss_1_final.json）")
+    parser.add_argument('--bootstrap', type=int, default=0, help="ブートストラップ信頼区間のリサンプル数（0なら計算しない）")
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    report = file_agreement(args.file, LABELS, sheets=[args.sheet], metrics=('fleiss',),
+                            n_resamples=args.bootstrap, workers=args.workers)[args.sheet]
+    results = {label: result['fleiss']['value'] for label, result in report.items()}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Fleissのカッパ係数の計算が完了し、結果が{args.output}に保存されました。")
+    for label, result in report.items():
+        interval = f" 95%信頼区間: {result['fleiss']['ci']}" if 'ci' in result['fleiss'] else ""
+        print(f"計算されたFleissのカッパ係数 ({label}): {result['fleiss']['value']}{interval}")
+
+if __name__ == "__main__":
+    main()
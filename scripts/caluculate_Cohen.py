@@ -1,88 +1,51 @@
-import pandas as pd
-import numpy as np
-from sklearn.metrics import cohen_kappa_score
-import json
-
-def read_excel_data(file_path, sheet_name, usecols):
-    return pd.read_excel(file_path, sheet_name=sheet_name, usecols=usecols, header=None, skiprows=1, nrows=200)
-
-def preprocess_data(df):
-    # 列名を設定
-    df.columns = ['promise_status_1', 'promise_status_2', 'verification_timeline_1', 'verification_timeline_2',
-                  'evidence_status_1', 'evidence_status_2', 'evidence_quality_1', 'evidence_quality_2']
-    
-    # 空文字列を NaN に変換
-    df = df.replace('', np.nan)
-    
-    # 数値以外の値を NaN に変換
-    for col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # 小数点を含む値を NaN に変換
-    df = df.apply(lambda x: x.where(x.apply(lambda v: v.is_integer() if pd.notnull(v) else True), np.nan))
-    
-    return df
+import sys
+import os
 
-def calculate_cohen_kappa(data1, data2):
-    # 両方のデータが有効な整数である行のみを抽出
-    valid_mask = data1.notna() & data2.notna()
-    valid_data1 = data1[valid_mask].astype(int)
-    valid_data2 = data2[valid_mask].astype(int)
-    
-    if len(valid_data1) == 0:
-        print(f"警告: 有効なデータがありません。")
-        return np.nan
-    
-    return cohen_kappa_score(valid_data1, valid_data2)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# メイン処理
-file_path = "./data/Cohen_Japanese/Cohen_2.xlsx"
-sheet_name = "Oshima"
-usecols = "E,F,H,I,K,L,N,O"
+import argparse
+import json
+from src.agreement import file_agreement
 
-# データ読み込みと前処理
-df = read_excel_data(file_path, sheet_name, usecols)
-df = preprocess_data(df)
+# 2人の評価者のCohenのカッパ係数を全ラベルまとめて計算する（src/agreement.py を使用）
+# 複数のシートを一度に計算する場合は scripts/run_agreement.py を使う
 
-# ラベルとそれに対応する列名を定義
-labels = {
-    "promise_status": ('promise_status_1', 'promise_status_2'),
-    "verification_timeline": ('verification_timeline_1', 'verification_timeline_2'),
-    "evidence_status": ('evidence_status_1', 'evidence_status_2'),
-    "evidence_quality": ('evidence_quality_1', 'evidence_quality_2')
+# ラベルとそれに対応する列（Excelの列名）
+LABELS = {
+    "promise_status": ["E", "F"],
+    "verification_timeline": ["H", "I"],
+    "evidence_status": ["K", "L"],
+    "evidence_quality": ["N", "O"],
 }
 
-results = {}
-
-for label, (col1, col2) in labels.items():
-    kappa = calculate_cohen_kappa(df[col1], df[col2])
-    results[label] = kappa
-
-# 結果をJSONファイルに出力
-output_file = "./data/Cohen_Japanese/Cohen_2_O.json"
-with open(output_file, "w") as f:
-    json.dump(results, f, indent=4)
-
-print(f"Cohenのカッパ係数の計算が完了し、結果が{output_file}に保存されました。")
-print("計算されたCohenのカッパ係数:")
-for label, kappa in results.items():
-    print(f"{label}: {kappa}")
-
-# データの検証
-print("\nデータサンプル:")
-print(df.head())
-
-print("\n各列のデータ型:")
-print(df.dtypes)
-
-print("\n各列の一意な値:")
-for col in df.columns:
-    unique_values = sorted(df[col].dropna().unique())
-    print(f"{col}: {unique_values}")
-    print(f"  空値の数: {df[col].isna().sum()}")
-
-print("\n各ラベルの有効なデータ数:")
-for label, (col1, col2) in labels.items():
-    valid_count = (df[col1].notna() & df[col2].notna()).sum()
-    total_count = len(df)
-    print(f"{label}: {valid_count}/{total_count} ({valid_count/total_count:.2%})")
+def main():
+    parser = argparse.ArgumentParser(description="Cohenのカッパ係数")
+    parser.add_argument('--file', default="./data/Cohen_Japanese/Cohen_2.xlsx")
+    parser.add_argument('--sheet', default="Oshima")
+    parser.add_argument('--output', default="./data/Cohen_Japanese/Cohen_2_O.json")
+    parser.add_argument('--bootstrap', type=int, default=0, help="ブートストラップ信頼区間のリサンプル数（0なら計算しない）")
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    report = file_agreement(args.file, LABELS, raters=["1", "2"], sheets=[args.sheet], metrics=('cohen',),
+                            n_resamples=args.bootstrap, workers=args.workers)[args.sheet]
+    pairs = {label: results['cohen']["1/2"] for label, results in report.items()}
+
+    # 結果をJSONファイルに出力
+    results = {label: pair['value'] for label, pair in pairs.items()}
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+
+    print(f"Cohenのカッパ係数の計算が完了し、結果が{args.output}に保存されました。")
+    print("計算されたCohenのカッパ係数:")
+    for label, pair in pairs.items():
+        interval = f" {args.bootstrap}回のブートストラップ95%信頼区間: {pair['ci']}" if 'ci' in pair else ""
+        print(f"{label}: {pair['value']}{interval}")
+
+    # 両方の評価者が有効な値を付けた項目の数
+    print("\n各ラベルの有効なデータ数:")
+    for label, pair in pairs.items():
+        print(f"{label}: {pair['n_items']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.evaluator import load_aligned_data, check_parity
+
+# Compare the scores of evaluator.py with the "rouge" package and sklearn on a prediction file.
+# Usage: python scripts/check_evaluator_parity.py [test_data_path] [generated_data_path]
+
+if __name__ == "__main__":
+    true_data, pred_data = load_aligned_data(sys.argv[1], sys.argv[2])
+    differences = check_parity(true_data, pred_data)
+    for name, difference in differences.items():
+        print(f"{name}: {difference:.3e}")
+    print(f"Maximum difference: {max(differences.values(), default=0.0):.3e}")
@@ -0,0 +1,38 @@
+import sys
+import json
+
+# Compare two benchmark result files written by run_benchmarks.py.
+# Usage: python scripts/compare_benchmarks.py data/benchmarks/<base>.json data/benchmarks/<new>.json
+
+def flatten(results: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+def compare(base_path: str, new_path: str) -> None:
+    """
+    Print each metric of both runs and the ratio new / base
+
+    Args:
+        base_path (str): Result file of the base commit
+        new_path (str): Result file of the new commit
+    """
+    with open(base_path, 'r') as f:
+        base = json.load(f)
+    with open(new_path, 'r') as f:
+        new = json.load(f)
+
+    print(f"base: {base['commit'][:12]}  new: {new['commit'][:12]}")
+    base_metrics = flatten(base['results'])
+    new_metrics = flatten(new['results'])
+    for name in sorted(set(base_metrics) & set(new_metrics)):
+        ratio = new_metrics[name] / base_metrics[name] if base_metrics[name] else float('nan')
+        print(f"{name:60s} {base_metrics[name]:14.4f} {new_metrics[name]:14.4f} {ratio:8.2f}x")
+
+if __name__ == "__main__":
+    compare(sys.argv[1], sys.argv[2])
@@ -0,0 +1,60 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.run_analysis import load_config, build_rag_model
+from src.data_loader import iter_records
+from src.vector_index import create_index, compare_indexes
+import json
+
+# Index settings compared against the exact index when "index_comparison" is not given in config.yml.
+DEFAULT_SETTINGS = [
+    {'index_type': 'ivf', 'index_params': {'n_probe': n_probe}} for n_probe in (1, 2, 4, 8, 16)
+] + [
+    {'index_type': 'hnsw', 'index_params': {'ef_search': ef_search}} for ef_search in (16, 32, 64, 128)
+] + [
+    {'index_type': 'exact', 'index_params': {'precision': precision}} for precision in ('float16', 'int8')
+] + [
+    {'index_type': 'exact', 'index_params': {'precision': 'int8', 'dims': dims, 'reduction': reduction}}
+    for reduction in ('pca', 'matryoshka') for dims in (256, 512)
+]
+
+def compare_index_settings(config_path: str, top_k: int = 6) -> list:
+    """
+    Report the recall@k (top-k overlap), the per-query latency and the memory of approximate or compact index settings against the exact float32 index,
+    using the saved search data as documents and the saved test data as queries.
+
+    Args:
+        config_path (str): The path to the configuration file
+        top_k (int): Number of documents per query
+
+    Returns:
+        list: One report per index setting
+    """
+    config = load_config(config_path)
+    search_data = list(iter_records(config['search_data_path']))
+    test_data = list(iter_records(config['test_data_path']))
+
+    # The reference is the exact float32 index over the embeddings of the search data, whatever the configured index is.
+    rag_model = build_rag_model(dict(config, index_type='exact', index_params=None, reranker=None, candidate_source='embedding'))
+    rag_model.prepare_documents(search_data)
+    document_embeddings = rag_model.document_embeddings()
+    query_embeddings = rag_model.embedder.encode([item['data'] for item in test_data], batch_size=config.get('query_batch_size', 32))
+
+    reports = []
+    for setting in config.get('index_comparison', DEFAULT_SETTINGS):
+        index = create_index(setting['index_type'], **setting.get('index_params', {}))
+        try:
+            index.build(document_embeddings)
+        except ImportError as e:
+            print(f"Skipped {setting}: {e}")
+            continue
+        report = dict(setting, **compare_indexes(rag_model.index, index, query_embeddings, top_k))
+        print(json.dumps(report))
+        reports.append(report)
+    return reports
+
+if __name__ == "__main__":
+    config_path = sys.argv[1] if len(sys.argv) > 1 else 'config/config.yml'
+    compare_index_settings(config_path)
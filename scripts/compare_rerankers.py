@@ -0,0 +1,142 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.run_analysis import load_config, run_predict, checkpoint_path_of, build_rag_model, build_reranker
+from src.checkpoint import paragraph_id
+from src.data_loader import iter_records
+from src.evaluator import CATEGORICAL_ELEMENTS, evaluate_results
+from src.instrumentation import metrics
+from src.reranker import check_candidate_source
+import json
+import time
+
+# Compares the retrieval settings of "reranker_comparison" in config.yml (the embedding search only, BM25, hybrid and cross-encoder reranking if omitted):
+# each setting annotates the test data with its own output files, and the extra retrieval latency per paragraph is reported next to the change of the F1 scores.
+# The embedding model, the index and the first-stage candidates of the test data are prepared once and shared by all settings,
+# which may only change the keys of SETTING_KEYS.
+# The reports are saved to "reranker_comparison.json" next to average_results_path.
+# Every setting sends its own LLM requests (only identical prompts are answered by the response cache).
+# Usage: python scripts/compare_rerankers.py [config_path]
+
+DEFAULT_SETTINGS = [
+    {'name': 'embedding'},
+    {'name': 'bm25', 'reranker': 'bm25'},
+    {'name': 'hybrid', 'reranker': 'hybrid'},
+    {'name': 'cross_encoder', 'reranker': 'cross_encoder'},
+]
+
+# Configuration keys a setting can change.
+SETTING_KEYS = ('reranker', 'reranker_params', 'reranker_cache_path', 'candidate_pool', 'candidate_source', 'top_k')
+
+def with_suffix(path: str, suffix: str) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}.{suffix}{extension}"
+
+def compare_rerankers(config_path: str) -> list:
+    """
+    Annotate and evaluate the test data with each retrieval setting
+
+    Args:
+        config_path (str): The path to the configuration file
+
+    Returns:
+        list: One report per setting (mean F1, F1 of each label, retrieval latency per paragraph and prompt tokens),
+            with the differences to the first setting
+    """
+    from src.response_cache import ResponseCache
+
+    base_config = load_config(config_path)
+    configs = []
+    for setting in base_config.get('reranker_comparison', DEFAULT_SETTINGS):
+        unsupported = [key for key in setting if key != 'name' and key not in SETTING_KEYS]
+        if unsupported:
+            raise ValueError(f"Setting {setting['name']} changes {unsupported}, but the settings share one model (only {list(SETTING_KEYS)} can change).")
+        config = dict(base_config, reranker=None)
+        config.update({key: value for key, value in setting.items() if key != 'name'})
+        check_candidate_source(config['reranker'], config.get('candidate_source', 'embedding'))
+        config['checkpoint_path'] = with_suffix(checkpoint_path_of(base_config), setting['name'])
+        config['generated_data_path'] = with_suffix(base_config['generated_data_path'], setting['name'])
+        configs.append((setting['name'], config))
+
+    response_cache = None
+    if base_config.get('response_cache_path'):
+        response_cache = ResponseCache(
+            base_config['response_cache_path'],
+            ttl=base_config.get('response_cache_ttl'),
+            max_entries=base_config.get('response_cache_size', 100000)
+        )
+    rag_model = build_rag_model(dict(base_config, reranker=None), response_cache)
+    rag_model.prepare_documents(list(iter_records(base_config['search_data_path'])), index_path=base_config.get('index_path'))
+    test_data = list(iter_records(base_config['test_data_path']))
+    queries = [item['data'] for item in test_data]
+    if any(config['reranker'] in ('bm25', 'hybrid') or config.get('candidate_source') == 'bm25' for _, config in configs):
+        # Built ahead, so that its one-off cost is not counted in the latency of the first setting using it.
+        rag_model.bm25
+
+    # The first-stage candidates of each source are retrieved once, as deep as the largest pool of the settings using it.
+    def pool_of(config: dict) -> int:
+        top_k = config.get('top_k', 6)
+        return min(max(top_k, config.get('candidate_pool', 50)) if config['reranker'] else top_k, len(rag_model.documents))
+
+    first_stage = {}
+    for source in {config.get('candidate_source', 'embedding') for _, config in configs}:
+        rag_model.candidate_source = source
+        start = time.perf_counter()
+        candidates = rag_model.first_stage_candidates(queries, max(pool_of(config) for _, config in configs
+                                                                   if config.get('candidate_source', 'embedding') == source),
+                                                      batch_size=base_config.get('query_batch_size', 32))
+        first_stage[source] = (candidates, time.perf_counter() - start)
+
+    reports = []
+    for name, config in configs:
+        candidates, first_stage_s = first_stage[config.get('candidate_source', 'embedding')]
+        candidates = candidates[:, :pool_of(config)]
+        metrics.reset()
+        rag_model.prompt_builder.reset()
+        rag_model.reranker = build_reranker(config)
+        if rag_model.reranker is not None:
+            candidates = rag_model.rerank_candidates(queries, candidates, config.get('top_k', 6))
+            rag_model.reranker.close()
+        contexts = {paragraph_id(item): [rag_model.search_data[i] for i in row] for item, row in zip(test_data, candidates)}
+        stages = metrics.report()['stages']
+        rerank_s = stages['rerank']['total_s'] if 'rerank' in stages else 0.0
+
+        if not run_predict(config, rag_model=rag_model, contexts=contexts):
+            print(f"Skipped {name}: some paragraphs failed.")
+            continue
+        scores = evaluate_results(config['test_data_path'], config['checkpoint_path'])
+        # A label without any scored pair (e.g. only N/A labels) counts as 0.0.
+        f1_by_label = {element: scores.get(element, {}).get('f', 0.0) for element in CATEGORICAL_ELEMENTS}
+        usage = [totals for totals in metrics.usage.values() if totals['requests']]
+        n_queries = len(queries) or 1
+        report = {
+            'name': name,
+            'top_k': config.get('top_k', 6),
+            'f1': sum(f1_by_label.values()) / len(CATEGORICAL_ELEMENTS),
+            'f1_by_label': f1_by_label,
+            'retrieval_ms_per_paragraph': (first_stage_s + rerank_s) * 1000 / n_queries,
+            'rerank_ms_per_paragraph': rerank_s * 1000 / n_queries,
+            'mean_prompt_tokens': sum(totals['prompt_tokens'] for totals in usage) / sum(totals['requests'] for totals in usage) if usage else None,
+        }
+        if reports:
+            report['f1_gain'] = report['f1'] - reports[0]['f1']
+            report['extra_ms_per_paragraph'] = report['retrieval_ms_per_paragraph'] - reports[0]['retrieval_ms_per_paragraph']
+        print(json.dumps(report))
+        reports.append(report)
+    if response_cache is not None:
+        response_cache.close()
+    return reports
+
+if __name__ == "__main__":
+    config_path = sys.argv[1] if len(sys.argv) > 1 else 'config/config.yml'
+    reports = compare_rerankers(config_path)
+    output_path = os.path.join(os.path.dirname(load_config(config_path)['average_results_path']), 'reranker_comparison.json')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(reports, f, indent=2)
+    print(f"{'setting':<16}{'top_k':>6}{'F1':>8}{'gain':>8}{'ms/paragraph':>14}{'extra ms':>10}")
+    for report in reports:
+        print(f"{report['name']:<16}{report['top_k']:>6}{report['f1']:>8.3f}{report.get('f1_gain', 0.0):>+8.3f}"
+              f"{report['retrieval_ms_per_paragraph']:>14.2f}{report.get('extra_ms_per_paragraph', 0.0):>+10.2f}")
+    print(f"The comparison is saved to {output_path}.")
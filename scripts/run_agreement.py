@@ -0,0 +1,69 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+from src.agreement import METRICS, file_agreement
+
+# Inter-annotator agreement (Cohen's kappa of every rater pair, Fleiss' kappa, Krippendorff's alpha) of all labels and sheets of an annotation file.
+# Usage: python scripts/run_agreement.py data/Cohen_Japanese/Cohen_2.xlsx --label promise_status=E,F --label evidence_status=K,L --bootstrap 1000
+
+def parse_labels(specs: list) -> dict:
+    """
+    Parse the label arguments
+
+    Args:
+        specs (list): Arguments of the form NAME=COLUMN,COLUMN,...
+
+    Returns:
+        dict: Rater columns of each label
+    """
+    labels = {}
+    for spec in specs:
+        name, _, columns = spec.partition('=')
+        if not columns:
+            raise ValueError(f"Invalid label: {spec} (expected NAME=COLUMN,COLUMN,...)")
+        labels[name] = [column.strip() for column in columns.split(',')]
+    return labels
+
+def main():
+    parser = argparse.ArgumentParser(description="Inter-annotator agreement with bootstrap confidence intervals")
+    parser.add_argument('file', help="Excel, CSV or JSONL file with one row per item")
+    parser.add_argument('--label', action='append', required=True,
+                        help="Rater columns of a label as NAME=COLUMN,COLUMN,... (headers or Excel letters), repeated for each label")
+    parser.add_argument('--sheets', nargs='+', help="Sheets of an Excel file (all sheets if omitted)")
+    parser.add_argument('--raters', nargs='+', help="Name of each rater, in the order of the columns")
+    parser.add_argument('--metrics', nargs='+', default=list(METRICS), choices=METRICS)
+    parser.add_argument('--bootstrap', type=int, default=1000, help="Number of bootstrap resamples (0 disables the intervals)")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Number of processes for the resamples")
+    parser.add_argument('--output', help="Save the report as JSON")
+    args = parser.parse_args()
+
+    reports = file_agreement(args.file, parse_labels(args.label), raters=args.raters, sheets=args.sheets,
+                             metrics=tuple(args.metrics), n_resamples=args.bootstrap, confidence=args.confidence,
+                             seed=args.seed, workers=args.workers)
+    for sheet, report in reports.items():
+        print(f"[{sheet}]")
+        for label, results in report.items():
+            for metric in ('fleiss', 'krippendorff'):
+                if metric in results:
+                    print(f"  {label} {metric}: {format_result(results[metric])}")
+            for pair, result in results.get('cohen', {}).items():
+                print(f"  {label} cohen {pair}: {format_result(result)}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=4, ensure_ascii=False)
+        print(f"Saved the agreement report to {args.output}")
+
+def format_result(result: dict) -> str:
+    text = 'n/a' if result['value'] is None else f"{result['value']:.3f}"
+    if 'ci' in result and None not in result['ci']:
+        text += f" [{result['ci'][0]:.3f}, {result['ci'][1]:.3f}]"
+    return text + f" (n={result['n_items']})"
+
+if __name__ == "__main__":
+    main()
@@ -3,55 +3,444 @@ import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.data_loader import save_json_data, load_json_data
-from src.data_preprocessor import split_data
-from src.rag_model import RAGModel
-from src.evaluator import evaluate_results, save_average_results_to_file
+from src.data_loader import iter_records, save_records
+from src.instrumentation import metrics
+from typing import Dict, List, Optional
 import yaml
 import json
 
-def run_analysis(config_path: str) -> None:
+# Each stage imports only the modules it needs, so that e.g. "split" and "evaluate" do not load torch or the OpenAI SDK.
+
+def load_config(config_path: str) -> dict:
     """
-    Execute the analysis.
+    Load the configuration file.
 
     Args:
         config_path (str): The path to the configuration file
+
+    Returns:
+        dict: The configuration
     """
-    # Load the configuration file
     with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
-    
-    # Load the pre-prepared JSON data
-    json_data = load_json_data(config['sample_raw_data_path'])
+        return yaml.safe_load(f)
+
+def checkpoint_path_of(config: dict) -> str:
+    """
+    Get the path of the JSONL checkpoint of the predictions.
+
+    Args:
+        config (dict): The configuration
+
+    Returns:
+        str: The checkpoint path
+    """
+    generated_data_path = config['generated_data_path']
+    default_path = generated_data_path if generated_data_path.endswith('.jsonl') else os.path.splitext(generated_data_path)[0] + '.jsonl'
+    return config.get('checkpoint_path', default_path)
+
+def build_rag_model(config: dict, response_cache=None, embedder=None):
+    """
+    Create the RAG model from the configuration (the embedder is loaded on first use).
+
+    Args:
+        config (dict): The configuration
+        response_cache (Optional[ResponseCache]): Cache of the LLM responses
+        embedder: Embedder shared with other models (a new one is loaded if None)
+
+    Returns:
+        RAGModel: The RAG model
+    """
+    from src.rag_model import RAGModel
+    from src.reranker import check_candidate_source
+
+    check_candidate_source(config.get('reranker'), config.get('candidate_source', 'embedding'))
+    return RAGModel(
+        api_key=config['openai_api_key'],
+        model_name=config['model_name'],
+        embedding_cache_dir=config.get('embedding_cache_dir'),
+        embedding_cache_size=config.get('embedding_cache_size', 200000),
+        base_url=config.get('openai_base_url'),
+        response_cache=response_cache,
+        index_type=config.get('index_type', 'exact'),
+        index_params=config.get('index_params'),
+        max_prompt_tokens=config.get('max_prompt_tokens'),
+        compact_examples=config.get('compact_examples', True),
+        encode_batch_size=config.get('encode_batch_size', 32),
+        encode_workers=config.get('encode_workers', 1),
+        max_repairs=config.get('max_repairs', 1),
+        document_store_dir=config.get('document_store_path'),
+        embedder=embedder,
+        reranker=build_reranker(config),
+        candidate_pool=config.get('candidate_pool', 50),
+        candidate_source=config.get('candidate_source', 'embedding')
+    )
+
+def build_reranker(config: dict):
+    """
+    Create the reranker from the configuration (the cross-encoder model is loaded on first use).
+
+    Args:
+        config (dict): The configuration
+
+    Returns:
+        Optional[Reranker]: The reranker, or None if "reranker" is not set
+    """
+    if not config.get('reranker'):
+        return None
+    from src.reranker import create_reranker
+
+    params = dict(config.get('reranker_params') or {})
+    if config['reranker'] == 'cross_encoder' and config.get('reranker_cache_path'):
+        params.setdefault('cache_path', config['reranker_cache_path'])
+    return create_reranker(config['reranker'], **params)
+
+def build_batch_annotator(config: dict, rag_model):
+    """
+    Create the batch annotator from the configuration.
+
+    Args:
+        config (dict): The configuration
+        rag_model (RAGModel): The RAG model
+
+    Returns:
+        BatchAnnotator: The batch annotator
+    """
+    from src.batch_api import BatchAnnotator, LocalFileBatchBackend, OpenAIBatchBackend
+
+    batch_dir = config.get('batch_dir', os.path.join(os.path.dirname(config['generated_data_path']), 'batch'))
+    if config.get('batch_backend', 'openai') == 'local':
+        backend = LocalFileBatchBackend(os.path.join(batch_dir, 'local'))
+    else:
+        backend = OpenAIBatchBackend(rag_model.client)
+    return BatchAnnotator(
+        rag_model,
+        backend,
+        batch_dir,
+        poll_interval=config.get('batch_poll_interval', 60),
+        timeout=config.get('batch_timeout')
+    )
+
+def run_split(config: dict) -> None:
+    """
+    Split the raw data into search and test sets and save them.
+
+    Args:
+        config (dict): The configuration
+    """
+    split_method = config.get('split_method', 'random')
+    compact = config.get('compact_json', False)
+    if split_method == 'hash':
+        run_hash_split(config)
+        return
+    if split_method != 'random':
+        raise ValueError(f"Unknown split_method: {split_method} (expected 'random' or 'hash')")
+
+    from src.data_preprocessor import split_data
+
+    # Load the pre-prepared data (JSON, JSONL or Parquet)
+    json_data = list(iter_records(config['sample_raw_data_path']))
 
     # Split the data into search and test sets
     search_data, test_data = split_data(json_data, test_size=config['test_size'])
 
     # Save the search and test data
-    save_json_data(search_data, config['search_data_path'])
-    save_json_data(test_data, config['test_data_path'])
+    save_records(search_data, config['search_data_path'], compact=compact)
+    save_records(test_data, config['test_data_path'], compact=compact)
     print("Search and test data is saved.")
 
-    # Prepare the RAG model with the search data
-    rag_model = RAGModel(api_key=config['openai_api_key'], model_name=config['model_name'])
-    rag_model.prepare_documents(search_data)
+def run_hash_split(config: dict) -> None:
+    """
+    Split the raw data by a hash of each record in one streaming pass (the raw data is never held in memory).
+    With split_folds, the test set is the fold split_fold of a k-fold split.
+
+    Args:
+        config (dict): The configuration
+    """
+    from src.data_loader import RecordWriter
+    from src.data_preprocessor import iter_hash_split, iter_hash_folds
+
+    records = iter_records(config['sample_raw_data_path'])
+    seed = config.get('split_seed', 42)
+    stratify = config.get('split_stratify')
+    key_field = config.get('split_key')
+    n_folds = config.get('split_folds')
+    if n_folds:
+        fold = config.get('split_fold', 0)
+        if not 0 <= fold < n_folds:
+            raise ValueError(f"split_fold must be between 0 and {n_folds - 1}, not {fold}.")
+        assignments = ((record_fold == fold, record) for record_fold, record in iter_hash_folds(records, n_folds, seed, stratify, key_field))
+    else:
+        assignments = iter_hash_split(records, config['test_size'], seed, stratify, key_field)
+
+    compact = config.get('compact_json', False)
+    with RecordWriter(config['search_data_path'], compact=compact) as search_writer, \
+            RecordWriter(config['test_data_path'], compact=compact) as test_writer:
+        for is_test, record in assignments:
+            (test_writer if is_test else search_writer).write(record)
+    if search_writer.count == 0 or test_writer.count == 0:
+        raise ValueError(f"The hash split left an empty search or test set ({search_writer.count} search, {test_writer.count} test records).")
+    print(f"Search and test data is saved ({search_writer.count} search and {test_writer.count} test records).")
+
+def run_embed(config: dict) -> None:
+    """
+    Encode the search data and build its index ahead of the prediction
+    (only useful with embedding_cache_dir and/or index_path, which the prediction reuses).
+
+    Args:
+        config (dict): The configuration
+    """
+    if not config.get('embedding_cache_dir') and not config.get('index_path'):
+        print("Neither embedding_cache_dir nor index_path is set, so the embeddings cannot be reused by the prediction.")
+    search_data = list(iter_records(config['search_data_path']))
+    rag_model = build_rag_model(config)
+    rag_model.prepare_documents(search_data, index_path=config.get('index_path'))
     print("Documents are prepared.")
 
-    # Analyze the test data
-    predictions = []
-    for item in test_data:
-        result = rag_model.analyze_paragraph(item['data'])
-        result_dict = json.loads(result)
-        predictions.append(result_dict)
-    print("Analysis is completed.")
+def run_predict(config: dict, resume: bool = False, rag_model=None, contexts: Optional[Dict[str, List[Dict]]] = None) -> bool:
+    """
+    Annotate the test data with the LLM, appending each prediction to the JSONL checkpoint.
+
+    Args:
+        config (dict): The configuration
+        resume (bool): Skip the paragraphs whose predictions are already saved
+        rag_model (Optional[RAGModel]): RAG model to use instead of building one from the configuration (with its own response cache)
+        contexts (Optional[Dict[str, List[Dict]]]): Pre-retrieved similar data of each test paragraph by paragraph_id
+            (retrieved here if None)
+
+    Returns:
+        bool: True if every paragraph has a prediction
+    """
+    from src.annotation_engine import AnnotationEngine
+    from src.checkpoint import PredictionCheckpoint, paragraph_id
+    from src.evaluator import load_aligned_data
+    from src.response_cache import ResponseCache
+
+    search_data = list(iter_records(config['search_data_path']))
+    test_data = list(iter_records(config['test_data_path']))
+    generated_data_path = config['generated_data_path']
+
+    # Each prediction is appended to a JSONL checkpoint as soon as it is completed
+    with PredictionCheckpoint(checkpoint_path_of(config), resume=resume) as checkpoint:
+        pending_data = [item for item in test_data if not checkpoint.is_done(item)]
+        print(f"{len(test_data) - len(pending_data)} paragraphs are already analyzed, {len(pending_data)} paragraphs remain.")
+
+        if pending_data:
+            # Identical LLM requests of earlier runs are answered from the local cache
+            response_cache = None
+            if rag_model is None and config.get('response_cache_path'):
+                response_cache = ResponseCache(
+                    config['response_cache_path'],
+                    ttl=config.get('response_cache_ttl'),
+                    max_entries=config.get('response_cache_size', 100000)
+                )
+
+            if rag_model is None:
+                rag_model = build_rag_model(config, response_cache)
+            queries = [item['data'] for item in pending_data]
+            if contexts is not None:
+                contexts = [contexts[paragraph_id(item)] for item in pending_data]
+            elif config.get('retrieval_service_url'):
+                # Retrieve the similar data from a running retrieval service (the embedder is not loaded here)
+                from src.retrieval_service import RetrievalClient
+
+                contexts = RetrievalClient(config['retrieval_service_url']).retrieve(config['retrieval_language'], queries, top_k=config.get('top_k', 6))
+            else:
+                # Prepare the RAG model with the search data
+                rag_model.prepare_documents(search_data, index_path=config.get('index_path'))
+                print("Documents are prepared.")
+
+                # Retrieve the similar data for the whole test set at once
+                contexts = rag_model.get_relevant_contexts(queries, top_k=config.get('top_k', 6), batch_size=config.get('query_batch_size', 32))
+                if rag_model.reranker is not None:
+                    rag_model.reranker.close()
+            print("Similar data is retrieved.")
+
+            if config.get('batch_mode'):
+                # Analyze the test data with one batch of requests (results are merged in the order of the test data)
+                engine = build_batch_annotator(config, rag_model)
+            else:
+                # Analyze the test data (requests are sent concurrently and saved as they are completed)
+                engine = AnnotationEngine(
+                    rag_model,
+                    max_concurrency=config.get('max_concurrency', 8),
+                    requests_per_minute=config.get('requests_per_minute'),
+                    tokens_per_minute=config.get('tokens_per_minute'),
+                    max_retries=config.get('max_retries', 5)
+                )
+            failures = []
+
+            def on_result(i: int, result: str) -> None:
+                checkpoint.write(pending_data[i], json.loads(result))
+
+            def on_error(i: int, error: Exception) -> None:
+                failures.append(i)
+                print(f"Analysis failed for paragraph {paragraph_id(pending_data[i])}: {error!r}")
+
+            engine.annotate(queries, contexts, on_result=on_result, on_error=on_error)
+            print(f"Prompt tokens: {rag_model.prompt_builder.summary()}")
+            repairs = {name: metrics.counters.get(name, 0) for name in ('output_fixed_locally', 'output_reasks', 'output_repaired_by_reask', 'output_invalid')}
+            print(f"Output repairs: {repairs}")
+            if response_cache is not None:
+                print(f"Response cache: {response_cache.stats()}")
+                response_cache.close()
+            if failures:
+                print(f"{len(failures)} paragraphs failed. Run again with --resume to retry them.")
+                return False
+        print("Analysis is completed.")
 
-    # Save the prediction results
-    save_json_data(predictions, config['generated_data_path'])
-    print("Predictions are saved.")
+    # Save the prediction results in the order of the test data
+    if checkpoint.file_path != generated_data_path:
+        _, predictions = load_aligned_data(config['test_data_path'], checkpoint.file_path)
+        save_records(predictions, generated_data_path, compact=config.get('compact_json', False))
+        print("Predictions are saved.")
+    return True
 
-    # Evaluate the prediction results
-    evaluate_scores = evaluate_results(config['test_data_path'], config['generated_data_path'])
+def run_evaluate(config: dict, allow_partial: bool = False) -> None:
+    """
+    Evaluate the predictions (directly from the JSONL checkpoint if it exists) and save the scores.
+
+    Args:
+        config (dict): The configuration
+        allow_partial (bool): Evaluate an incomplete checkpoint on the paragraphs it covers (an error otherwise)
+    """
+    from src.evaluator import evaluate_results, save_average_results_to_file
+
+    pred_data_path = checkpoint_path_of(config)
+    if not os.path.exists(pred_data_path):
+        pred_data_path = config['generated_data_path']
+    with metrics.timer('evaluation'):
+        evaluate_scores = evaluate_results(config['test_data_path'], pred_data_path, allow_partial=allow_partial)
     print("Evaluation is completed.")
     
     save_average_results_to_file(evaluate_scores, config['average_results_path'])
     print(f"F1 Scores and ROUGE Scores:{evaluate_scores}")
+
+def run_evaluate_retrieval(config: dict, embedder=None) -> dict:
+    """
+    Evaluate the retrieval alone (label agreement of the examples, recall against the exact search and latency)
+    for the configured index and the settings of retrieval_eval_settings, without any LLM request.
+
+    Args:
+        config (dict): The configuration
+        embedder: Embedder to use instead of loading the embedding model (e.g. a stub)
+
+    Returns:
+        dict: The evaluation (see retrieval_eval.evaluate_retrieval)
+    """
+    from src.retrieval_eval import evaluate_retrieval
+
+    search_data = list(iter_records(config['search_data_path']))
+    test_data = list(iter_records(config['test_data_path']))
+    rag_model = build_rag_model(config, embedder=embedder)
+    rag_model.prepare_documents(search_data, index_path=config.get('index_path'))
+    batch_size = config.get('query_batch_size', 32)
+    query_embeddings = rag_model.embedder.encode([item['data'] for item in test_data], batch_size=batch_size)
+
+    # By default the configured index is compared with the exact search at float16 and int8 precision.
+    settings = config.get('retrieval_eval_settings')
+    if settings is None:
+        settings = [{'index_type': 'exact', 'index_params': {'precision': precision}} for precision in ('float16', 'int8')]
+        configured = {'index_type': rag_model.index_type, 'index_params': rag_model.index_params}
+        if configured != {'index_type': 'exact', 'index_params': {}} and configured not in settings:
+            settings.insert(0, configured)
+    evaluation = evaluate_retrieval(rag_model.search_data, test_data, rag_model.document_embeddings(), query_embeddings, settings,
+                                    ks=config.get('retrieval_eval_k', [1, 3, 6, 10]),
+                                    encode_query=lambda text: rag_model.embedder.encode([text], batch_size=batch_size))
+
+    output_path = config.get('retrieval_eval_path', os.path.join(os.path.dirname(config['average_results_path']), 'retrieval_results.json'))
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(evaluation, f, indent=2, ensure_ascii=False)
+    if not evaluation['settings']:
+        print(f"Nothing to evaluate: {evaluation['n_documents']} documents, {evaluation['n_queries']} queries "
+              f"and cut-offs {evaluation['ks']} (retrieval_eval_k: {config.get('retrieval_eval_k', [1, 3, 6, 10])}).")
+    else:
+        k = max(evaluation['ks'])
+        for report in evaluation['settings']:
+            agreement = ', '.join(f"{label} {scores[f'agreement@{k}']:.3f}" for label, scores in report.get('labels', {}).items())
+            print(f"{report['index_type']} {report.get('index_params', {})}: recall@{k} {report[f'recall@{k}']:.3f}, "
+                  f"p50 {report['approximate_p50_ms']:.2f} ms, p99 {report['approximate_p99_ms']:.2f} ms, agreement@{k}: {agreement}")
+    print(f"Retrieval evaluation is saved to {output_path}.")
+    return evaluation
+
+def run_serve(config_paths: Dict[str, str], host: str = '127.0.0.1', port: int = 8100,
+              max_batch_size: int = 64, max_wait: float = 0.005, embedder=None):
+    """
+    Serve the retrieval and annotation of several language datasets from one process with one embedding model.
+
+    Args:
+        config_paths (Dict[str, str]): The path to the configuration file of each language
+        host (str): Host to bind
+        port (int): Port to bind
+        max_batch_size (int): Maximum number of queries encoded together
+        max_wait (float): Maximum time in seconds a query waits for others to join its batch
+        embedder: Embedder to use instead of loading the embedding model (e.g. a stub)
+
+    Returns:
+        RetrievalService: The started service
+    """
+    from src.annotation_engine import AnnotationEngine
+    from src.rag_model import EMBEDDING_MODEL_NAME
+    from src.retrieval_service import BatchingEmbedder, RetrievalService
+
+    if embedder is None:
+        from sentence_transformers import SentenceTransformer
+
+        with metrics.timer('model_load'):
+            embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        embedder_name = EMBEDDING_MODEL_NAME
+    else:
+        embedder_name = getattr(embedder, 'embedder_name', type(embedder).__name__)
+    shared_embedder = BatchingEmbedder(embedder, embedder_name, max_batch_size=max_batch_size, max_wait=max_wait)
+
+    models = {}
+    engines = {}
+    for language, config_path in config_paths.items():
+        config = load_config(config_path)
+        models[language] = build_rag_model(config, embedder=shared_embedder)
+        models[language].prepare_documents(list(iter_records(config['search_data_path'])), index_path=config.get('index_path'))
+        engines[language] = AnnotationEngine(
+            models[language],
+            max_concurrency=config.get('max_concurrency', 8),
+            requests_per_minute=config.get('requests_per_minute'),
+            tokens_per_minute=config.get('tokens_per_minute'),
+            max_retries=config.get('max_retries', 5)
+        )
+        print(f"Documents of {language} are prepared.")
+
+    service = RetrievalService(models, engines, host=host, port=port)
+    print(f"Serving {list(models)} at {service.start()}")
+    return service
+
+def run_analysis(config_path: str, resume: bool = False) -> None:
+    """
+    Execute the analysis.
+
+    Args:
+        config_path (str): The path to the configuration file
+        resume (bool): Continue an interrupted run, skipping the paragraphs whose predictions are already saved
+    """
+    config = load_config(config_path)
+    
+    if resume and os.path.exists(config['search_data_path']) and os.path.exists(config['test_data_path']):
+        # Reuse the split of the interrupted run
+        print("Search and test data of the interrupted run is reused.")
+    else:
+        run_split(config)
+
+    completed = run_predict(config, resume=resume)
+    if completed:
+        run_evaluate(config)
+    save_metrics(config)
+
+def save_metrics(config: dict) -> None:
+    """
+    Write the timing and token usage report of the run.
+
+    Args:
+        config (dict): The configuration
+    """
+    metrics_path = config.get('metrics_path', os.path.join(os.path.dirname(config['average_results_path']), 'metrics.json'))
+    report = metrics.save(metrics_path, config.get('metrics_prometheus_path'), config.get('model_prices'))
+    for stage, stats in report['stages'].items():
+        print(f"{stage}: count={stats['count']} total={stats['total_s']:.3f}s p50={stats['p50_s']:.3f}s p95={stats['p95_s']:.3f}s")
+    print(f"Metrics are saved to {metrics_path}.")
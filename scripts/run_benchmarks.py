@@ -0,0 +1,195 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.rag_model import RAGModel
+from src.annotation_engine import AnnotationEngine
+from src.openai_stub import StubOpenAIServer
+from src.evaluator import calculate_f1_scores, calculate_rouge_scores
+from src.data_preprocessor import split_data
+from typing import Dict, List
+import numpy as np
+import argparse
+import hashlib
+import platform
+import subprocess
+import json
+import time
+
+# Offline benchmarks of retrieval, annotation and evaluation on synthetic PromiseEval-shaped corpora.
+# The embedder and the chat endpoint are stubs, so the numbers measure this repository's code, not the models.
+# Usage: python scripts/run_benchmarks.py --sizes 1000 10000 100000 --output data/benchmarks/<name>.json
+
+LABELS = {
+    'promise_status': (['Yes', 'No'], [0.7, 0.3]),
+    'verification_timeline': (['already', 'within_2_years', 'between_2_and_5_years', 'more_than_5_years', 'N/A'], [0.4, 0.1, 0.15, 0.05, 0.3]),
+    'evidence_status': (['Yes', 'No', 'N/A'], [0.55, 0.15, 0.3]),
+    'evidence_quality': (['Clear', 'Not Clear', 'Misleading', 'N/A'], [0.45, 0.2, 0.02, 0.33]),
+}
+VOCABULARY = ['当社', 'は', '2030年', 'まで', 'に', 'CO2', '排出量', 'を', '50%', '削減', 'します', '。', '再生可能エネルギー', 'の',
+              '導入', '拡大', 'ダイバーシティ', '推進', '人権', '尊重', 'サプライチェーン', '全体', 'で', '取り組み', '目標', '達成',
+              'emissions', 'target', 'net', 'zero', 'by', '2050', 'we', 'will', 'reduce', 'water', 'usage']
+
+class StubEmbedder:
+    def __init__(self, dim: int = 256):
+        """
+        Deterministic bag-of-words embedder (hashes each token to a dimension), standing in for SentenceTransformer
+
+        Args:
+            dim (int): Embedding dimension
+        """
+        self.dim = dim
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.split(' '):
+                embeddings[i, int(hashlib.md5(token.encode('utf-8')).hexdigest()[:8], 16) % self.dim] += 1.0
+        return embeddings
+
+def generate_corpus(size: int, seed: int = 42) -> List[Dict]:
+    """
+    Generate synthetic records with the PromiseEval structure and label distribution
+
+    Args:
+        size (int): Number of records
+        seed (int): Random seed
+
+    Returns:
+        List[Dict]: Records
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(20, 120, size)
+    words = rng.choice(VOCABULARY, int(lengths.sum()))
+    labels = {name: rng.choice(values, size, p=p) for name, (values, p) in LABELS.items()}
+    records = []
+    offset = 0
+    for i in range(size):
+        tokens = list(words[offset:offset + lengths[i]])
+        offset += lengths[i]
+        record = {'data': ' '.join(tokens) + f' #{i}'}
+        for name in LABELS:
+            record[name] = str(labels[name][i])
+        record['promise_string'] = ' '.join(tokens[:lengths[i] // 2]) if record['promise_status'] == 'Yes' else None
+        record['evidence_string'] = ' '.join(tokens[lengths[i] // 2:]) if record['evidence_status'] == 'Yes' else None
+        records.append(record)
+    return records
+
+def perturb_predictions(records: List[Dict], error_rate: float = 0.2, seed: int = 0) -> List[Dict]:
+    # Predictions with a fraction of wrong labels and truncated strings, so that the evaluator has real work to do.
+    rng = np.random.default_rng(seed)
+    predictions = []
+    for record in records:
+        prediction = dict(record)
+        for name, (values, _) in LABELS.items():
+            if rng.random() < error_rate:
+                prediction[name] = str(rng.choice(values))
+        for name in ('promise_string', 'evidence_string'):
+            if prediction[name] and rng.random() < error_rate:
+                prediction[name] = prediction[name][:len(prediction[name]) // 2]
+        predictions.append(prediction)
+    return predictions
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    values = np.array(seconds) * 1000
+    return {'mean_ms': float(values.mean()), 'p50_ms': float(np.percentile(values, 50)), 'p95_ms': float(np.percentile(values, 95))}
+
+def benchmark_size(size: int, dim: int, n_queries: int, n_annotations: int, stub_url: str, workers: int = 1) -> Dict:
+    """
+    Run all benchmarks on a corpus of the given size
+
+    Args:
+        size (int): Number of records of the corpus
+        dim (int): Embedding dimension of the stub embedder
+        n_queries (int): Number of single-query retrievals timed
+        n_annotations (int): Number of paragraphs annotated end to end
+        stub_url (str): Base URL of the stub chat endpoint
+        workers (int): Number of processes encoding the search data
+
+    Returns:
+        Dict: Results of each benchmark
+    """
+    results = {}
+    corpus = generate_corpus(size)
+
+    start = time.perf_counter()
+    search_data, test_data = split_data(corpus, test_size=0.2)
+    results['split_s'] = time.perf_counter() - start
+
+    rag_model = RAGModel(api_key='benchmark', model_name='gpt-4o', base_url=stub_url, embedder=StubEmbedder(dim), encode_workers=workers)
+    start = time.perf_counter()
+    rag_model.prepare_documents(search_data)
+    elapsed = time.perf_counter() - start
+    results['prepare_documents'] = {'seconds': elapsed, 'documents_per_second': len(search_data) / elapsed}
+
+    queries = [item['data'] for item in test_data]
+    latencies = []
+    for query in queries[:n_queries]:
+        start = time.perf_counter()
+        rag_model.get_relevant_context(query)
+        latencies.append(time.perf_counter() - start)
+    results['get_relevant_context'] = percentiles(latencies)
+
+    start = time.perf_counter()
+    contexts = rag_model.get_relevant_contexts(queries)
+    elapsed = time.perf_counter() - start
+    results['get_relevant_contexts'] = {'seconds': elapsed, 'queries_per_second': len(queries) / elapsed}
+
+    predictions = perturb_predictions(test_data)
+    start = time.perf_counter()
+    calculate_f1_scores(test_data, predictions)
+    results['f1_s'] = time.perf_counter() - start
+    start = time.perf_counter()
+    calculate_rouge_scores(test_data, predictions)
+    results['rouge_s'] = time.perf_counter() - start
+
+    engine = AnnotationEngine(rag_model, max_concurrency=8)
+    count = min(n_annotations, len(test_data))
+    start = time.perf_counter()
+    engine.annotate(queries[:count], contexts[:count])
+    elapsed = time.perf_counter() - start
+    results['annotation'] = {'paragraphs': count, 'seconds': elapsed, 'paragraphs_per_second': count / elapsed}
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks of retrieval, annotation and evaluation")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200, help="Number of single-query retrievals timed")
+    parser.add_argument('--annotations', type=int, default=500, help="Number of paragraphs annotated end to end")
+    parser.add_argument('--latency', type=float, default=0.0, help="Artificial latency of the stub chat endpoint in seconds")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes encoding the search data")
+    parser.add_argument('--output', default=None, help="JSON file for the results (data/benchmarks/<commit>.json by default)")
+    args = parser.parse_args()
+
+    stub = StubOpenAIServer(latency=args.latency)
+    stub_url = stub.start()
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'settings': {'dim': args.dim, 'queries': args.queries, 'annotations': args.annotations, 'latency': args.latency, 'workers': args.workers},
+        'results': {},
+    }
+    try:
+        for size in args.sizes:
+            report['results'][str(size)] = benchmark_size(size, args.dim, args.queries, args.annotations, stub_url, args.workers)
+            print(f"{size}: {json.dumps(report['results'][str(size)])}")
+    finally:
+        stub.stop()
+
+    output = args.output or os.path.join('data', 'benchmarks', f"{commit[:12]}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results are saved to {output}.")
@@ -0,0 +1,373 @@
+import os
+import re
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Inter-annotator agreement of all labels and all rater pairs at once.
+# The ratings of a table are integer-coded once into an array of shape (labels, items, raters) (-1 = missing),
+# and every coefficient is computed from one-hot or per-item category counts with matrix products.
+# Bootstrap confidence intervals resample the items as multinomial item weights, so that a whole chunk of
+# resamples is one more matrix product; the chunks are spread over worker processes.
+
+METRICS = ('cohen', 'fleiss', 'krippendorff')
+
+def _normalize_value(value):
+    # Missing values become None; integral numbers (1.0, "1") become int so that Excel and CSV ratings share the same categories.
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        return int(number) if number.is_integer() else value
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return None
+        return int(value) if float(value).is_integer() else float(value)
+    return value
+
+def encode_ratings(columns: List[np.ndarray]) -> Tuple[np.ndarray, List]:
+    """
+    Integer-code the ratings of one label
+
+    Args:
+        columns (List[np.ndarray]): Ratings of each rater (same number of items)
+
+    Returns:
+        Tuple[np.ndarray, List]: Codes of shape (items, raters) with -1 for missing ratings, and the category of each code
+    """
+    import pandas as pd
+
+    values = np.stack([np.asarray(column, dtype=object) for column in columns], axis=1)
+    # Only the distinct raw values are normalized, the codes are remapped with one indexing operation.
+    raw_codes, uniques = pd.factorize(values.ravel(), use_na_sentinel=True)
+    normalized = [_normalize_value(value) for value in uniques]
+    categories = sorted({value for value in normalized if value is not None}, key=lambda value: (isinstance(value, str), str(value)))
+    index = {category: code for code, category in enumerate(categories)}
+    remap = np.array([index[value] if value is not None else -1 for value in normalized] + [-1], dtype=np.int64)
+    codes = remap[raw_codes].reshape(values.shape)
+    return codes, categories
+
+def one_hot(codes: np.ndarray, n_categories: int) -> np.ndarray:
+    """
+    One-hot encode integer codes (missing codes become all-zero rows)
+
+    Args:
+        codes (np.ndarray): Codes of any shape, -1 for missing
+        n_categories (int): Number of categories
+
+    Returns:
+        np.ndarray: float array of shape codes.shape + (n_categories,)
+    """
+    # Row n_categories of the (n_categories + 1) x n_categories identity is all zeros, which is where -1 points to.
+    return np.eye(n_categories + 1, n_categories)[codes]
+
+def category_counts(codes: np.ndarray, n_categories: int) -> np.ndarray:
+    """
+    Number of raters who chose each category for each item
+
+    Args:
+        codes (np.ndarray): Codes of shape (labels, items, raters)
+        n_categories (int): Number of categories
+
+    Returns:
+        np.ndarray: Counts of shape (labels, items, n_categories)
+    """
+    n_labels, n_items, _ = codes.shape
+    valid = codes >= 0
+    cells = (np.arange(n_labels * n_items).reshape(n_labels, n_items, 1) * n_categories + codes)[valid]
+    counts = np.bincount(cells, minlength=n_labels * n_items * n_categories)
+    return counts.reshape(n_labels, n_items, n_categories).astype(np.float64)
+
+def _weights(weights: Optional[np.ndarray], n_items: int) -> np.ndarray:
+    # Item weights of shape (resamples, items); no weights means one sample weighting every item once.
+    if weights is None:
+        return np.ones((1, n_items))
+    return np.atleast_2d(np.asarray(weights, dtype=np.float64))
+
+def cohen_kappa(codes: np.ndarray, n_categories: int, weights: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cohen's kappa of every pair of raters, on the items both of them rated (same as sklearn's cohen_kappa_score per pair)
+
+    Args:
+        codes (np.ndarray): Codes of shape (labels, items, raters)
+        n_categories (int): Number of categories
+        weights (Optional[np.ndarray]): Item weights of shape (resamples, items) (bootstrap), every item once if None
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Kappa and number of items of shape (resamples, labels, raters, raters) (NaN if undefined)
+    """
+    n_labels, n_items, n_raters = codes.shape
+    flat = one_hot(codes, n_categories).reshape(n_labels, n_items, n_raters * n_categories)
+    # Confusion matrices of all rater pairs: an item only counts for a pair if both one-hot rows are non-zero.
+    confusion = np.einsum('si,lix,liy->slxy', _weights(weights, n_items), flat, flat, optimize=True)
+    confusion = confusion.reshape(-1, n_labels, n_raters, n_categories, n_raters, n_categories)
+    totals = confusion.sum(axis=(3, 5))
+    observed = np.einsum('slakbk->slab', confusion)
+    rows = confusion.sum(axis=5)
+    columns = confusion.sum(axis=3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = np.einsum('slakb,slabk->slab', rows, columns) / totals ** 2
+        kappa = (observed / totals - expected) / (1 - expected)
+    kappa[~np.isfinite(kappa)] = np.nan
+    return kappa, totals
+
+def fleiss_kappa(counts: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Fleiss' kappa of each label (items with fewer than two ratings are left out, the number of raters may vary per item)
+
+    Args:
+        counts (np.ndarray): Category counts of shape (labels, items, categories)
+        weights (Optional[np.ndarray]): Item weights of shape (resamples, items) (bootstrap), every item once if None
+
+    Returns:
+        np.ndarray: Kappa of shape (resamples, labels) (NaN if undefined)
+    """
+    weights = _weights(weights, counts.shape[1])
+    raters = counts.sum(axis=2)
+    rated = raters >= 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        item_agreement = np.where(rated, (counts * (counts - 1)).sum(axis=2) / (raters * (raters - 1)), 0.0)
+        mean_agreement = np.einsum('bi,li->bl', weights, item_agreement) / np.einsum('bi,li->bl', weights, rated)
+        proportions = np.einsum('bi,lik->blk', weights, counts * rated[:, :, None])
+        proportions /= proportions.sum(axis=2, keepdims=True)
+        chance = (proportions ** 2).sum(axis=2)
+        kappa = (mean_agreement - chance) / (1 - chance)
+    kappa[~np.isfinite(kappa)] = np.nan
+    return kappa
+
+def krippendorff_alpha(counts: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Krippendorff's alpha (nominal) of each label, from the coincidences of the items with at least two ratings
+
+    Args:
+        counts (np.ndarray): Category counts of shape (labels, items, categories)
+        weights (Optional[np.ndarray]): Item weights of shape (resamples, items) (bootstrap), every item once if None
+
+    Returns:
+        np.ndarray: Alpha of shape (resamples, labels) (NaN if undefined)
+    """
+    weights = _weights(weights, counts.shape[1])
+    raters = counts.sum(axis=2)
+    pairable = np.where(raters[:, :, None] >= 2, counts, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Diagonal of the coincidence matrix and its marginals (the off-diagonal cells are not needed for nominal data).
+        matching = np.where(raters >= 2, (pairable * (pairable - 1)).sum(axis=2) / (raters - 1), 0.0)
+        observed = np.einsum('bi,li->bl', weights, matching)
+        marginals = np.einsum('bi,lik->blk', weights, pairable)
+        total = marginals.sum(axis=2)
+        alpha = 1 - (total - 1) * (total - observed) / (total ** 2 - (marginals ** 2).sum(axis=2))
+    alpha[~np.isfinite(alpha)] = np.nan
+    return alpha
+
+def compute_agreement(codes: np.ndarray, n_categories: int, metrics: Tuple[str, ...] = METRICS,
+                      weights: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Compute the requested coefficients
+
+    Args:
+        codes (np.ndarray): Codes of shape (labels, items, raters)
+        n_categories (int): Number of categories
+        metrics (Tuple[str, ...]): Names among METRICS
+        weights (Optional[np.ndarray]): Item weights of shape (resamples, items), every item once if None
+
+    Returns:
+        Dict[str, np.ndarray]: Coefficients of each metric (see cohen_kappa, fleiss_kappa and krippendorff_alpha)
+    """
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown agreement metrics: {sorted(unknown)} (expected {METRICS})")
+    results = {}
+    if 'cohen' in metrics:
+        results['cohen'], results['cohen_items'] = cohen_kappa(codes, n_categories, weights)
+    if 'fleiss' in metrics or 'krippendorff' in metrics:
+        counts = category_counts(codes, n_categories)
+        if 'fleiss' in metrics:
+            results['fleiss'] = fleiss_kappa(counts, weights)
+        if 'krippendorff' in metrics:
+            results['krippendorff'] = krippendorff_alpha(counts, weights)
+    return results
+
+def _bootstrap_chunk(codes: np.ndarray, n_categories: int, metrics: Tuple[str, ...], seed: np.random.SeedSequence, size: int) -> Dict[str, np.ndarray]:
+    n_items = codes.shape[1]
+    weights = np.random.default_rng(seed).multinomial(n_items, np.full(n_items, 1.0 / n_items), size=size)
+    results = compute_agreement(codes, n_categories, metrics, weights)
+    results.pop('cohen_items', None)
+    return results
+
+def bootstrap_agreement(codes: np.ndarray, n_categories: int, metrics: Tuple[str, ...] = METRICS, n_resamples: int = 1000,
+                        seed: int = 0, workers: int = 1, chunk_size: int = 100) -> Dict[str, np.ndarray]:
+    """
+    Coefficients of bootstrap resamples of the items
+
+    Args:
+        codes (np.ndarray): Codes of shape (labels, items, raters)
+        n_categories (int): Number of categories
+        metrics (Tuple[str, ...]): Names among METRICS
+        n_resamples (int): Number of resamples
+        seed (int): Random seed (the result does not depend on the number of workers)
+        workers (int): Number of processes
+        chunk_size (int): Number of resamples computed together
+
+    Returns:
+        Dict[str, np.ndarray]: Coefficients of each metric, with one row per resample
+    """
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_bootstrap_chunk, codes, n_categories, metrics, chunk_seed, size) for chunk_seed, size in zip(seeds, sizes)]
+            chunks = [future.result() for future in futures]
+    else:
+        chunks = [_bootstrap_chunk(codes, n_categories, metrics, chunk_seed, size) for chunk_seed, size in zip(seeds, sizes)]
+    return {metric: np.concatenate([chunk[metric] for chunk in chunks]) for metric in chunks[0]} if chunks else {}
+
+def _value(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+def agreement_report(codes: np.ndarray, labels: List[str], raters: List[str], n_categories: int, metrics: Tuple[str, ...] = METRICS,
+                     n_resamples: int = 0, confidence: float = 0.95, seed: int = 0, workers: int = 1) -> Dict[str, Dict]:
+    """
+    Agreement of every label, with percentile bootstrap confidence intervals
+
+    Args:
+        codes (np.ndarray): Codes of shape (labels, items, raters)
+        labels (List[str]): Name of each label
+        raters (List[str]): Name of each rater
+        n_categories (int): Number of categories
+        metrics (Tuple[str, ...]): Names among METRICS
+        n_resamples (int): Number of bootstrap resamples (no intervals if 0)
+        confidence (float): Confidence level of the intervals
+        seed (int): Random seed of the resamples
+        workers (int): Number of processes for the resamples
+
+    Returns:
+        Dict[str, Dict]: For each label, "cohen" (one entry per rater pair "A/B"), "fleiss" and "krippendorff",
+            each with the coefficient "value", the number of items and (with resamples) the interval "ci"
+    """
+    point = compute_agreement(codes, n_categories, metrics)
+    samples = bootstrap_agreement(codes, n_categories, metrics, n_resamples, seed, workers) if n_resamples > 0 else {}
+    bounds = {}
+    for metric, values in samples.items():
+        # Resamples where a coefficient is undefined (e.g. a single category) are left out of its interval.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            bounds[metric] = np.nanpercentile(values, [50 * (1 - confidence), 50 * (1 + confidence)], axis=0)
+
+    def entry(metric: str, index: Tuple, n_items: int) -> Dict:
+        result = {'value': _value(point[metric][(0,) + index]), 'n_items': n_items}
+        if metric in bounds:
+            result['ci'] = [_value(bounds[metric][(0,) + index]), _value(bounds[metric][(1,) + index])]
+        return result
+
+    rated = (codes >= 0).sum(axis=2) >= 2
+    report = {}
+    for l, label in enumerate(labels):
+        report[label] = {}
+        if 'cohen' in point:
+            report[label]['cohen'] = {
+                f"{raters[a]}/{raters[b]}": entry('cohen', (l, a, b), int(point['cohen_items'][0, l, a, b]))
+                for a in range(len(raters)) for b in range(a + 1, len(raters))
+            }
+        for metric in ('fleiss', 'krippendorff'):
+            if metric in point:
+                report[label][metric] = entry(metric, (l,), int(rated[l].sum()))
+    return report
+
+def column_index(spec: str, columns: List) -> int:
+    """
+    Position of a column given by its header or by its Excel letter (e.g. "AL")
+
+    Args:
+        spec (str): Header or letter
+        columns (List): Headers of the table
+
+    Returns:
+        int: Position of the column
+    """
+    if spec in columns:
+        return columns.index(spec)
+    if not re.fullmatch(r'[A-Z]{1,3}', spec):
+        raise KeyError(f"Unknown column: {spec}")
+    position = 0
+    for char in spec:
+        position = position * 26 + ord(char) - ord('A') + 1
+    if position > len(columns):
+        raise KeyError(f"Column {spec} is outside the table ({len(columns)} columns)")
+    return position - 1
+
+def read_tables(file_path: str, sheets: Optional[List[str]] = None) -> Dict:
+    """
+    Read the annotation tables of a file (one row per item)
+
+    Args:
+        file_path (str): Excel (".xlsx", ".xls"), CSV (".csv") or JSONL (".jsonl") file
+        sheets (Optional[List[str]]): Sheets to read from an Excel file (all sheets if None)
+
+    Returns:
+        Dict[str, pd.DataFrame]: Table of each sheet (the file name for CSV and JSONL)
+    """
+    import pandas as pd
+    from src.data_loader import iter_jsonl_data
+
+    extension = os.path.splitext(file_path)[1].lower()
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    if extension in ('.xlsx', '.xls'):
+        # The workbook is parsed once for all the requested sheets.
+        return pd.read_excel(file_path, sheet_name=list(sheets) if sheets else None)
+    if extension == '.csv':
+        return {name: pd.read_csv(file_path)}
+    if extension == '.jsonl':
+        return {name: pd.DataFrame(list(iter_jsonl_data(file_path)))}
+    raise ValueError(f"Unsupported annotation file: {file_path} (expected .xlsx, .xls, .csv or .jsonl)")
+
+def table_ratings(table, labels: Dict[str, List[str]]) -> Tuple[np.ndarray, int, List[List]]:
+    """
+    Integer-code the ratings of several labels of a table
+
+    Args:
+        table (pd.DataFrame): Annotation table (one row per item)
+        labels (Dict[str, List[str]]): Columns of the raters for each label (headers or Excel letters, same number of raters per label)
+
+    Returns:
+        Tuple[np.ndarray, int, List[List]]: Codes of shape (labels, items, raters), the number of categories and the categories of each label
+    """
+    n_raters = {len(columns) for columns in labels.values()}
+    if len(n_raters) != 1:
+        raise ValueError("Every label must have the same number of rater columns")
+    headers = [str(column) for column in table.columns]
+    values = table.to_numpy(dtype=object)
+    coded = [encode_ratings([values[:, column_index(spec, headers)] for spec in columns]) for columns in labels.values()]
+    n_categories = max([len(categories) for _, categories in coded] + [1])
+    codes = np.stack([label_codes for label_codes, _ in coded]) if coded else np.empty((0, len(table), 0), dtype=np.int64)
+    return codes, n_categories, [categories for _, categories in coded]
+
+def file_agreement(file_path: str, labels: Dict[str, List[str]], raters: Optional[List[str]] = None,
+                   sheets: Optional[List[str]] = None, **kwargs) -> Dict[str, Dict]:
+    """
+    Agreement of every sheet of an annotation file
+
+    Args:
+        file_path (str): Excel, CSV or JSONL file
+        labels (Dict[str, List[str]]): Columns of the raters for each label
+        raters (Optional[List[str]]): Name of each rater (numbered from 1 if None)
+        sheets (Optional[List[str]]): Sheets of an Excel file (all sheets if None)
+        **kwargs: Arguments of agreement_report (metrics, n_resamples, confidence, seed, workers)
+
+    Returns:
+        Dict[str, Dict]: Report of each sheet
+    """
+    reports = {}
+    for sheet, table in read_tables(file_path, sheets).items():
+        codes, n_categories, _ = table_ratings(table, labels)
+        sheet_raters = raters or [str(i + 1) for i in range(codes.shape[2])]
+        reports[sheet] = agreement_report(codes, list(labels), sheet_raters, n_categories, **kwargs)
+    return reports
@@ -0,0 +1,214 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+import openai
+from src.instrumentation import metrics
+from src.prompt_builder import count_tokens
+
+# Sends the annotation requests of the whole test set concurrently.
+# Requests and tokens per minute are limited by token buckets, and 429/5xx responses are retried with jittered backoff.
+
+def estimate_tokens(messages: List[Dict[str, str]], model_name: str = 'gpt-4o') -> int:
+    """
+    Estimate the number of input tokens of the messages with the local tokenizer
+
+    Args:
+        messages (List[Dict[str, str]]): Chat messages
+        model_name (str): Name of the LLM
+
+    Returns:
+        int: Estimated number of tokens
+    """
+    return sum(count_tokens(message['content'], model_name) for message in messages)
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """
+        Rate limiter refilling "per_minute" units evenly over a minute
+
+        Args:
+            per_minute (float): Number of units (requests or tokens) allowed per minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """
+        Block until "amount" units are available and take them
+
+        Args:
+            amount (float): Number of units to take (amounts larger than the capacity wait for a full bucket)
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount: float) -> None:
+        """
+        Take (or give back, if negative) units without waiting, e.g. to correct an estimate with the actual usage
+
+        Args:
+            amount (float): Number of units
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check whether an API error is worth retrying (rate limits, server errors, timeouts and connection errors)
+
+    Args:
+        error (Exception): Raised error
+
+    Returns:
+        bool: True if the request should be retried
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+class AnnotationEngine:
+    def __init__(self, rag_model, max_concurrency: int = 8, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Concurrent annotation of paragraphs with a shared RAG model
+
+        Args:
+            rag_model (RAGModel): Prepared RAG model (its client is shared by all workers)
+            max_concurrency (int): Maximum number of requests in flight
+            requests_per_minute (Optional[float]): Request rate limit (unlimited if None)
+            tokens_per_minute (Optional[float]): Token rate limit (unlimited if None)
+            max_retries (int): Maximum number of retries per request
+            base_delay (float): Base delay of the exponential backoff in seconds
+            max_delay (float): Upper bound of the backoff delay in seconds
+        """
+        self.rag_model = rag_model
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Retries are handled here, so the SDK's own retries are disabled (the connection pool is still shared).
+        self.client = rag_model.client.with_options(max_retries=0)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('retry-after'))
+            except (TypeError, ValueError):
+                pass
+        # Full jitter: a random delay up to the exponential bound, so that workers do not retry in lockstep.
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def complete(self, messages: List[Dict[str, str]]):
+        """
+        Send one request, respecting the rate limits and retrying transient errors
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+
+        Returns:
+            ChatCompletion: Raw API response
+        """
+        # Cached responses cost nothing, so they bypass the rate limits.
+        cached = self.rag_model.get_cached_completion(messages)
+        if cached is not None:
+            return cached
+
+        estimated_tokens = estimate_tokens(messages, self.rag_model.model_name)
+        attempt = 0
+        while True:
+            if self.request_bucket is not None:
+                self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(estimated_tokens)
+            try:
+                response = self.rag_model.request_completion(messages, client=self.client, check_cache=False)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    metrics.increment('llm_errors')
+                    raise
+                metrics.increment('llm_retries')
+                time.sleep(self._backoff(attempt, e))
+                attempt += 1
+                continue
+            usage = getattr(response, 'usage', None)
+            if self.token_bucket is not None and usage is not None:
+                self.token_bucket.adjust(usage.total_tokens - estimated_tokens)
+            return response
+
+    def analyze(self, paragraph: str, relevant_docs: Optional[List[Dict]] = None) -> str:
+        """
+        Annotate one paragraph
+
+        Args:
+            paragraph (str): Input paragraph text
+            relevant_docs (Optional[List[Dict]]): Pre-retrieved similar data
+
+        Returns:
+            str: Annotation results in JSON format
+        """
+        with metrics.timer('annotation'):
+            messages = self.rag_model.build_messages(paragraph, relevant_docs)
+            return self.rag_model.complete_with_repairs(messages, self.complete)
+
+    def annotate(self, paragraphs: List[str], contexts: Optional[List[List[Dict]]] = None,
+                 on_result: Optional[Callable[[int, str], None]] = None,
+                 on_error: Optional[Callable[[int, Exception], None]] = None) -> List[Optional[str]]:
+        """
+        Annotate the paragraphs concurrently
+
+        Args:
+            paragraphs (List[str]): Input paragraph texts
+            contexts (Optional[List[List[Dict]]]): Pre-retrieved similar data for each paragraph
+            on_result (Optional[Callable[[int, str], None]]): Called with the index and the result of each paragraph as soon as it is completed
+            on_error (Optional[Callable[[int, Exception], None]]): Called for paragraphs that failed (their result is None);
+                if not given, the first error is raised
+
+        Returns:
+            List[Optional[str]]: Annotation results in JSON format, in the order of the paragraphs
+        """
+        if contexts is None:
+            contexts = [None] * len(paragraphs)
+        results: List[Optional[str]] = [None] * len(paragraphs)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {executor.submit(self.analyze, paragraph, context): i for i, (paragraph, context) in enumerate(zip(paragraphs, contexts))}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    if on_error is None:
+                        for pending in futures:
+                            pending.cancel()
+                        raise
+                    on_error(i, e)
+                    continue
+                if on_result is not None:
+                    on_result(i, results[i])
+        return results
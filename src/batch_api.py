@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+from src.instrumentation import metrics
+from src.output_parser import OutputParseError
+
+# Annotates a whole test set through a batch API: every prompt is written to a JSONL request file,
+# the file is submitted to a batch backend and polled, and the results are merged back in the order of the paragraphs.
+# Invalid answers are asked again in a follow-up batch (at most max_repairs rounds).
+
+# Statuses after which a batch does not change any more.
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+def write_batch_requests(requests: List[Tuple[str, List[Dict[str, str]]]], model_name: str, params: Dict, file_path: str) -> None:
+    """
+    Write chat completion requests in the batch input format (one JSON request per line)
+
+    Args:
+        requests (List[Tuple[str, List[Dict[str, str]]]]): Custom ID and messages of each request
+        model_name (str): Name of the LLM
+        params (Dict): Other parameters of the requests (e.g. temperature)
+        file_path (str): Path of the request file
+    """
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for custom_id, messages in requests:
+            line = {
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': dict(params, model=model_name, messages=messages),
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+def read_batch_results(file_path: str) -> Dict[str, Dict]:
+    """
+    Read a batch output file
+
+    Args:
+        file_path (str): Path of the output file
+
+    Returns:
+        Dict[str, Dict]: Output line of each custom ID ("response" with "status_code" and "body", or "error")
+    """
+    results = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[result['custom_id']] = result
+    return results
+
+class BatchBackend:
+    def submit(self, request_path: str) -> str:
+        """
+        Submit a request file
+
+        Args:
+            request_path (str): Path of the JSONL request file
+
+        Returns:
+            str: Batch ID
+        """
+        raise NotImplementedError
+
+    def status(self, batch_id: str) -> str:
+        """
+        Get the status of a batch
+
+        Args:
+            batch_id (str): Batch ID
+
+        Returns:
+            str: Status ("validating", "in_progress", "finalizing", "completed", "failed", "expired", "cancelled", ...)
+        """
+        raise NotImplementedError
+
+    def download(self, batch_id: str, output_path: str) -> None:
+        """
+        Save the output lines (results and errors) of a finished batch
+
+        Args:
+            batch_id (str): Batch ID
+            output_path (str): Path of the JSONL output file
+        """
+        raise NotImplementedError
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, client, completion_window: str = '24h'):
+        """
+        OpenAI Batch API
+
+        Args:
+            client (OpenAI): OpenAI client
+            completion_window (str): Time frame within which the batch should be processed
+        """
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, request_path: str) -> str:
+        with open(request_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint='/v1/chat/completions',
+                                           completion_window=self.completion_window)
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, output_path: str) -> None:
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    text = self.client.files.content(file_id).text
+                    f.write(text if not text or text.endswith('\n') else text + '\n')
+
+class LocalFileBatchBackend(BatchBackend):
+    def __init__(self, directory: str, responder: Optional[Callable[[List[Dict[str, str]]], str]] = None):
+        """
+        Offline batch backend: a submitted file is answered at once by the stub of the chat completions API
+
+        Args:
+            directory (str): Directory of the submitted and answered files
+            responder (Optional[Callable]): Function returning the message content for the request messages (see openai_stub.py)
+        """
+        self.directory = directory
+        self.responder = responder
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, request_path: str) -> str:
+        from src.openai_stub import chat_completion
+
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        shutil.copyfile(request_path, os.path.join(self.directory, f"{batch_id}.input.jsonl"))
+        with open(request_path, 'r', encoding='utf-8') as f, \
+                open(os.path.join(self.directory, f"{batch_id}.output.jsonl"), 'w', encoding='utf-8') as output:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                result = {
+                    'id': f"batch_req_{uuid.uuid4().hex}",
+                    'custom_id': request['custom_id'],
+                    'response': {'status_code': 200, 'body': chat_completion(request['body'], self.responder)},
+                    'error': None,
+                }
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return 'completed' if os.path.exists(os.path.join(self.directory, f"{batch_id}.output.jsonl")) else 'failed'
+
+    def download(self, batch_id: str, output_path: str) -> None:
+        shutil.copyfile(os.path.join(self.directory, f"{batch_id}.output.jsonl"), output_path)
+
+class BatchAnnotator:
+    def __init__(self, rag_model, backend: BatchBackend, work_dir: str, poll_interval: float = 60.0,
+                 max_requests_per_batch: int = 50000, timeout: Optional[float] = None):
+        """
+        Annotation through a batch API (same interface as AnnotationEngine)
+
+        Args:
+            rag_model (RAGModel): Prepared RAG model (builds the prompts, parses and caches the responses)
+            backend (BatchBackend): Batch backend
+            work_dir (str): Directory of the request/output files and of the IDs of the submitted batches
+            poll_interval (float): Seconds between two status checks
+            max_requests_per_batch (int): Maximum number of requests per request file (larger jobs are split)
+            timeout (Optional[float]): Seconds to wait for the batches before giving up (no limit if None)
+        """
+        self.rag_model = rag_model
+        self.backend = backend
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.max_requests_per_batch = max_requests_per_batch
+        self.timeout = timeout
+        os.makedirs(work_dir, exist_ok=True)
+        self.state_path = os.path.join(work_dir, 'batches.json')
+
+    def _load_state(self) -> Dict[str, str]:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_state(self, state: Dict[str, str]) -> None:
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+
+    def submit_batch(self, requests: List[Tuple[str, List[Dict[str, str]]]]) -> Tuple[str, str]:
+        """
+        Submit the requests as one batch, unless a batch with the same requests was already submitted by an interrupted run
+
+        Args:
+            requests (List[Tuple[str, List[Dict[str, str]]]]): Custom ID and messages of each request
+
+        Returns:
+            Tuple[str, str]: Digest of the request file and batch ID
+        """
+        request_path = os.path.join(self.work_dir, 'requests.jsonl')
+        write_batch_requests(requests, self.rag_model.model_name, self.rag_model.completion_params, request_path)
+        with open(request_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        request_path_of_digest = os.path.join(self.work_dir, f"requests-{digest[:16]}.jsonl")
+        os.replace(request_path, request_path_of_digest)
+
+        # The ID is recorded before waiting, so that an interrupted run polls the same batch instead of paying for it again.
+        state = self._load_state()
+        batch_id = state.get(digest)
+        if batch_id is None:
+            batch_id = self.backend.submit(request_path_of_digest)
+            state[digest] = batch_id
+            self._save_state(state)
+            metrics.increment('batches_submitted')
+            metrics.increment('batch_requests', len(requests))
+            print(f"Submitted batch {batch_id} with {len(requests)} requests.")
+        return digest, batch_id
+
+    def run_batches(self, chunks: List[List[Tuple[str, List[Dict[str, str]]]]]) -> Dict[str, Dict]:
+        """
+        Submit every chunk of requests as its own batch, wait for all of them together and collect the results
+
+        Args:
+            chunks (List[List[Tuple[str, List[Dict[str, str]]]]]): Custom ID and messages of each request, per batch
+
+        Returns:
+            Dict[str, Dict]: Output line of each custom ID (missing if its batch ended without it)
+        """
+        # All batches are submitted before waiting, so that the backend processes them concurrently.
+        batches = dict(self.submit_batch(requests) for requests in chunks)
+
+        start = time.monotonic()
+        with metrics.timer('batch_wait'):
+            statuses = {batch_id: self.backend.status(batch_id) for batch_id in batches.values()}
+            running = [batch_id for batch_id, status in statuses.items() if status not in TERMINAL_STATUSES]
+            while running:
+                if self.timeout is not None and time.monotonic() - start > self.timeout:
+                    raise TimeoutError(f"Batches {running} are still running (run again to resume waiting).")
+                time.sleep(self.poll_interval)
+                for batch_id in running:
+                    statuses[batch_id] = self.backend.status(batch_id)
+                running = [batch_id for batch_id in running if statuses[batch_id] not in TERMINAL_STATUSES]
+
+        unfinished = {digest: batch_id for digest, batch_id in batches.items() if statuses[batch_id] != 'completed'}
+        if unfinished:
+            # A batch that ended without completing is forgotten, so that the next run submits its requests again
+            # (the completed batches stay recorded and are only downloaded).
+            state = self._load_state()
+            for digest in unfinished:
+                state.pop(digest, None)
+            self._save_state(state)
+            raise RuntimeError("Batches ended without completing (run again to submit them again): "
+                               + ', '.join(f"{batch_id} ({statuses[batch_id]})" for batch_id in unfinished.values()))
+
+        outputs = {}
+        for batch_id in batches.values():
+            output_path = os.path.join(self.work_dir, f"{batch_id}.output.jsonl")
+            self.backend.download(batch_id, output_path)
+            outputs.update(read_batch_results(output_path))
+        return outputs
+
+    def annotate(self, paragraphs: List[str], contexts: Optional[List[List[Dict]]] = None,
+                 on_result: Optional[Callable[[int, str], None]] = None,
+                 on_error: Optional[Callable[[int, Exception], None]] = None) -> List[Optional[str]]:
+        """
+        Annotate the paragraphs with one batch per max_requests_per_batch requests, all waited for together
+        (plus one follow-up round of batches per repair round)
+
+        Args:
+            paragraphs (List[str]): Input paragraph texts
+            contexts (Optional[List[List[Dict]]]): Pre-retrieved similar data for each paragraph
+            on_result (Optional[Callable[[int, str], None]]): Called with the index and the result of each paragraph, in the order of the paragraphs
+            on_error (Optional[Callable[[int, Exception], None]]): Called for paragraphs that failed (their result is None);
+                if not given, the first error is raised
+
+        Returns:
+            List[Optional[str]]: Annotation results in JSON format, in the order of the paragraphs
+        """
+        from openai.types.chat import ChatCompletion
+
+        if contexts is None:
+            contexts = [None] * len(paragraphs)
+        results: List[Optional[str]] = [None] * len(paragraphs)
+        errors: Dict[int, Exception] = {}
+        pending = {i: self.rag_model.build_messages(paragraph, context) for i, (paragraph, context) in enumerate(zip(paragraphs, contexts))}
+
+        for attempt in range(self.rag_model.max_repairs + 1):
+            # Requests answered by the response cache are not sent again.
+            responses = {}
+            for i, messages in pending.items():
+                cached = self.rag_model.get_cached_completion(messages)
+                if cached is not None:
+                    responses[i] = cached
+            requests = [(str(i), messages) for i, messages in pending.items() if i not in responses]
+            outputs = self.run_batches([requests[start:start + self.max_requests_per_batch]
+                                        for start in range(0, len(requests), self.max_requests_per_batch)]) if requests else {}
+            for custom_id, messages in requests:
+                output = outputs.get(custom_id)
+                if output is None:
+                    errors[int(custom_id)] = RuntimeError("The batch ended without a result for this request")
+                elif output.get('error') or output['response']['status_code'] != 200:
+                    errors[int(custom_id)] = RuntimeError(f"Batch request failed: {output.get('error') or output['response']}")
+                else:
+                    response = ChatCompletion.model_validate(output['response']['body'])
+                    self.rag_model.store_completion(messages, response)
+                    responses[int(custom_id)] = response
+
+            repairs = {}
+            for i, response in responses.items():
+                content = response.choices[0].message.content
+                try:
+                    results[i] = self.rag_model.parse_response(content)
+                    errors.pop(i, None)
+                    if attempt > 0:
+                        metrics.increment('output_repaired_by_reask')
+                except OutputParseError as e:
+                    errors[i] = e
+                    if attempt < self.rag_model.max_repairs:
+                        metrics.increment('output_reasks')
+                        repairs[i] = self.rag_model.repair_messages(pending[i], content, e)
+            pending = repairs
+            if not pending:
+                break
+
+        for i in range(len(paragraphs)):
+            if i in errors:
+                if on_error is None:
+                    raise errors[i]
+                on_error(i, errors[i])
+            elif on_result is not None:
+                on_result(i, results[i])
+        return results
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Set
+
+# Append-only JSONL checkpoint of the predictions.
+# Each line is one prediction with the "id" of its paragraph, written (and flushed) as soon as it is completed.
+
+def paragraph_id(item: Dict) -> str:
+    """
+    Compute a stable id of a paragraph from its text
+
+    Args:
+        item (Dict): Record with the paragraph text in "data"
+
+    Returns:
+        str: Hex id (identical paragraphs share the same id)
+    """
+    return hashlib.sha1(item['data'].encode('utf-8')).hexdigest()[:16]
+
+class PredictionCheckpoint:
+    def __init__(self, file_path: str, resume: bool = False):
+        """
+        Open the checkpoint file
+
+        Args:
+            file_path (str): Path of the JSONL file
+            resume (bool): Keep the predictions already in the file (otherwise the file is started over)
+        """
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.completed: Set[str] = set()
+        if resume and os.path.exists(file_path):
+            self.completed = self._read_completed_ids()
+        else:
+            open(file_path, 'w', encoding='utf-8').close()
+        self.file = open(file_path, 'a', encoding='utf-8')
+
+    def _read_completed_ids(self) -> Set[str]:
+        completed = set()
+        valid_size = 0
+        with open(self.file_path, 'rb') as f:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)['id'])
+                except (ValueError, KeyError):
+                    # A line cut off by a crash is the last one; it is dropped and the paragraph is analyzed again.
+                    break
+                valid_size += len(line)
+        with open(self.file_path, 'r+b') as f:
+            f.truncate(valid_size)
+            if valid_size:
+                f.seek(valid_size - 1)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        return completed
+
+    def is_done(self, item: Dict) -> bool:
+        return paragraph_id(item) in self.completed
+
+    def write(self, item: Dict, prediction: Dict) -> None:
+        """
+        Append the prediction of a paragraph
+
+        Args:
+            item (Dict): Test record of the paragraph
+            prediction (Dict): Prediction of the LLM
+        """
+        pid = paragraph_id(item)
+        line = json.dumps(dict(prediction, id=pid), ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.completed.add(pid)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
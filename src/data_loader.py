@@ -1,16 +1,37 @@
 import json
-from typing import List, Dict
+import os
+import queue
+import threading
+from typing import Dict, Iterable, Iterator, List
 
-def save_json_data(data: List[Dict], file_path: str) -> None:
+# Records can be stored as a JSON array (".json"), one record per line (".jsonl") or a columnar Parquet file (".parquet", requires pyarrow).
+# The iter_* functions yield the records lazily, so a file never has to be held in memory as a whole,
+# and a RecordWriter saves records pushed one at a time (e.g. to split one stream into several files).
+
+def save_json_data(data: Iterable[Dict], file_path: str, compact: bool = False) -> None:
     """
     Save data as a JSON file
 
     Args:
-        data (List[Dict]): Data to be saved
+        data (Iterable[Dict]): Data to be saved (written record by record, so a generator can be passed)
         file_path (str): File path for saving the data
+        compact (bool): Write without indentation and spaces (smaller and faster than the default pretty-printed output)
     """
     with open(file_path, 'w', encoding='utf-8-sig') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        separator = '['
+        for record in data:
+            if compact:
+                f.write(separator + json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                separator = ','
+            else:
+                # Same layout as json.dump(data, indent=2)
+                text = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+                f.write(separator + '\n  ' + text)
+                separator = ','
+        if separator == '[':
+            f.write('[]')
+        else:
+            f.write(']' if compact else '\n]')
 
 def load_json_data(file_path: str) -> List[Dict]:
     """
@@ -23,4 +44,237 @@ def load_json_data(file_path: str) -> List[Dict]:
         List[Dict]: Loaded data
     """
     with open(file_path, 'r', encoding='utf-8-sig') as f:
-        return json.load(f)
\ No newline at end of file
+        return json.load(f)
+
+def iter_json_data(file_path: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """
+    Yield the elements of a JSON array file one by one, reading the file in chunks
+
+    Args:
+        file_path (str): File path of the JSON array
+        chunk_size (int): Number of characters read at a time
+
+    Returns:
+        Iterator[Dict]: Elements of the array
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        buffer = ''
+        position = 0
+        eof = False
+        # "start": before "[", "first": after "[", "next": after an element, "element": after ","
+        state = 'start'
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position == len(buffer):
+                if eof:
+                    raise ValueError(f"Unexpected end of the JSON array: {file_path}")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+
+            char = buffer[position]
+            if state == 'start':
+                if char != '[':
+                    raise ValueError(f"The file is not a JSON array: {file_path}")
+                position += 1
+                state = 'first'
+            elif char == ']' and state in ('first', 'next'):
+                return
+            elif state == 'next':
+                if char != ',':
+                    raise ValueError(f"Expected ',' or ']' at character {position} of the buffer: {file_path}")
+                position += 1
+                state = 'element'
+            else:
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                    # A number cut by the end of the buffer (e.g. "12." or "1e") decodes as a shorter number,
+                    # so an element is complete only if a separator follows it.
+                    complete = eof or (end < len(buffer) and buffer[end] in ',] \t\r\n')
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    complete = False
+                if not complete:
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer, position = buffer[position:] + chunk, 0
+                    continue
+                yield element
+                position = end
+                state = 'next'
+                if position > chunk_size:
+                    buffer, position = buffer[position:], 0
+
+def save_jsonl_data(data: Iterable[Dict], file_path: str) -> None:
+    """
+    Save data as a JSONL file (one record per line)
+
+    Args:
+        data (Iterable[Dict]): Data to be saved
+        file_path (str): File path for saving the data
+    """
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for record in data:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def iter_jsonl_data(file_path: str) -> Iterator[Dict]:
+    """
+    Yield the records of a JSONL file one by one (blank lines are skipped)
+
+    Args:
+        file_path (str): File path of the JSONL file
+
+    Returns:
+        Iterator[Dict]: Records
+    """
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet files require pyarrow (pip install pyarrow).") from e
+    return pyarrow
+
+def save_parquet_data(data: Iterable[Dict], file_path: str, batch_size: int = 10000) -> None:
+    """
+    Save data as a Parquet file, writing one row group per batch
+
+    Args:
+        data (Iterable[Dict]): Data to be saved (all records should have the same keys)
+        file_path (str): File path for saving the data
+        batch_size (int): Number of records per row group
+    """
+    pa = _pyarrow()
+    writer = None
+    schema = None
+
+    def write_batch(batch: List[Dict]) -> None:
+        nonlocal writer, schema
+        if writer is None:
+            # Columns that are null in the whole first batch (e.g. "evidence_string") are typed as strings.
+            schema = pa.Table.from_pylist(batch).schema
+            schema = pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field for field in schema])
+            writer = pa.parquet.ParquetWriter(file_path, schema)
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+    batch = []
+    for record in data:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            write_batch(batch)
+            batch = []
+    if batch or writer is None:
+        write_batch(batch)
+    writer.close()
+
+def iter_parquet_data(file_path: str, batch_size: int = 10000) -> Iterator[Dict]:
+    """
+    Yield the records of a Parquet file one by one, reading one batch of rows at a time
+
+    Args:
+        file_path (str): File path of the Parquet file
+        batch_size (int): Number of rows read at a time
+
+    Returns:
+        Iterator[Dict]: Records
+    """
+    pa = _pyarrow()
+    parquet_file = pa.parquet.ParquetFile(file_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+def iter_records(file_path: str) -> Iterator[Dict]:
+    """
+    Yield the records of a JSON, JSONL or Parquet file (chosen by the extension) one by one
+
+    Args:
+        file_path (str): File path of the data
+
+    Returns:
+        Iterator[Dict]: Records
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.jsonl':
+        return iter_jsonl_data(file_path)
+    if extension == '.parquet':
+        return iter_parquet_data(file_path)
+    return iter_json_data(file_path)
+
+def save_records(data: Iterable[Dict], file_path: str, compact: bool = False) -> None:
+    """
+    Save records as a JSON, JSONL or Parquet file (chosen by the extension)
+
+    Args:
+        data (Iterable[Dict]): Data to be saved
+        file_path (str): File path for saving the data
+        compact (bool): Write JSON without indentation (ignored for the other formats)
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.jsonl':
+        save_jsonl_data(data, file_path)
+    elif extension == '.parquet':
+        save_parquet_data(data, file_path)
+    else:
+        save_json_data(data, file_path, compact=compact)
+
+class RecordWriter:
+    _END = object()
+
+    def __init__(self, file_path: str, compact: bool = False, buffer_size: int = 1000):
+        """
+        Write records to a JSON, JSONL or Parquet file one at a time (save_records runs on a background thread),
+        so that several files can be filled from one pass over a stream
+
+        Args:
+            file_path (str): File path for saving the data
+            compact (bool): Write JSON without indentation (ignored for the other formats)
+            buffer_size (int): Maximum number of records waiting to be written
+        """
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.error = None
+        self.count = 0
+        self.thread = threading.Thread(target=self._save, args=(file_path, compact), daemon=True)
+        self.thread.start()
+
+    def _records(self) -> Iterator[Dict]:
+        while True:
+            record = self.queue.get()
+            if record is self._END:
+                return
+            yield record
+
+    def _save(self, file_path: str, compact: bool) -> None:
+        try:
+            save_records(self._records(), file_path, compact=compact)
+        except Exception as e:
+            self.error = e
+            # Keep consuming, so that write() never blocks on a full queue.
+            for _ in self._records():
+                pass
+
+    def write(self, record: Dict) -> None:
+        if self.error is not None:
+            raise self.error
+        self.queue.put(record)
+        self.count += 1
+
+    def close(self) -> None:
+        self.queue.put(self._END)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> 'RecordWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
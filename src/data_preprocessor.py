@@ -1,6 +1,11 @@
-import pandas as pd
-from typing import List, Dict, Tuple
-from sklearn.model_selection import train_test_split
+import hashlib
+import math
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+import numpy as np
+from src.checkpoint import paragraph_id
+
+# "split_data" shuffles the whole data in memory, like sklearn's train_test_split.
+# The hash splits assign each record on its own while the data is streamed, optionally keeping the label proportions of every stratum.
 
 def split_data(data: List[Dict], test_size: float = 0.2, random_state: int = 42) -> Tuple[List[Dict], List[Dict]]:
     """
@@ -14,5 +19,100 @@ def split_data(data: List[Dict], test_size: float = 0.2, random_state: int = 42)
     Returns:
         Tuple[List[Dict], List[Dict]]: Search data and test data
     """
-    search_data, test_data = train_test_split(data, test_size=test_size, random_state=random_state)
-    return search_data, test_data
\ No newline at end of file
+    # Same split as sklearn's train_test_split(data, test_size=test_size, random_state=random_state),
+    # without importing scikit-learn (which takes about a second).
+    n_test = math.ceil(test_size * len(data)) if isinstance(test_size, float) else test_size
+    if not 0 < n_test < len(data):
+        raise ValueError(f"test_size={test_size} leaves an empty search or test set for {len(data)} records.")
+    permutation = np.random.RandomState(random_state).permutation(len(data))
+    search_data = [data[i] for i in permutation[n_test:]]
+    test_data = [data[i] for i in permutation[:n_test]]
+    return search_data, test_data
+
+def hash_fraction(key: str, seed: int = 42) -> float:
+    """
+    Stable pseudo-random number of a key (the same on every run, platform and Python version)
+
+    Args:
+        key (str): Key of a record
+        seed (int): Seed mixed into the hash
+
+    Returns:
+        float: Number in [0, 1)
+    """
+    digest = hashlib.blake2b(f"{seed}:{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+def _record_key(record: Dict, key_field: Optional[str]) -> str:
+    return str(record[key_field]) if key_field else paragraph_id(record)
+
+def _stratum(record: Dict, stratify: Optional[List[str]]) -> Tuple:
+    return tuple(record.get(field) for field in stratify) if stratify else ()
+
+def iter_hash_split(records: Iterable[Dict], test_size: float = 0.2, seed: int = 42, stratify: Optional[List[str]] = None,
+                    key_field: Optional[str] = None) -> Iterator[Tuple[bool, Dict]]:
+    """
+    Assign records to the search or test set in one pass, by a stable hash of their key
+
+    Without stratification a record's set only depends on its key, so it stays the same when records are added or reordered.
+    With stratification, one counter per stratum keeps the number of test records of every stratum within one of
+    test_size times its size at any point of the stream, and the hash decides wherever both sets are allowed.
+
+    Args:
+        records (Iterable[Dict]): Records (read lazily, only the counters are kept in memory)
+        test_size (float): Proportion of test data
+        seed (int): Seed of the hash
+        stratify (Optional[List[str]]): Fields whose combination of values is kept balanced (e.g. ["promise_status", "evidence_quality"])
+        key_field (Optional[str]): Field identifying a record (the hash of "data" if None)
+
+    Returns:
+        Iterator[Tuple[bool, Dict]]: Whether each record belongs to the test set, and the record
+    """
+    if not 0 < test_size < 1:
+        raise ValueError(f"test_size must be a proportion between 0 and 1 for a hash split, not {test_size}.")
+    seen: Dict[Tuple, int] = {}
+    tested: Dict[Tuple, int] = {}
+    for record in records:
+        is_test = hash_fraction(_record_key(record, key_field), seed) < test_size
+        if stratify:
+            stratum = _stratum(record, stratify)
+            target = test_size * (seen.get(stratum, 0) + 1)
+            count = tested.get(stratum, 0)
+            if count + 1 - target >= 1:
+                is_test = False
+            elif target - count >= 1:
+                is_test = True
+            seen[stratum] = seen.get(stratum, 0) + 1
+            tested[stratum] = count + is_test
+        yield is_test, record
+
+def iter_hash_folds(records: Iterable[Dict], n_folds: int = 5, seed: int = 42, stratify: Optional[List[str]] = None,
+                    key_field: Optional[str] = None) -> Iterator[Tuple[int, Dict]]:
+    """
+    Assign records to k folds in one pass, by a stable hash of their key (fold i is the test set of the i-th cross-validated run)
+
+    With stratification, one counter per stratum and fold keeps the folds of every stratum within one record of each other.
+
+    Args:
+        records (Iterable[Dict]): Records (read lazily, only the counters are kept in memory)
+        n_folds (int): Number of folds
+        seed (int): Seed of the hash
+        stratify (Optional[List[str]]): Fields whose combination of values is kept balanced
+        key_field (Optional[str]): Field identifying a record (the hash of "data" if None)
+
+    Returns:
+        Iterator[Tuple[int, Dict]]: Fold of each record, and the record
+    """
+    if n_folds < 2:
+        raise ValueError(f"n_folds must be at least 2, not {n_folds}.")
+    counts: Dict[Tuple, List[int]] = {}
+    for record in records:
+        fold = int(hash_fraction(_record_key(record, key_field), seed) * n_folds)
+        if stratify:
+            fold_counts = counts.setdefault(_stratum(record, stratify), [0] * n_folds)
+            smallest = min(fold_counts)
+            if fold_counts[fold] > smallest:
+                # The next fold (cyclically) that has the fewest records of the stratum.
+                fold = next(f % n_folds for f in range(fold + 1, fold + n_folds) if fold_counts[f % n_folds] == smallest)
+            fold_counts[fold] += 1
+        yield fold, record
@@ -0,0 +1,222 @@
+import json
+import os
+from itertools import groupby
+from typing import Dict, List, Tuple
+import numpy as np
+from src.checkpoint import paragraph_id
+
+# On-disk store of the search data records and their embeddings, updated without re-encoding the unchanged documents.
+# Every update appends a segment (records as JSONL, embeddings as .npy) and removed rows are only marked as deleted,
+# until too many segments or deleted rows have accumulated and the live rows are compacted into one segment.
+# The manifest is replaced atomically, so an interrupted update leaves the previous state intact.
+
+class DocumentStore:
+    def __init__(self, directory: str, max_segments: int = 16, compact_ratio: float = 0.3):
+        """
+        Segmented document store
+
+        Args:
+            directory (str): Directory of the store (created if needed)
+            max_segments (int): Number of segments above which the store is compacted
+            compact_ratio (float): Fraction of deleted rows above which the store is compacted
+        """
+        self.directory = directory
+        self.max_segments = max_segments
+        self.compact_ratio = compact_ratio
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        os.makedirs(os.path.join(directory, 'segments'), exist_ok=True)
+        self.segments: List[str] = []
+        self.deleted: Dict[str, List[int]] = {}
+        self.next_segment = 0
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.segments = manifest['segments']
+            self.deleted = manifest['deleted']
+            self.next_segment = manifest['next_segment']
+        self._load_records()
+
+    def _segment_path(self, segment: str, extension: str) -> str:
+        return os.path.join(self.directory, 'segments', segment + extension)
+
+    def _load_records(self) -> None:
+        # Only the records and the locations of the live rows are held in memory, the embeddings are read on demand.
+        self.records: List[Dict] = []
+        self.locations: List[Tuple[str, int]] = []
+        self.total_rows = 0
+        for segment in self.segments:
+            deleted = set(self.deleted.get(segment, []))
+            with open(self._segment_path(segment, '.jsonl'), 'r', encoding='utf-8') as f:
+                for row, line in enumerate(f):
+                    self.total_rows += 1
+                    if row not in deleted:
+                        self.records.append(json.loads(line))
+                        self.locations.append((segment, row))
+        self.ids = [paragraph_id(record) for record in self.records]
+        self.positions = {doc_id: position for position, doc_id in enumerate(self.ids)}
+
+    def _save_manifest(self) -> None:
+        manifest = {'segments': self.segments, 'deleted': self.deleted, 'next_segment': self.next_segment}
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temporary_path, self.manifest_path)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.positions
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        Embeddings of the live rows, in the order of the records
+
+        Returns:
+            np.ndarray: float32 embeddings (n_documents x dim)
+        """
+        # The live rows are always grouped by segment, in the order of the segments.
+        parts = []
+        for segment, locations in groupby(self.locations, key=lambda location: location[0]):
+            rows = [row for _, row in locations]
+            parts.append(np.load(self._segment_path(segment, '.npy'), mmap_mode='r')[rows])
+        if not parts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.ascontiguousarray(np.concatenate(parts), dtype=np.float32)
+
+    @property
+    def dim(self) -> int:
+        """
+        Dimension of the stored embeddings (read from the header of a segment file)
+
+        Returns:
+            int: Embedding dimension (0 if the store is empty)
+        """
+        if not self.locations:
+            return 0
+        return np.load(self._segment_path(self.locations[0][0], '.npy'), mmap_mode='r').shape[1]
+
+    def get_embeddings(self, doc_ids: List[str]) -> np.ndarray:
+        """
+        Embeddings of stored documents
+
+        Args:
+            doc_ids (List[str]): IDs of live documents
+
+        Returns:
+            np.ndarray: float32 embeddings in the order of the IDs
+        """
+        segments = {}
+        vectors = []
+        for doc_id in doc_ids:
+            segment, row = self.locations[self.positions[doc_id]]
+            if segment not in segments:
+                segments[segment] = np.load(self._segment_path(segment, '.npy'), mmap_mode='r')
+            vectors.append(segments[segment][row])
+        return np.array(vectors, dtype=np.float32)
+
+    def _append_segment(self, records: List[Dict], doc_ids: List[str], embeddings: np.ndarray) -> None:
+        # Writes the segment files and updates the in-memory state; the segment is part of the store once the manifest is saved.
+        segment = f"{self.next_segment:06d}"
+        np.save(self._segment_path(segment, '.npy'), np.asarray(embeddings, dtype=np.float32))
+        with open(self._segment_path(segment, '.jsonl'), 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.segments.append(segment)
+        self.next_segment += 1
+
+        for row, (record, doc_id) in enumerate(zip(records, doc_ids)):
+            self.positions[doc_id] = len(self.records)
+            self.records.append(record)
+            self.ids.append(doc_id)
+            self.locations.append((segment, row))
+        self.total_rows += len(records)
+
+    def _mark_deleted(self, doc_ids: List[str]) -> List[int]:
+        # Updates the in-memory state only; the rows are deleted once the manifest is saved.
+        positions = sorted({self.positions[doc_id] for doc_id in doc_ids if doc_id in self.positions})
+        if not positions:
+            return []
+        for position in positions:
+            segment, row = self.locations[position]
+            self.deleted.setdefault(segment, []).append(row)
+
+        removed = set(positions)
+        self.records = [record for position, record in enumerate(self.records) if position not in removed]
+        self.ids = [doc_id for position, doc_id in enumerate(self.ids) if position not in removed]
+        self.locations = [location for position, location in enumerate(self.locations) if position not in removed]
+        self.positions = {doc_id: position for position, doc_id in enumerate(self.ids)}
+        return positions
+
+    def add(self, records: List[Dict], embeddings: np.ndarray) -> None:
+        """
+        Append documents as a new segment (their IDs must not be stored yet, see upsert)
+
+        Args:
+            records (List[Dict]): Records with a "data" field
+            embeddings (np.ndarray): Embeddings of the records
+        """
+        if not records:
+            return
+        doc_ids = [paragraph_id(record) for record in records]
+        if len(set(doc_ids)) != len(doc_ids) or any(doc_id in self.positions for doc_id in doc_ids):
+            raise ValueError("Documents can only be added once (use upsert to replace them).")
+        self._append_segment(records, doc_ids, embeddings)
+        self._save_manifest()
+
+    def remove(self, doc_ids: List[str]) -> List[int]:
+        """
+        Mark documents as deleted (unknown IDs are ignored)
+
+        Args:
+            doc_ids (List[str]): IDs of the documents
+
+        Returns:
+            List[int]: Positions the removed documents had, in ascending order
+        """
+        positions = self._mark_deleted(doc_ids)
+        if positions:
+            self._save_manifest()
+        return positions
+
+    def upsert(self, records: List[Dict], embeddings: np.ndarray) -> List[int]:
+        """
+        Replace the stored documents with the same IDs and add the others (in one manifest update)
+
+        Args:
+            records (List[Dict]): Records with a "data" field
+            embeddings (np.ndarray): Embeddings of the records
+
+        Returns:
+            List[int]: Positions the replaced documents had (the new versions are appended at the end)
+        """
+        if not records:
+            return []
+        doc_ids = [paragraph_id(record) for record in records]
+        if len(set(doc_ids)) != len(doc_ids):
+            raise ValueError("Documents can only be upserted once per call.")
+        positions = self._mark_deleted(doc_ids)
+        self._append_segment(records, doc_ids, embeddings)
+        self._save_manifest()
+        return positions
+
+    def needs_compaction(self) -> bool:
+        deleted_rows = self.total_rows - len(self.records)
+        return len(self.segments) > self.max_segments or (self.total_rows > 0 and deleted_rows / self.total_rows > self.compact_ratio)
+
+    def compact(self) -> None:
+        """
+        Rewrite the live rows into one segment and delete the old segments (the order of the documents is kept)
+        """
+        old_segments = self.segments
+        records, embeddings = self.records, self.embeddings
+        self.segments, self.deleted = [], {}
+        self.records, self.ids, self.locations, self.positions, self.total_rows = [], [], [], {}, 0
+        if records:
+            self.add(records, embeddings)
+        else:
+            self._save_manifest()
+        for segment in old_segments:
+            for extension in ('.jsonl', '.npy'):
+                os.remove(self._segment_path(segment, extension))
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import re
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+# Content-addressed store for document embeddings.
+# Vectors live in a memory-mapped float32 .npy file and "index.json" maps the hash of each text to its row.
+
+def text_key(model_name: str, text: str) -> str:
+    """
+    Compute the cache key of a text for the given embedding model
+
+    Args:
+        model_name (str): Name of the embedding model
+        text (str): Text to be encoded
+
+    Returns:
+        str: SHA-256 hex digest of the model name and the text
+    """
+    return hashlib.sha256(f"{model_name}\x00{text}".encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200000):
+        """
+        Open (or create) the embedding cache of a model
+
+        Args:
+            cache_dir (str): Root directory of the cache
+            model_name (str): Name of the embedding model (each model gets its own subdirectory)
+            max_entries (int): Maximum number of cached vectors, least recently used vectors are evicted first
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.directory = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', model_name))
+        self.index_path = os.path.join(self.directory, 'index.json')
+        self.vectors_path = os.path.join(self.directory, 'vectors.npy')
+        os.makedirs(self.directory, exist_ok=True)
+
+        # key -> [row, last_used]
+        self.entries: Dict[str, List[int]] = {}
+        self.free_rows: List[int] = []
+        self.next_row = 0
+        self.clock = 0
+        self.vectors: Optional[np.memmap] = None
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.entries = index['entries']
+            self.free_rows = index['free_rows']
+            self.next_row = index['next_row']
+            self.clock = index['clock']
+            self.vectors = np.load(self.vectors_path, mmap_mode='r+')
+            self._evict(len(self.entries) - self.max_entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Return the embeddings of the texts, encoding only the texts that are not cached yet
+
+        Args:
+            texts (List[str]): Texts to be encoded
+            encode_fn (Callable[[List[str]], np.ndarray]): Function encoding a list of texts (e.g. SentenceTransformer.encode)
+
+        Returns:
+            np.ndarray: Embeddings in the same order as the texts
+        """
+        if not texts:
+            return np.empty((0, 0 if self.vectors is None else self.vectors.shape[1]), dtype=np.float32)
+        self.clock += 1
+        keys = [text_key(self.model_name, text) for text in texts]
+
+        # Read the cached vectors first so that they cannot be evicted by the new ones.
+        cached = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in cached or key in missing:
+                continue
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[1] = self.clock
+                cached[key] = np.array(self.vectors[entry[0]])
+            else:
+                missing[key] = text
+        self.hits += len(cached)
+        self.misses += len(missing)
+
+        if missing:
+            new_vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            fresh = dict(zip(missing.keys(), new_vectors))
+            self._store(fresh)
+            cached.update(fresh)
+
+        self.flush()
+        return np.stack([cached[key] for key in keys])
+
+    def _store(self, vectors: Dict[str, np.ndarray]) -> None:
+        if self.max_entries <= 0:
+            return
+        dim = len(next(iter(vectors.values())))
+        if self.vectors is not None and self.vectors.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match the cache ({self.vectors.shape[1]}): {self.directory}")
+
+        items = list(vectors.items())[:self.max_entries]
+        self._evict(len(self.entries) + len(items) - self.max_entries)
+        for key, vector in items:
+            row = self._allocate_row(dim)
+            self.vectors[row] = vector
+            self.entries[key] = [row, self.clock]
+        self.vectors.flush()
+
+    def _evict(self, count: int) -> None:
+        # Drop the least recently used entries and recycle their rows.
+        if count <= 0:
+            return
+        for key, _ in sorted(self.entries.items(), key=lambda kv: kv[1][1])[:count]:
+            self.free_rows.append(self.entries.pop(key)[0])
+        # The index is written before a freed row is overwritten, so that after a crash no key maps to another text's vector.
+        self.flush()
+
+    def _allocate_row(self, dim: int) -> int:
+        if self.free_rows:
+            return self.free_rows.pop()
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        if self.next_row >= capacity:
+            self._grow(min(self.max_entries, max(1024, capacity * 2)), dim)
+        row = self.next_row
+        self.next_row += 1
+        return row
+
+    def _grow(self, capacity: int, dim: int) -> None:
+        tmp_path = self.vectors_path + '.tmp'
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(capacity, dim))
+        if self.vectors is not None:
+            grown[:self.vectors.shape[0]] = self.vectors
+            del self.vectors
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode='r+')
+
+    def flush(self) -> None:
+        """
+        Write the index file (atomically, the vectors are flushed when stored)
+        """
+        index = {
+            'model_name': self.model_name,
+            'entries': self.entries,
+            'free_rows': self.free_rows,
+            'next_row': self.next_row,
+            'clock': self.clock,
+        }
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
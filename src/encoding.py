@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List
+import numpy as np
+
+# Encodes large lists of texts in mini-batches of similar length, optionally on several processes.
+# The embeddings are written into one preallocated array in the order of the input texts.
+
+# Number of texts sent to the SentenceTransformer process pool at a time.
+POOL_CHUNK_SIZE = 4096
+
+_worker_encoder = None
+
+def _init_worker(encoder) -> None:
+    global _worker_encoder
+    _worker_encoder = encoder
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(_worker_encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+def length_order(texts: List[str]) -> np.ndarray:
+    """
+    Order the texts from the longest to the shortest, so that each mini-batch holds texts of similar length (less padding)
+
+    Args:
+        texts (List[str]): Texts to be encoded
+
+    Returns:
+        np.ndarray: Indices of the texts, longest first
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    return np.argsort(-lengths, kind='stable')
+
+def _batches(order: np.ndarray, size: int) -> Iterator[np.ndarray]:
+    for start in range(0, len(order), size):
+        yield order[start:start + size]
+
+def encode_texts(encoder, texts: List[str], batch_size: int = 32, workers: int = 1) -> np.ndarray:
+    """
+    Encode the texts sorted by length, on a pool of processes when workers > 1
+
+    Args:
+        encoder: SentenceTransformer or any object with a compatible "encode" (it is pickled to the workers
+            unless it provides SentenceTransformer's multi-process pool)
+        texts (List[str]): Texts to be encoded
+        batch_size (int): Mini-batch size of each encode call
+        workers (int): Number of encoding processes (1 encodes in the current process)
+
+    Returns:
+        np.ndarray: Embeddings (float32) in the same order as the texts
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    order = length_order(texts)
+    embeddings = None
+
+    def store(indices: np.ndarray, vectors: np.ndarray) -> None:
+        nonlocal embeddings
+        if embeddings is None:
+            embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        embeddings[indices] = vectors
+
+    if workers <= 1:
+        for indices in _batches(order, batch_size):
+            store(indices, np.asarray(encoder.encode([texts[i] for i in indices], batch_size=batch_size), dtype=np.float32))
+    elif hasattr(encoder, 'start_multi_process_pool'):
+        # SentenceTransformer shards each chunk over its own worker processes (one model copy per process).
+        pool = encoder.start_multi_process_pool(['cpu'] * workers)
+        try:
+            for indices in _batches(order, POOL_CHUNK_SIZE):
+                vectors = encoder.encode_multi_process([texts[i] for i in indices], pool, batch_size=batch_size)
+                store(indices, np.asarray(vectors, dtype=np.float32))
+        finally:
+            encoder.stop_multi_process_pool(pool)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(encoder,)) as executor:
+            batches = list(_batches(order, batch_size))
+            results = executor.map(_encode_in_worker, ([texts[i] for i in indices] for indices in batches),
+                                   [batch_size] * len(batches))
+            for indices, vectors in zip(batches, results):
+                store(indices, vectors)
+    return embeddings
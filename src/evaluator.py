@@ -1,6 +1,7 @@
-from typing import List, Dict
-from rouge import Rouge
-from sklearn.metrics import f1_score
+from typing import List, Dict, Tuple
+from src.checkpoint import paragraph_id
+from src.data_loader import iter_jsonl_data, iter_records
+import numpy as np
 import json
 
 # Evaluation logics are to be changed according to the language since the JSON structure differs for each language's dataset.
@@ -18,6 +19,115 @@ def load_json_data(file_path: str) -> List[Dict]:
     with open(file_path, 'r', encoding='utf-8-sig') as file:
         return json.load(file)
 
+def load_aligned_data(true_data_path: str, pred_data_path: str, allow_partial: bool = False) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Load the ground truth data and the predictions paired in the same order.
+    A JSONL prediction file (checkpoint of a run) is streamed and matched to the ground truth by paragraph id.
+
+    Args:
+        true_data_path (str): The file path to the ground truth data (JSON, JSONL or Parquet)
+        pred_data_path (str): The file path to the predicted data (JSON array or JSONL)
+        allow_partial (bool): Leave out the paragraphs without a prediction instead of raising an error
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: The ground truth data and the predicted data
+
+    Raises:
+        ValueError: If some paragraphs have no prediction and allow_partial is False
+    """
+    true_data = list(iter_records(true_data_path))
+    if not pred_data_path.endswith('.jsonl'):
+        pred_data = list(iter_records(pred_data_path))
+        _check_coverage(len(pred_data), len(true_data), pred_data_path, allow_partial)
+        return true_data[:len(pred_data)], pred_data
+
+    positions = {}
+    for i, item in enumerate(true_data):
+        positions.setdefault(paragraph_id(item), []).append(i)
+
+    pred_data = [None] * len(true_data)
+    for record in iter_jsonl_data(pred_data_path):
+        for i in positions.get(record.get('id'), []):
+            pred_data[i] = record
+
+    pairs = [(t, p) for t, p in zip(true_data, pred_data) if p is not None]
+    _check_coverage(len(pairs), len(true_data), pred_data_path, allow_partial)
+    return [t for t, _ in pairs], [p for _, p in pairs]
+
+def _check_coverage(n_predicted: int, n_true: int, pred_data_path: str, allow_partial: bool) -> None:
+    # Scores of a partial run are not comparable to those of the whole test set, so they are only computed on request.
+    if n_predicted >= n_true:
+        return
+    message = f"Only {n_predicted} of {n_true} test paragraphs have a prediction in {pred_data_path}"
+    if not allow_partial:
+        raise ValueError(f"{message}. Run \"predict --resume\" to complete them, or evaluate with --allow-partial.")
+    print(f"WARNING: {message}, the scores cover only these paragraphs.")
+
+TEXT_ELEMENTS = ['promise_string', 'evidence_string']
+CATEGORICAL_ELEMENTS = ['promise_status', 'verification_timeline', 'evidence_status', 'evidence_quality']
+
+def _split_sentences(text: str) -> List[List[str]]:
+    # Same tokenization as the "rouge" package: sentences are split at "." and words at single spaces.
+    sentences = [" ".join(sentence.split()) for sentence in text.split(".") if len(sentence) > 0]
+    return [sentence.split(" ") for sentence in sentences]
+
+def _lcs_words(x: List[str], y: List[str]) -> set:
+    # Words of the longest common subsequence, backtracked with the same tie-breaking as the "rouge" package.
+    if x == y:
+        return set(x)
+    if not set(x) & set(y):
+        return set()
+    table = [[0] * (len(y) + 1)]
+    for x_word in x:
+        previous = table[-1]
+        row = [0]
+        for j, y_word in enumerate(y, 1):
+            if x_word == y_word:
+                row.append(previous[j - 1] + 1)
+            else:
+                row.append(previous[j] if previous[j] > row[j - 1] else row[j - 1])
+        table.append(row)
+
+    words = set()
+    i, j = len(x), len(y)
+    while i > 0 and j > 0:
+        if x[i - 1] == y[j - 1]:
+            words.add(x[i - 1])
+            i -= 1
+            j -= 1
+        elif table[i - 1][j] > table[i][j - 1]:
+            i -= 1
+        else:
+            j -= 1
+    return words
+
+def rouge_l_score(hypothesis: str, reference: str) -> Dict[str, float]:
+    """
+    Calculate the summary-level ROUGE-L score of one text pair (same definition as Rouge().get_scores(...)['rouge-l']).
+
+    Args:
+        hypothesis (str): The predicted text
+        reference (str): The ground truth text
+
+    Returns:
+        Dict[str, float]: Recall, precision and F score
+    """
+    hypothesis_sentences = _split_sentences(hypothesis)
+    reference_sentences = _split_sentences(reference)
+    if not hypothesis_sentences or not reference_sentences:
+        return {'r': 0.0, 'p': 0.0, 'f': 0.0}
+
+    m = len({word for sentence in reference_sentences for word in sentence})
+    n = len({word for sentence in hypothesis_sentences for word in sentence})
+    union = set()
+    for reference_words in reference_sentences:
+        for hypothesis_words in hypothesis_sentences:
+            union |= _lcs_words(reference_words, hypothesis_words)
+    recall = len(union) / m
+    precision = len(union) / n
+    f = 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+    return {'r': recall, 'p': precision, 'f': f}
+
 def calculate_rouge_scores(true_data: List[Dict], pred_data: List[Dict]) -> Dict[str, Dict[str, float]]:
     """
     Calculate the ROUGE score for the prediction results.
@@ -29,12 +139,9 @@ def calculate_rouge_scores(true_data: List[Dict], pred_data: List[Dict]) -> Dict
     Returns:
         Dict[str, Dict[str, float]]: The ROUGE score for each element
     """
-    rouge = Rouge()
     rouge_scores = {}
     
-    text_elements = ['promise_string', 'evidence_string']
-    
-    for element in text_elements:
+    for element in TEXT_ELEMENTS:
         true_texts = [item.get(element, "") for item in true_data if isinstance(item, dict)]
         pred_texts = [item.get(element, "") for item in pred_data if isinstance(item, dict)]
         
@@ -42,12 +149,33 @@ def calculate_rouge_scores(true_data: List[Dict], pred_data: List[Dict]) -> Dict
         valid_pairs = [(t, p) for t, p in zip(true_texts, pred_texts) if t and p]
         
         if valid_pairs:
-            true_valid, pred_valid = zip(*valid_pairs)
-            scores = rouge.get_scores(pred_valid, true_valid, avg=True)
-            rouge_scores[element] = scores['rouge-l']
+            scores = np.array([[score['r'], score['p'], score['f']] for score in (rouge_l_score(p, t) for t, p in valid_pairs)])
+            r, p, f = scores.mean(axis=0)
+            rouge_scores[element] = {'r': float(r), 'p': float(p), 'f': float(f)}
     
     return rouge_scores
 
+def weighted_f1_score(true_codes: np.ndarray, pred_codes: np.ndarray, n_labels: int) -> float:
+    """
+    Calculate the support-weighted F1 score from integer-coded labels (same as sklearn's f1_score(average='weighted')).
+
+    Args:
+        true_codes (np.ndarray): The ground truth label codes
+        pred_codes (np.ndarray): The predicted label codes
+        n_labels (int): The number of label codes
+
+    Returns:
+        float: The weighted F1 score
+    """
+    confusion = np.bincount(true_codes * n_labels + pred_codes, minlength=n_labels * n_labels).reshape(n_labels, n_labels)
+    true_positive = np.diag(confusion).astype(float)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    precision = np.divide(true_positive, predicted, out=np.zeros(n_labels), where=predicted > 0)
+    recall = np.divide(true_positive, support, out=np.zeros(n_labels), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(n_labels), where=(precision + recall) > 0)
+    return float(np.sum(f1 * support) / np.sum(support))
+
 def calculate_f1_scores(true_data: List[Dict], pred_data: List[Dict]) -> Dict[str, float]:
     """
     Calculate the F1 score for the prediction results (for categorical elements),
@@ -61,46 +189,71 @@ def calculate_f1_scores(true_data: List[Dict], pred_data: List[Dict]) -> Dict[st
         Dict[str, float]: The F1 score for each element
     """    
     f1_scores = {}
+    pairs = list(zip(true_data, pred_data))
     
-    categorical_elements = ['promise_status', 'verification_timeline', 'evidence_status', 'evidence_quality']
-    
-    for element in categorical_elements:
-        true_values = []
-        pred_values = []
+    for element in CATEGORICAL_ELEMENTS:
+        # Encode the labels into integers once, then compute the score from the confusion matrix.
+        codes = {}
+        true_codes = np.array([codes.setdefault(true_item.get(element), len(codes)) for true_item, _ in pairs], dtype=np.int64)
+        pred_codes = np.array([codes.setdefault(pred_item.get(element), len(codes)) for _, pred_item in pairs], dtype=np.int64)
         
-        # Filtering: Exclude pairs with N/A labels.
-        for true_item, pred_item in zip(true_data, pred_data):
-            true_label = true_item.get(element)
-            pred_label = pred_item.get(element)
-            
-            # Only for the 'promise_status' label, pairs containing 'N/A' are included in the calculation.
-            if element == 'promise_status':
-                true_values.append(true_label)
-                pred_values.append(pred_label)
-            else:
-                if true_label != 'N/A' and pred_label != 'N/A':
-                    true_values.append(true_label)
-                    pred_values.append(pred_label)
+        # Only for the 'promise_status' label, pairs containing 'N/A' are included in the calculation.
+        if element != 'promise_status' and 'N/A' in codes:
+            valid = (true_codes != codes['N/A']) & (pred_codes != codes['N/A'])
+            true_codes, pred_codes = true_codes[valid], pred_codes[valid]
         
-        if true_values and pred_values:
-            f1 = f1_score(true_values, pred_values, average='weighted')
-            f1_scores[element] = f1
+        if len(true_codes):
+            f1_scores[element] = weighted_f1_score(true_codes, pred_codes, len(codes))
     
     return f1_scores
 
-def evaluate_results(true_data_path: str, pred_data_path: str) -> Dict[str, Dict[str, float]]:
+def check_parity(true_data: List[Dict], pred_data: List[Dict]) -> Dict[str, float]:
+    """
+    Compare the scores with the reference implementations ("rouge" package and sklearn), which must be installed.
+
+    Args:
+        true_data (List[Dict]): The ground truth data
+        pred_data (List[Dict]): The predicted data
+
+    Returns:
+        Dict[str, float]: The absolute difference of each score (all should be close to 0)
+    """
+    from rouge import Rouge
+    from sklearn.metrics import f1_score
+
+    differences = {}
+    rouge_scores = calculate_rouge_scores(true_data, pred_data)
+    for element in TEXT_ELEMENTS:
+        valid_pairs = [(t, p) for t, p in zip([item.get(element, "") for item in true_data], [item.get(element, "") for item in pred_data]) if t and p]
+        if valid_pairs:
+            true_valid, pred_valid = zip(*valid_pairs)
+            reference = Rouge().get_scores(pred_valid, true_valid, avg=True)['rouge-l']
+            for stat in ('r', 'p', 'f'):
+                differences[f'{element}.{stat}'] = abs(reference[stat] - rouge_scores[element][stat])
+
+    f1_scores = calculate_f1_scores(true_data, pred_data)
+    for element in CATEGORICAL_ELEMENTS:
+        pairs = [(t.get(element), p.get(element)) for t, p in zip(true_data, pred_data)]
+        if element != 'promise_status':
+            pairs = [(t, p) for t, p in pairs if t != 'N/A' and p != 'N/A']
+        if pairs:
+            reference = f1_score([t for t, _ in pairs], [p for _, p in pairs], average='weighted')
+            differences[element] = abs(reference - f1_scores[element])
+    return differences
+
+def evaluate_results(true_data_path: str, pred_data_path: str, allow_partial: bool = False) -> Dict[str, Dict[str, float]]:
     """
     Evaluate the overall performance of the prediction results.(rouge score and f1 score)
 
     Args:
         true_data_path (str): The file path to the ground truth data
-        pred_data_path (str): The file path to the predicted data
+        pred_data_path (str): The file path to the predicted data (JSON array or JSONL)
+        allow_partial (bool): Score only the paragraphs with a prediction instead of raising an error when some are missing
 
     Returns:
         Dict[str, Dict[str, float]]: The evaluation scores for each element
     """
-    true_data = load_json_data(true_data_path)
-    pred_data = load_json_data(pred_data_path)
+    true_data, pred_data = load_aligned_data(true_data_path, pred_data_path, allow_partial=allow_partial)
 
     rouge_scores = calculate_rouge_scores(true_data, pred_data)
     f1_scores = calculate_f1_scores(true_data, pred_data)
@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import numpy as np
+
+# Lightweight timers, counters and latency histograms for the stages of a run.
+# Stages record into the module-level "metrics" registry, which is written as a JSON (or Prometheus text) report at the end of the run.
+
+# USD per 1M tokens (input, output), used for the cost estimate of the API usage.
+DEFAULT_PRICES = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+}
+
+# Upper bounds (seconds) of the histogram buckets in the Prometheus output.
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+# Number of most recent durations per stage kept for the percentiles (counts, totals, maxima and buckets cover all of them).
+LATENCY_WINDOW = 10000
+
+class StageLatency:
+    def __init__(self, window: int = LATENCY_WINDOW):
+        """
+        Running aggregates of the durations of one stage, with a bounded window of the most recent ones for the percentiles
+
+        Args:
+            window (int): Number of recent durations kept
+        """
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Number of durations in each histogram bucket (not cumulative), the last one is above the largest bound.
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.recent.append(seconds)
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time.time()
+            self.counters: Dict[str, float] = {}
+            self.latencies: Dict[str, StageLatency] = {}
+            self.usage: Dict[str, Dict[str, int]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Add to a counter
+
+        Args:
+            name (str): Counter name
+            value (float): Amount to add
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Record the duration of one execution of a stage
+
+        Args:
+            stage (str): Stage name
+            seconds (float): Duration in seconds
+        """
+        with self.lock:
+            latency = self.latencies.get(stage)
+            if latency is None:
+                latency = self.latencies[stage] = StageLatency()
+            latency.add(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Time the enclosed block as one execution of a stage
+
+        Args:
+            stage (str): Stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def record_usage(self, model_name: str, usage) -> None:
+        """
+        Add the token usage of an API response
+
+        Args:
+            model_name (str): Name of the LLM
+            usage: "usage" field of the response (None is ignored, e.g. for cached responses)
+        """
+        if usage is None:
+            return
+        with self.lock:
+            totals = self.usage.setdefault(model_name, {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0})
+            totals['requests'] += 1
+            totals['prompt_tokens'] += usage.prompt_tokens
+            totals['completion_tokens'] += usage.completion_tokens
+            details = getattr(usage, 'prompt_tokens_details', None)
+            totals['cached_tokens'] += (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+
+    def report(self, prices: Optional[Dict[str, List[float]]] = None) -> Dict:
+        """
+        Summarize the metrics
+
+        Args:
+            prices (Optional[Dict[str, List[float]]]): USD per 1M input/output tokens by model (DEFAULT_PRICES if None)
+
+        Returns:
+            Dict: Stage latencies (count, total, mean, p50, p95, p99, max, throughput), counters and token usage with cost
+                (the percentiles cover the last LATENCY_WINDOW executions of each stage)
+        """
+        prices = prices or DEFAULT_PRICES
+        with self.lock:
+            elapsed = time.time() - self.started
+            stages = {}
+            for stage, latency in self.latencies.items():
+                recent = np.array(latency.recent)
+                stages[stage] = {
+                    'count': latency.count,
+                    'total_s': latency.total,
+                    'mean_s': latency.total / latency.count,
+                    'p50_s': float(np.percentile(recent, 50)),
+                    'p95_s': float(np.percentile(recent, 95)),
+                    'p99_s': float(np.percentile(recent, 99)),
+                    'max_s': latency.max,
+                    'per_second': latency.count / latency.total if latency.total > 0 else None,
+                }
+            usage = {}
+            for model_name, totals in self.usage.items():
+                input_price, output_price = prices.get(model_name, (None, None))
+                cost = None
+                if input_price is not None:
+                    cost = (totals['prompt_tokens'] * input_price + totals['completion_tokens'] * output_price) / 1e6
+                usage[model_name] = dict(totals, cost_usd=cost)
+            return {
+                'started': self.started,
+                'elapsed_s': elapsed,
+                'stages': stages,
+                'counters': dict(self.counters),
+                'usage': usage,
+            }
+
+    def to_prometheus(self, prefix: str = 'gpt_rag') -> str:
+        """
+        Write the metrics in the Prometheus text exposition format
+
+        Args:
+            prefix (str): Prefix of the metric names
+
+        Returns:
+            str: Metrics text
+        """
+        lines = [f'# TYPE {prefix}_stage_seconds histogram']
+        with self.lock:
+            for stage, latency in self.latencies.items():
+                cumulative = np.cumsum(latency.buckets)
+                for bound, count in zip(LATENCY_BUCKETS, cumulative):
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {latency.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {latency.total}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {latency.count}')
+            lines.append(f'# TYPE {prefix}_events_total counter')
+            for name, value in self.counters.items():
+                lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+            lines.append(f'# TYPE {prefix}_tokens_total counter')
+            for model_name, totals in self.usage.items():
+                for kind in ('prompt_tokens', 'completion_tokens', 'cached_tokens'):
+                    lines.append(f'{prefix}_tokens_total{{model="{model_name}",kind="{kind}"}} {totals[kind]}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, file_path: str, prometheus_path: Optional[str] = None, prices: Optional[Dict[str, List[float]]] = None) -> Dict:
+        """
+        Write the JSON report (and optionally the Prometheus text)
+
+        Args:
+            file_path (str): Path of the JSON report
+            prometheus_path (Optional[str]): Path of the Prometheus text file
+            prices (Optional[Dict[str, List[float]]]): USD per 1M input/output tokens by model
+
+        Returns:
+            Dict: The report
+        """
+        report = self.report(prices)
+        with open(file_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        if prometheus_path:
+            with open(prometheus_path, 'w') as f:
+                f.write(self.to_prometheus())
+        return report
+
+metrics = Metrics()
@@ -0,0 +1,166 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+# Minimal local server speaking the OpenAI chat completions API, for running the pipeline offline.
+# Point the RAG model to it with "openai_base_url: http://127.0.0.1:<port>/v1" in config.yml.
+
+DEFAULT_ANNOTATION = {
+    "promise_status": "Yes",
+    "promise_string": None,
+    "verification_timeline": "already",
+    "evidence_status": "Yes",
+    "evidence_string": None,
+    "evidence_quality": "Clear"
+}
+
+def default_responder(messages: List[Dict[str, str]]) -> str:
+    """
+    Answer every request with the same annotation (with the analyzed paragraph as "data")
+
+    Args:
+        messages (List[Dict[str, str]]): Chat messages of the request
+
+    Returns:
+        str: Message content of the response
+    """
+    paragraph = messages[-1]['content'].rstrip().split('\n')[-1].strip()
+    annotation = dict(DEFAULT_ANNOTATION, data=paragraph)
+    return "Thought process is omitted.\n" + json.dumps(annotation, ensure_ascii=False)
+
+def chat_completion(request: Dict, responder: Optional[Callable[[List[Dict[str, str]]], str]] = None) -> Dict:
+    """
+    Build a chat completion response for a request body, without a server (also used by the local batch backend)
+
+    Args:
+        request (Dict): Request body
+        responder (Optional[Callable]): Function returning the message content for the request messages
+
+    Returns:
+        Dict: Response body in the OpenAI format
+    """
+    messages = request.get('messages', [])
+    content = (responder or default_responder)(messages)
+    prompt_tokens = sum(len(message['content']) for message in messages) // 2 + 1
+    completion_tokens = len(content) // 2 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get('model', 'stub'),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+class StubOpenAIServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, responder: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+                 latency: float = 0.0, fail_every: int = 0):
+        """
+        Local stub of the OpenAI API
+
+        Args:
+            host (str): Host to bind
+            port (int): Port to bind (0 picks a free port)
+            responder (Optional[Callable]): Function returning the message content for the request messages
+            latency (float): Artificial latency of each response in seconds
+            fail_every (int): Answer every n-th request with 429 (never if 0), to exercise retries
+        """
+        self.responder = responder or default_responder
+        self.latency = latency
+        self.fail_every = fail_every
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send_json(404, {"error": {"message": f"Unknown path: {self.path}"}})
+                    return
+                with stub.lock:
+                    stub.request_count += 1
+                    count = stub.request_count
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.fail_every and count % stub.fail_every == 0:
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, {'retry-after': '0'})
+                    return
+                self._send_json(200, stub.completion(request))
+
+        return Handler
+
+    def completion(self, request: Dict) -> Dict:
+        """
+        Build a chat completion response for the request
+
+        Args:
+            request (Dict): Request body
+
+        Returns:
+            Dict: Response body in the OpenAI format
+        """
+        return chat_completion(request, self.responder)
+
+    def start(self) -> str:
+        """
+        Serve in a background thread
+
+        Returns:
+            str: Base URL of the stub
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI chat completions API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+
+    stub = StubOpenAIServer(args.host, args.port, latency=args.latency, fail_every=args.fail_every)
+    print(f"Serving the stub OpenAI API at {stub.base_url}")
+    stub.server.serve_forever()
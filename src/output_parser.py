@@ -0,0 +1,176 @@
+import json
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.instrumentation import metrics
+
+# Extracts the annotation JSON from the LLM output (thought process, code fences or prose around it are ignored)
+# and validates it against the label schema, so that only invalid answers have to be asked again.
+
+# Allowed values of each label (the same as in the instruction prompt).
+LABEL_SCHEMA = {
+    'promise_status': ['Yes', 'No'],
+    'verification_timeline': ['already', 'within_2_years', 'between_2_and_5_years', 'more_than_5_years', 'N/A'],
+    'evidence_status': ['Yes', 'No', 'N/A'],
+    'evidence_quality': ['Clear', 'Not Clear', 'Misleading', 'N/A'],
+}
+# Fields holding a string extracted from the paragraph, or null.
+STRING_FIELDS = ['promise_string', 'evidence_string']
+
+class OutputParseError(ValueError):
+    def __init__(self, problems: List[str], annotation: Optional[Dict] = None):
+        """
+        The LLM output has no valid annotation
+
+        Args:
+            problems (List[str]): Description of each problem (used in the re-ask message)
+            annotation (Optional[Dict]): The extracted JSON object, if any
+        """
+        super().__init__('; '.join(problems))
+        self.problems = problems
+        self.annotation = annotation
+
+def _label_key(value: str) -> str:
+    return re.sub(r'[\s_\-]+', '_', value.strip().lower())
+
+_CANONICAL_LABELS = {field: {_label_key(value): value for value in values} for field, values in LABEL_SCHEMA.items()}
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    """
+    Yield the top-level "{...}" spans of a text in one pass, following nested braces and ignoring braces inside strings
+
+    Args:
+        text (str): LLM output
+
+    Returns:
+        Iterator[str]: Candidate JSON object texts, in order of appearance
+    """
+    depth = 0
+    start = 0
+    in_string = False
+    escaped = False
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            # Quotes only delimit strings inside an object (prose may contain unbalanced quotes).
+            in_string = depth > 0
+        elif char == '{':
+            if depth == 0:
+                start = position
+            depth += 1
+        elif char == '}' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                yield text[start:position + 1]
+
+def _loads(candidate: str) -> Tuple[Optional[Dict], bool]:
+    # Returns the object and whether it had to be repaired (trailing commas) to parse.
+    try:
+        obj = json.loads(candidate)
+        return (obj if isinstance(obj, dict) else None), False
+    except json.JSONDecodeError:
+        pass
+    try:
+        obj = json.loads(re.sub(r',\s*([}\]])', r'\1', candidate))
+        return (obj if isinstance(obj, dict) else None), True
+    except json.JSONDecodeError:
+        return None, False
+
+def extract_json_object(text: str) -> Tuple[Optional[Dict], bool]:
+    """
+    Extract the annotation object from the LLM output: the last object with a label field,
+    otherwise the last object that parses
+
+    Args:
+        text (str): LLM output
+
+    Returns:
+        Tuple[Optional[Dict], bool]: The object (None if there is none) and whether it had to be repaired to parse
+    """
+    labeled = unlabeled = None
+    for candidate in iter_json_objects(text):
+        obj, repaired = _loads(candidate)
+        if obj is None:
+            continue
+        if any(field in obj for field in LABEL_SCHEMA):
+            labeled = (obj, repaired)
+        else:
+            unlabeled = (obj, repaired)
+    return labeled or unlabeled or (None, False)
+
+def validate_annotation(annotation: Dict) -> Tuple[Dict, List[str], bool]:
+    """
+    Check the labels against LABEL_SCHEMA, fixing differences of case, spacing and missing string fields
+
+    Args:
+        annotation (Dict): Extracted JSON object
+
+    Returns:
+        Tuple[Dict, List[str], bool]: The normalized annotation, the remaining problems and whether anything was fixed
+    """
+    annotation = dict(annotation)
+    problems = []
+    fixed = False
+    for field, values in LABEL_SCHEMA.items():
+        value = annotation.get(field)
+        if not isinstance(value, str):
+            problems.append(f'"{field}" is missing' if value is None else f'"{field}" must be a string')
+            continue
+        canonical = _CANONICAL_LABELS[field].get(_label_key(value))
+        if canonical is None:
+            problems.append(f'"{field}" must be one of {values}, not "{value}"')
+        elif canonical != value:
+            annotation[field] = canonical
+            fixed = True
+    for field in STRING_FIELDS:
+        if field not in annotation:
+            annotation[field] = None
+            fixed = True
+        elif annotation[field] is not None and not isinstance(annotation[field], str):
+            problems.append(f'"{field}" must be a string or null')
+    return annotation, problems, fixed
+
+def parse_annotation(text: str) -> Dict:
+    """
+    Extract and validate the annotation of an LLM output
+
+    Args:
+        text (str): LLM output
+
+    Returns:
+        Dict: The annotation with canonical labels
+
+    Raises:
+        OutputParseError: If there is no JSON object or the labels are invalid
+    """
+    with metrics.timer('json_extraction'):
+        annotation, repaired = extract_json_object(text or '')
+        if annotation is None:
+            metrics.increment('output_invalid')
+            raise OutputParseError(['The response does not contain a JSON object'])
+        annotation, problems, fixed = validate_annotation(annotation)
+    if problems:
+        metrics.increment('output_invalid')
+        raise OutputParseError(problems, annotation)
+    if repaired or fixed:
+        metrics.increment('output_fixed_locally')
+    return annotation
+
+def repair_prompt(error: OutputParseError) -> str:
+    """
+    Build the follow-up message asking the LLM to correct an invalid answer
+
+    Args:
+        error (OutputParseError): Problems of the answer
+
+    Returns:
+        str: Content of the user message
+    """
+    problems = '\n'.join(f'- {problem}' for problem in error.problems)
+    return (f"Your answer could not be used:\n{problems}\n"
+            "Output only the corrected JSON object in the format described above, without any other text.")
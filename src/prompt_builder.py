@@ -0,0 +1,148 @@
+import json
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional
+import numpy as np
+
+# Builds the annotation prompt within a token budget.
+# The instruction comes first and never changes, the examples (most similar first) are dropped from the end until the prompt fits.
+
+# Number of most recent prompts kept for the p95 of the summary (the other statistics cover all prompts).
+STATS_WINDOW = 10000
+
+@lru_cache(maxsize=None)
+def _encoding(model_name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+def count_tokens(text: str, model_name: str = 'gpt-4o') -> int:
+    """
+    Count the tokens of a text with the local tokenizer of the model (tiktoken),
+    or estimate them from the UTF-8 length if tiktoken is not installed (about one token per Japanese character)
+
+    Args:
+        text (str): Text to be counted
+        model_name (str): Name of the LLM
+
+    Returns:
+        int: Number of tokens
+    """
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return len(text.encode('utf-8')) // 3 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+class PromptBuilder:
+    def __init__(self, system_prompt: str, instruction: str, paragraph_template: str, model_name: str = 'gpt-4o',
+                 max_prompt_tokens: Optional[int] = None, compact_examples: bool = True):
+        """
+        Prompt builder for the annotation requests
+
+        Args:
+            system_prompt (str): Content of the system message
+            instruction (str): Static instruction at the start of the user message
+            paragraph_template (str): Template placed after the examples, with a "{paragraph}" field
+            model_name (str): Name of the LLM (selects the tokenizer)
+            max_prompt_tokens (Optional[int]): Token budget of the messages (no limit if None)
+            compact_examples (bool): Write the examples as JSON without whitespace and null fields (otherwise indented JSON)
+        """
+        self.system_prompt = system_prompt
+        self.instruction = instruction
+        self.paragraph_template = paragraph_template
+        self.model_name = model_name
+        self.max_prompt_tokens = max_prompt_tokens
+        self.compact_examples = compact_examples
+        self.fixed_tokens = self.count_tokens(system_prompt) + self.count_tokens(instruction)
+        # Prompts are built on the threads of the annotation engine, which share the statistics.
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        # Running totals of the prompts built so far, and the token counts of the most recent ones.
+        with self.lock:
+            self.stats = {'prompts': 0, 'prompt_tokens': 0, 'max_prompt_tokens': 0, 'examples_dropped': 0, 'over_budget': 0}
+            self.recent_prompt_tokens = deque(maxlen=STATS_WINDOW)
+
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.model_name)
+
+    def format_example(self, record: Dict) -> str:
+        """
+        Write an example record as JSON
+
+        Args:
+            record (Dict): Annotated record of the search data
+
+        Returns:
+            str: JSON text of the example
+        """
+        if self.compact_examples:
+            record = {key: value for key, value in record.items() if value is not None}
+            return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        return json.dumps(record, ensure_ascii=False, indent=2)
+
+    def build(self, paragraph: str, examples: List[Dict]) -> List[Dict[str, str]]:
+        """
+        Build the chat messages, keeping as many of the examples as the token budget allows
+
+        Args:
+            paragraph (str): Input paragraph text
+            examples (List[Dict]): Similar annotated records, most similar first
+
+        Returns:
+            List[Dict[str, str]]: System and user messages
+        """
+        example_texts = [self.format_example(example) for example in examples]
+        example_tokens = [self.count_tokens(text) for text in example_texts]
+        paragraph_text = self.paragraph_template.format(paragraph=paragraph)
+        paragraph_tokens = self.count_tokens(paragraph_text)
+
+        # Each example also costs about one token for the line break separating it.
+        used = len(example_texts)
+        if self.max_prompt_tokens is not None:
+            budget = self.max_prompt_tokens - self.fixed_tokens - paragraph_tokens
+            while used > 0 and sum(example_tokens[:used]) + used > budget:
+                used -= 1
+
+        prompt_tokens = self.fixed_tokens + paragraph_tokens + sum(example_tokens[:used]) + used
+        with self.lock:
+            self.stats['prompts'] += 1
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['max_prompt_tokens'] = max(self.stats['max_prompt_tokens'], prompt_tokens)
+            self.stats['examples_dropped'] += len(example_texts) - used
+            self.stats['over_budget'] += self.max_prompt_tokens is not None and prompt_tokens > self.max_prompt_tokens
+            self.recent_prompt_tokens.append(prompt_tokens)
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.instruction + "\n".join(example_texts[:used]) + paragraph_text}
+        ]
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Summarize the token statistics of the prompts built so far
+
+        Returns:
+            Dict[str, float]: Number of prompts, mean/p95/max prompt tokens and the number of dropped examples
+                (the p95 covers the last STATS_WINDOW prompts)
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            recent_prompt_tokens = np.array(self.recent_prompt_tokens)
+        if not stats['prompts']:
+            return {'prompts': 0}
+        return {
+            'prompts': stats['prompts'],
+            'instruction_tokens': self.fixed_tokens,
+            'mean_prompt_tokens': stats['prompt_tokens'] / stats['prompts'],
+            'p95_prompt_tokens': float(np.percentile(recent_prompt_tokens, 95)),
+            'max_prompt_tokens': stats['max_prompt_tokens'],
+            'examples_dropped': stats['examples_dropped'],
+            'over_budget': stats['over_budget'],
+        }
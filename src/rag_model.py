@@ -1,30 +1,382 @@
-import openai
-from openai import OpenAI
-from typing import Optional, List, Dict
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Optional, List, Dict, TYPE_CHECKING
+from src.checkpoint import paragraph_id
+from src.document_store import DocumentStore
+from src.embedding_cache import EmbeddingCache
+from src.encoding import encode_texts
+from src.response_cache import ResponseCache, request_key
+from src.prompt_builder import PromptBuilder
+from src.output_parser import OutputParseError, extract_json_object, parse_annotation, repair_prompt
+from src.instrumentation import metrics
+from src.vector_index import VectorIndex, create_index, load_index, read_index_meta
+from src.reranker import BM25Index, Reranker
+import hashlib
+import os
 import numpy as np
 import json
 import re
 
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from openai.types.chat import ChatCompletion
+
+# The parts of the prompt that explains the JSON structure are to be changed according to the language since the JSON structure differs for each language's dataset.
+
+SYSTEM_PROMPT = "You are an expert in extracting ESG-related promise and their corresponding evidence from corporate reports that describe ESG matters."
+
+# The instruction is identical for every request and comes first in the prompt, so that the provider can cache it as a prefix.
+INSTRUCTION_PROMPT = """You are an expert in extracting ESG-related promise and their corresponding evidence from corporate reports that describe ESG matters.
+Follow the instructions below to provide careful and consistent annotations.
+Output the results in the following JSON format.
+Ensure that your response is a valid JSON object.
+Do not include any text before or after the JSON object.:
+{
+    "data": str,
+    "promise_status": str,
+    "promise_string": str or null,
+    "verification_timeline": str,
+    "evidence_status": str,
+    "evidence_string": str or null,
+    "evidence_quality": str
+}:
+Although you are specified to output in JSON format, perform the thought process in natural language and output the result in JSON format at the end.
+
+Annotation procedure:
+1. You will be given the content of a paragraph.
+2. Determine if a promise is included, and indicate "Yes" if included, "No" if not included. (promise_status)
+3. If a promise is included (if promise_status is "Yes"), also provide the following information:
+- The specific part of the promise (extract verbatim from the text without changing a single word) (promise_string)
+- When the promise can be verified ("already", "within_2_years", "between_2_and_5_years", "more_than_5_years", "N/A") (verification_timeline)
+- Whether evidence is included ("Yes", "No", "N/A") (evidence_status)
+4. If evidence is included (if evidence_status is "Yes"), also provide the following information:
+- The part containing the evidence (extract directly from the text without changing a single word) (evidence_string)
+- The quality of the relationship between the promise and evidence ("Clear", "Not Clear", "Misleading", "N/A") (evidence_quality)
+
+Definitions and criteria for annotation labels:
+1. promise_status - A promise is composed of a statement (a company principle, commitment, or strategy related to ESG criteria).:
+- "Yes": A promise exists.
+- "No": No promise exists.
+
+2. verification_timeline - The Verification Timeline is the assessment of when we could possibly see the final results of a given ESG-related action and thus verify the statement.:
+- "already": Qualifies ESG-related measures that have already been and keep on being applied and every small measure whose results can already be verified anyway.
+- "within_2_years": ESG-related measures whose results can be verified within 2 years.
+- "between_2_and_5_years": ESG-related measures whose results can be verified in 2 to 5 years.
+- "more_than_5_years: ESG-related measures whose results can be verified in more than 5 years.
+- "N/A": When no promise exists.
+
+3. evidence_status - Pieces of evidence are elements deemed the most relevant to exemplify and prove the core promise is being kept, which includes but is not limited to simple examples, company measures, numbers, etc.:
+- "Yes": Evidence supporting the promise exists.
+- "No": No evidence for the promise exists.
+- "N/A": When no promise exists.
+
+4. evidence_quality - The Evidence Quality is the assessment of the company's ability to back up their statement with enough clarity and precision.:
+- "Clear": There is no lack of information and what is said is intelligible and logical.
+- "Not Clear": An information is missing so much so that what is said may range from intelligible and logical to superficial and/or superfluous.
+- "Misleading": The evidence, whether true or not, has no obvious connection with the point raised and is used to divert attention.
+- "N/A": When no evidence or promise exists.
+
+Important notes:
+- Consider the context thoroughly. It's important to understand the meaning of the entire paragraph, not just individual sentences.
+- For indirect evidence, carefully judge its relevance.
+- "promise_string" and "evidence_string" should be extracted verbatim from the original text. If there is no corresponding text (when promise_status or evidence_status is No), output a blank.
+- Understand and appropriately interpret industry-specific terms.
+
+The following are annotation examples of texts similar to the text you want to analyze.
+Refer to these examples, think about why these examples have such annotation results, and then output the results.
+Examples for your reference are as follows:
+"""
+
+PARAGRAPH_PROMPT = """
+
+Analyze the following text and provide results in the format described above:
+{paragraph}
+"""
+
 # For the embedding model, use the 'multilingual-e5-large-instruct' which supports multiple languages
+EMBEDDING_MODEL_NAME = 'intfloat/multilingual-e5-large-instruct'
 
 class RAGModel:
-    def __init__(self, api_key, model_name):
-        openai.api_key = api_key
+    def __init__(self, api_key, model_name, embedding_cache_dir: Optional[str] = None, embedding_cache_size: int = 200000, base_url: Optional[str] = None,
+                 response_cache: Optional[ResponseCache] = None, index_type: str = 'exact', index_params: Optional[Dict] = None,
+                 max_prompt_tokens: Optional[int] = None, compact_examples: bool = True, embedder=None,
+                 encode_batch_size: int = 32, encode_workers: int = 1, max_repairs: int = 1, document_store_dir: Optional[str] = None,
+                 reranker: Optional[Reranker] = None, candidate_pool: int = 50, candidate_source: str = 'embedding'):
+        self.api_key = api_key
+        self.base_url = base_url
         self.model_name = model_name
-        self.embedder = SentenceTransformer('intfloat/multilingual-e5-large-instruct')
+        # One client (and its connection pool) is shared by every request, created on first use.
+        self._client = None
+        # Identical requests (same model, messages and parameters) are answered from the cache when one is given.
+        self.response_cache = response_cache
+        self.completion_params = {'temperature': 0}
+        # Answers without a valid annotation are sent back to the LLM with their problems, at most max_repairs times.
+        self.max_repairs = max_repairs
+        # Examples are dropped (least similar first) when the prompt would exceed max_prompt_tokens.
+        self.prompt_builder = PromptBuilder(SYSTEM_PROMPT, INSTRUCTION_PROMPT, PARAGRAPH_PROMPT, model_name=model_name,
+                                            max_prompt_tokens=max_prompt_tokens, compact_examples=compact_examples)
+        # Nearest-neighbour index over the search data ("exact", "ivf" or "hnsw", see vector_index.py).
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.index: Optional[VectorIndex] = None
+        self.embedder_name = EMBEDDING_MODEL_NAME
+        # The embedding model is loaded on first use (see the "embedder" property).
+        # Any object with a SentenceTransformer-compatible "encode" can be given instead (e.g. a stub for benchmarks).
+        self._embedder = embedder
+        if embedder is not None:
+            self.embedder_name = getattr(embedder, 'embedder_name', type(embedder).__name__)
+        # The search data is encoded in length-sorted mini-batches, on encode_workers processes (see encoding.py).
+        self.encode_batch_size = encode_batch_size
+        self.encode_workers = encode_workers
+        # Embeddings of the search data are reused across runs when a cache directory is given.
+        self.embedding_cache = EmbeddingCache(embedding_cache_dir, self.embedder_name, embedding_cache_size) if embedding_cache_dir else None
+        # With a document store, the search data is kept on disk with its embeddings and updated incrementally (see document_store.py).
+        self.document_store = None
+        self.index_path = None
+        # With a reranker, the top candidate_pool documents of the first stage ("embedding" or "bm25") are reordered
+        # and the best top_k are kept (see reranker.py).
+        if candidate_source not in ('embedding', 'bm25'):
+            raise ValueError(f"Unknown candidate_source: {candidate_source} (expected 'embedding' or 'bm25')")
+        self.reranker = reranker
+        self.candidate_pool = candidate_pool
+        self.candidate_source = candidate_source
+        self._bm25 = None
+        self._bm25_documents = None
+        if document_store_dir:
+            self.document_store = DocumentStore(os.path.join(document_store_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', self.embedder_name)))
+
+    @property
+    def client(self) -> 'OpenAI':
+        if self._client is None:
+            import openai
+            from openai import OpenAI
 
-    def prepare_documents(self, search_data: List[Dict]) -> None:
+            openai.api_key = self.api_key
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from sentence_transformers import SentenceTransformer
+
+            with metrics.timer('model_load'):
+                self._embedder = SentenceTransformer(self.embedder_name)
+        return self._embedder
+
+    @property
+    def bm25(self) -> BM25Index:
+        # Built on first use, and again whenever the documents have changed.
+        if self._bm25 is None or self._bm25_documents is not self.documents:
+            with metrics.timer('bm25_build'):
+                self._bm25 = BM25Index(self.documents)
+            self._bm25_documents = self.documents
+        return self._bm25
+
+    def prepare_documents(self, search_data: List[Dict], index_path: Optional[str] = None) -> None:
         """
         Prepare and encode the search data
 
         Args:
             search_data (List[Dict]): Data for search
+            index_path (Optional[str]): Directory for saving the built index (reused if it was built from the same search data)
         """
+        if self.document_store is not None:
+            self.sync_documents(search_data, index_path)
+            return
         self.search_data = search_data
         self.documents = [item['data'] for item in search_data]
-        self.doc_embeddings = self.embedder.encode(self.documents)
+        if self.candidate_source == 'bm25':
+            # The documents are only searched lexically, so they are not encoded.
+            self.doc_embeddings = None
+            self.index = None
+            return
+        self.doc_embeddings = self.embed_documents(self.documents)
+        self.load_or_build_index(index_path, lambda: self.doc_embeddings, self.doc_embeddings.shape[1])
+
+    def embed_documents(self, documents: List[str]) -> np.ndarray:
+        """
+        Encode documents through the embedding cache (if any)
+
+        Args:
+            documents (List[str]): Texts to be encoded
+
+        Returns:
+            np.ndarray: Embeddings in the same order as the documents
+        """
+        with metrics.timer('document_encoding'):
+            if self.embedding_cache is not None:
+                embeddings = self.embedding_cache.encode(documents, self.encode_documents)
+            else:
+                embeddings = self.encode_documents(documents)
+        metrics.increment('documents_encoded', len(documents))
+        return embeddings
+
+    def index_fingerprint(self, index: VectorIndex, dim: int) -> str:
+        """
+        Fingerprint of an index over the current documents, telling whether a saved index can be reused
+
+        Args:
+            index (VectorIndex): Index (its type and parameters, including those of the vector codec, are part of the fingerprint)
+            dim (int): Dimension of the document embeddings
+
+        Returns:
+            str: SHA-256 hex digest of the embedding model, the dimension, the index settings and the document texts
+        """
+        header = json.dumps({'embedder': self.embedder_name, 'dim': dim, 'kind': index.kind, 'params': index.params}, sort_keys=True)
+        return hashlib.sha256('\x00'.join([header] + self.documents).encode('utf-8')).hexdigest()
+
+    def load_or_build_index(self, index_path: Optional[str], get_embeddings, dim: int) -> None:
+        """
+        Load the index saved for the current documents, or build it
+
+        Args:
+            index_path (Optional[str]): Directory of the saved index
+            get_embeddings (Callable[[], np.ndarray]): Returns the embeddings of the current documents (only called to build)
+            dim (int): Dimension of the document embeddings
+        """
+        if not self.documents:
+            self.index = None
+            return
+        self.index = create_index(self.index_type, **self.index_params)
+        fingerprint = self.index_fingerprint(self.index, dim)
+        # Only the header of a saved index is read before deciding to load it.
+        meta = read_index_meta(index_path) if index_path is not None else None
+        if meta is not None and meta['fingerprint'] == fingerprint:
+            self.index = load_index(index_path, meta)
+            self.release_embeddings()
+            return
+        with metrics.timer('index_build'):
+            self.index.build(get_embeddings())
+        self.index.fingerprint = fingerprint
+        if index_path is not None:
+            self.index.save(index_path)
+        self.release_embeddings()
+
+    def sync_documents(self, search_data: List[Dict], index_path: Optional[str] = None) -> None:
+        """
+        Bring the document store in line with the search data: only new documents are encoded,
+        and the index is updated in place instead of being rebuilt
+
+        Args:
+            search_data (List[Dict]): Data for search (records with the same "data" are stored once)
+            index_path (Optional[str]): Directory for saving the index
+        """
+        self.index_path = index_path
+        self.search_data = self.document_store.records
+        self.documents = [item['data'] for item in self.search_data]
+        self.doc_embeddings = None
+        self.load_or_build_index(index_path, lambda: self.document_store.embeddings, self.document_store.dim)
+
+        wanted = {paragraph_id(record): record for record in search_data}
+        self.remove_documents([doc_id for doc_id in self.document_store.ids if doc_id not in wanted])
+        self.upsert_documents(list(wanted.values()))
+
+    def add_documents(self, records: List[Dict]) -> None:
+        """
+        Add documents to the document store and the index (documents already stored are skipped)
+
+        Args:
+            records (List[Dict]): Annotated records with a "data" field
+        """
+        if self.document_store is None:
+            raise ValueError("Adding documents requires a document store (document_store_dir).")
+        self.upsert_documents([record for record in records if paragraph_id(record) not in self.document_store])
+
+    def upsert_documents(self, records: List[Dict]) -> None:
+        """
+        Add new documents and replace the stored documents with the same "data" but different labels
+        (their embeddings are reused), keeping the document store and the index in sync
+
+        Args:
+            records (List[Dict]): Annotated records with a "data" field
+        """
+        store = self.document_store
+        if store is None:
+            raise ValueError("Updating documents requires a document store (document_store_dir).")
+        records = list({paragraph_id(record): record for record in records}.values())
+        changed = [record for record in records if paragraph_id(record) in store and store.records[store.positions[paragraph_id(record)]] != record]
+        new = [record for record in records if paragraph_id(record) not in store]
+        if not changed and not new:
+            return
+        embeddings = [store.get_embeddings([paragraph_id(record) for record in changed])] if changed else []
+        if new:
+            embeddings.append(np.asarray(self.embed_documents([record['data'] for record in new]), dtype=np.float32))
+        embeddings = np.concatenate(embeddings)
+        removed_positions = store.upsert(changed + new, embeddings)
+        metrics.increment('documents_upserted', len(changed) + len(new))
+        self._update_index(removed_positions, embeddings)
+
+    def remove_documents(self, documents: List) -> None:
+        """
+        Remove documents from the document store and the index
+
+        Args:
+            documents (List): Records or document IDs (see checkpoint.paragraph_id)
+        """
+        if self.document_store is None:
+            raise ValueError("Removing documents requires a document store (document_store_dir).")
+        doc_ids = [document if isinstance(document, str) else paragraph_id(document) for document in documents]
+        removed_positions = self.document_store.remove(doc_ids)
+        if removed_positions:
+            metrics.increment('documents_removed', len(removed_positions))
+            self._update_index(removed_positions, None)
+
+    def _update_index(self, removed_positions: List[int], added_embeddings: Optional[np.ndarray]) -> None:
+        # The store is compacted from time to time, and the index is then rebuilt (e.g. to refit the IVF clusters).
+        store = self.document_store
+        rebuild = self.index is None or self.index.size == 0
+        if store.needs_compaction():
+            store.compact()
+            rebuild = True
+        if not rebuild:
+            if removed_positions:
+                self.index.remove(removed_positions)
+            if added_embeddings is not None:
+                self.index.add(added_embeddings)
+        self.search_data = store.records
+        self.documents = [item['data'] for item in self.search_data]
+        if rebuild:
+            self.index = None
+            if self.documents:
+                self.index = create_index(self.index_type, **self.index_params)
+                with metrics.timer('index_build'):
+                    self.index.build(store.embeddings)
+        if self.index is not None:
+            self.index.fingerprint = self.index_fingerprint(self.index, self.index.dim)
+            if self.index_path is not None:
+                self.index.save(self.index_path)
+
+    def document_embeddings(self) -> np.ndarray:
+        """
+        float32 embeddings of the current search data (read from the document store,
+        or encoded again through the embedding cache if the index only keeps a compact copy)
+
+        Returns:
+            np.ndarray: Embeddings in the order of search_data
+        """
+        if self.document_store is not None:
+            return self.document_store.embeddings
+        if getattr(self, 'doc_embeddings', None) is not None:
+            return self.doc_embeddings
+        return self.embed_documents(self.documents)
+
+    def release_embeddings(self) -> None:
+        # The float32 embeddings are not kept when the index stores its own compact copy of the vectors.
+        if self.index_params.get('precision', 'float32') != 'float32' or self.index_params.get('dims') is not None:
+            self.doc_embeddings = None
+
+    def encode_documents(self, documents: List[str]) -> np.ndarray:
+        """
+        Encode the documents with the configured batch size and number of worker processes
+        (a shared query embedder such as BatchingEmbedder is bypassed through its "document_encoder")
+
+        Args:
+            documents (List[str]): Texts to be encoded
+
+        Returns:
+            np.ndarray: Embeddings in the same order as the documents
+        """
+        encoder = getattr(self.embedder, 'document_encoder', self.embedder)
+        return encode_texts(encoder, documents, batch_size=self.encode_batch_size, workers=self.encode_workers)
 
     # Retrieve the top 6 items from the target search data with the highest cosine similarity to the input paragraph.
     def get_relevant_context(self, query: str, top_k: int = 6) -> List[Dict]:
@@ -38,118 +390,227 @@ class RAGModel:
         Returns:
             List[Dict]: List of relevant documents
         """
-        query_embedding = self.embedder.encode([query])
-        similarities = cosine_similarity(query_embedding, self.doc_embeddings)[0]
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
-        return [self.search_data[i] for i in top_indices]
+        return self.get_relevant_contexts([query], top_k=top_k)[0]
+
+    def get_relevant_contexts(self, queries: List[str], top_k: int = 6, batch_size: int = 32) -> List[List[Dict]]:
+        """
+        Retrieve the top documents for many queries at once
+
+        Args:
+            queries (List[str]): Input queries
+            top_k (int): Number of documents to retrieve per query
+            batch_size (int): Mini-batch size for encoding the queries
+
+        Returns:
+            List[List[Dict]]: List of relevant documents for each query (in the order of the queries)
+        """
+        if not queries:
+            return []
+        if not self.documents:
+            # Nothing to search (empty search data or document store), so there is no index either.
+            return [[] for _ in queries]
+        # Without a reranker the first stage returns the top_k documents directly.
+        pool = min(max(top_k, self.candidate_pool) if self.reranker is not None else top_k, len(self.documents))
+        top_indices = self.first_stage_candidates(queries, pool, batch_size=batch_size)
+        if self.reranker is not None:
+            top_indices = self.rerank_candidates(queries, top_indices, top_k)
+        metrics.increment('queries', len(queries))
+        return [[self.search_data[i] for i in row] for row in top_indices]
+
+    def first_stage_candidates(self, queries: List[str], pool: int, batch_size: int = 32) -> np.ndarray:
+        """
+        Find the candidate documents of each query with the first stage ("embedding" or "bm25" by candidate_source)
+
+        Args:
+            queries (List[str]): Input queries
+            pool (int): Number of candidates per query
+            batch_size (int): Mini-batch size for encoding the queries
+
+        Returns:
+            np.ndarray: Document indices (n_queries x pool), best first
+        """
+        if self.candidate_source == 'bm25':
+            with metrics.timer('bm25_retrieval'):
+                return self.bm25.search(queries, pool)
+        with metrics.timer('query_encoding'):
+            query_embeddings = self.embedder.encode(queries, batch_size=batch_size)
+        with metrics.timer('retrieval'):
+            return np.asarray(self.search_embeddings(query_embeddings, pool))
+
+    def rerank_candidates(self, queries: List[str], candidates: np.ndarray, top_k: int = 6) -> np.ndarray:
+        """
+        Reorder the first-stage candidates of each query with the reranker and keep the best top_k
+
+        Args:
+            queries (List[str]): Input queries
+            candidates (np.ndarray): Candidate document indices (n_queries x pool), in the order of the first stage
+            top_k (int): Number of documents to keep per query
+
+        Returns:
+            np.ndarray: Document indices (n_queries x top_k), best first
+        """
+        with metrics.timer('rerank'):
+            bm25 = self.bm25 if self.reranker.uses_bm25 else None
+            return self.reranker.rerank(queries, np.asarray(candidates), self.documents, bm25)[:, :top_k]
+
+    def search_embeddings(self, query_embeddings: np.ndarray, top_k: int = 6) -> np.ndarray:
+        """
+        Find the indices of the documents with the highest cosine similarity to each query embedding
+
+        Args:
+            query_embeddings (np.ndarray): Query embeddings (n_queries x dim)
+            top_k (int): Number of documents to retrieve per query
+
+        Returns:
+            np.ndarray: Document indices (n_queries x top_k), most similar first
+        """
+        return self.index.search(query_embeddings, top_k)
 
     def extract_json_text(self, text: str) -> Optional[str]:
-        # Extract only the JSON data (the part enclosed in "{}").
-        json_pattern = re.compile(r'\{[^{}]*\}')
-        matches = json_pattern.findall(text)
-        
-        if matches:
-            try:
-                json_obj = json.loads(matches[0])
-                return json.dumps(json_obj, ensure_ascii=False, indent=2)
-            except json.JSONDecodeError:
-                pass        
-        return None
+        # Extract only the JSON data (the last "{...}" object with labels, nested braces and code fences are handled).
+        json_obj, _ = extract_json_object(text)
+        if json_obj is None:
+            return None
+        return json.dumps(json_obj, ensure_ascii=False, indent=2)
 
-# The parts of the prompt that explains the JSON structure are to be changed according to the language since the JSON structure differs for each language's dataset.
+    def build_messages(self, paragraph: str, relevant_docs: Optional[List[Dict]] = None) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for annotating a paragraph, referencing similar data.
+
+        Args:
+            paragraph (str): Input paragraph text
+            relevant_docs (Optional[List[Dict]]): Pre-retrieved similar data (retrieved here if not given)
+
+        Returns:
+            List[Dict[str, str]]: System and user messages
+        """
+        if relevant_docs is None:
+            relevant_docs = self.get_relevant_context(paragraph)
+        return self.prompt_builder.build(paragraph, relevant_docs)
+
+    def get_cached_completion(self, messages: List[Dict[str, str]]) -> Optional['ChatCompletion']:
+        """
+        Look up the response of an identical earlier request
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+
+        Returns:
+            Optional[ChatCompletion]: Cached API response, or None if there is no cache or no entry
+        """
+        if self.response_cache is None:
+            return None
+        cached = self.response_cache.get(request_key(self.model_name, messages, self.completion_params))
+        if cached is None:
+            return None
+        from openai.types.chat import ChatCompletion
+
+        metrics.increment('response_cache_hits')
+        return ChatCompletion.model_validate_json(cached)
+
+    def request_completion(self, messages: List[Dict[str, str]], client: Optional['OpenAI'] = None, check_cache: bool = True) -> 'ChatCompletion':
+        """
+        Send the messages to the LLM
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+            client (Optional[OpenAI]): Client to use instead of the shared one (e.g. with different retry options)
+            check_cache (bool): Look up the response cache first (the response is stored in any case)
+
+        Returns:
+            ChatCompletion: Raw API response
+        """
+        if check_cache:
+            cached = self.get_cached_completion(messages)
+            if cached is not None:
+                return cached
+        client = client or self.client
+        with metrics.timer('llm_request'):
+            response = client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                **self.completion_params
+            )
+        self.store_completion(messages, response)
+        return response
+
+    def store_completion(self, messages: List[Dict[str, str]], response: 'ChatCompletion') -> None:
+        """
+        Record the token usage of a new API response and add it to the response cache
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages of the request
+            response (ChatCompletion): Raw API response
+        """
+        metrics.record_usage(self.model_name, response.usage)
+        if self.response_cache is not None:
+            self.response_cache.put(request_key(self.model_name, messages, self.completion_params), response.model_dump_json())
+
+    def parse_response(self, content: str) -> str:
+        """
+        Extract only the content generated by GPT from the response data containing a lot of information, and format it in JSON.
+
+        Args:
+            content (str): Message content generated by the LLM
+
+        Returns:
+            str: Annotation results in JSON format
+
+        Raises:
+            OutputParseError: If the content has no annotation with valid labels
+        """
+        return json.dumps(parse_annotation(content), indent=2, ensure_ascii=False)
+
+    def repair_messages(self, messages: List[Dict[str, str]], content: str, error: OutputParseError) -> List[Dict[str, str]]:
+        """
+        Build the messages asking the LLM to correct an invalid answer (only the problems are sent back, not a new annotation request)
+
+        Args:
+            messages (List[Dict[str, str]]): Messages of the request
+            content (str): Invalid message content generated by the LLM
+            error (OutputParseError): Problems of the content
+
+        Returns:
+            List[Dict[str, str]]: Messages of the follow-up request
+        """
+        return messages + [{"role": "assistant", "content": content}, {"role": "user", "content": repair_prompt(error)}]
+
+    def complete_with_repairs(self, messages: List[Dict[str, str]], complete) -> str:
+        """
+        Request an annotation and re-ask up to max_repairs times while the answer is invalid
+
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+            complete (Callable): Function sending messages and returning the raw API response
+
+        Returns:
+            str: Annotation results in JSON format
+        """
+        content = complete(messages).choices[0].message.content
+        for attempt in range(self.max_repairs + 1):
+            try:
+                result = self.parse_response(content)
+            except OutputParseError as e:
+                if attempt == self.max_repairs:
+                    raise
+                metrics.increment('output_reasks')
+                messages = self.repair_messages(messages, content, e)
+                content = complete(messages).choices[0].message.content
+                continue
+            if attempt > 0:
+                metrics.increment('output_repaired_by_reask')
+            return result
 
-    def analyze_paragraph(self, paragraph: str) -> Dict[str, str]:
+    def analyze_paragraph(self, paragraph: str, relevant_docs: Optional[List[Dict]] = None) -> Dict[str, str]:
         """
         Generate annotation results from paragraph text using an LLM, referencing similar data.
 
         Args:
             paragraph (str): Input paragraph text
+            relevant_docs (Optional[List[Dict]]): Pre-retrieved similar data (retrieved here if not given)
 
         Returns:
             Dict[str, str]: Annotation results in JSON format
         """
-        relevant_docs = self.get_relevant_context(paragraph)
-        context = "\n".join([json.dumps(doc, ensure_ascii=False, indent=2) for doc in relevant_docs])
-
-        prompt = f"""
-        You are an expert in extracting ESG-related promise and their corresponding evidence from corporate reports that describe ESG matters.
-        Follow the instructions below to provide careful and consistent annotations.
-        Output the results in the following JSON format.
-        Ensure that your response is a valid JSON object.
-        Do not include any text before or after the JSON object.:
-        {{
-            "data": str,
-            "promise_status": str,
-            "promise_string": str or null,
-            "verification_timeline": str,
-            "evidence_status": str,
-            "evidence_string": str or null,
-            "evidence_quality": str
-        }}:
-        Although you are specified to output in JSON format, perform the thought process in natural language and output the result in JSON format at the end.
-        
-        Annotation procedure:
-        1. You will be given the content of a paragraph.
-        2. Determine if a promise is included, and indicate "Yes" if included, "No" if not included. (promise_status)
-        3. If a promise is included (if promise_status is "Yes"), also provide the following information:
-        - The specific part of the promise (extract verbatim from the text without changing a single word) (promise_string)
-        - When the promise can be verified ("already", "within_2_years", "between_2_and_5_years", "more_than_5_years", "N/A") (verification_timeline)
-        - Whether evidence is included ("Yes", "No", "N/A") (evidence_status)
-        4. If evidence is included (if evidence_status is "Yes"), also provide the following information:
-        - The part containing the evidence (extract directly from the text without changing a single word) (evidence_string)
-        - The quality of the relationship between the promise and evidence ("Clear", "Not Clear", "Misleading", "N/A") (evidence_quality)
-           
-        Definitions and criteria for annotation labels:
-        1. promise_status - A promise is composed of a statement (a company principle, commitment, or strategy related to ESG criteria).:
-        - "Yes": A promise exists.
-        - "No": No promise exists.
-        
-        2. verification_timeline - The Verification Timeline is the assessment of when we could possibly see the final results of a given ESG-related action and thus verify the statement.:
-        - "already": Qualifies ESG-related measures that have already been and keep on being applied and every small measure whose results can already be verified anyway.
-        - "within_2_years": ESG-related measures whose results can be verified within 2 years.
-        - "between_2_and_5_years": ESG-related measures whose results can be verified in 2 to 5 years.
-        - "more_than_5_years: ESG-related measures whose results can be verified in more than 5 years.
-        - "N/A": When no promise exists.
-
-        3. evidence_status - Pieces of evidence are elements deemed the most relevant to exemplify and prove the core promise is being kept, which includes but is not limited to simple examples, company measures, numbers, etc.:
-        - "Yes": Evidence supporting the promise exists.
-        - "No": No evidence for the promise exists.
-        - "N/A": When no promise exists.
-
-        4. evidence_quality - The Evidence Quality is the assessment of the company's ability to back up their statement with enough clarity and precision.:
-        - "Clear": There is no lack of information and what is said is intelligible and logical.
-        - "Not Clear": An information is missing so much so that what is said may range from intelligible and logical to superficial and/or superfluous.
-        - "Misleading": The evidence, whether true or not, has no obvious connection with the point raised and is used to divert attention.
-        - "N/A": When no evidence or promise exists.
-        
-        Important notes:
-        - Consider the context thoroughly. It's important to understand the meaning of the entire paragraph, not just individual sentences.
-        - For indirect evidence, carefully judge its relevance.
-        - "promise_string" and "evidence_string" should be extracted verbatim from the original text. If there is no corresponding text (when promise_status or evidence_status is No), output a blank.
-        - Understand and appropriately interpret industry-specific terms.
-
-        The following are annotation examples of texts similar to the text you want to analyze.
-        Refer to these examples, think about why these examples have such annotation results, and then output the results.
-        Examples for your reference are as follows:
-        {context}
-
-        Analyze the following text and provide results in the format described above:
-        {paragraph}
-        """
-
-        client = OpenAI(api_key = openai.api_key)
-        response = client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": "You are an expert in extracting ESG-related promise and their corresponding evidence from corporate reports that describe ESG matters."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
-        
-        # Extract only the content generated by GPT from the response data containing a lot of information, and format it in JSON.
-        generated_text = self.extract_json_text(response.choices[0].message.content)        
-        load_generated_text = json.loads(generated_text)
-        
-        result = json.dumps(load_generated_text, indent=2, ensure_ascii=False)
-        return result
\ No newline at end of file
+        messages = self.build_messages(paragraph, relevant_docs)
+        return self.complete_with_repairs(messages, self.request_completion)
@@ -0,0 +1,323 @@
+import json
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from src.embedding_cache import text_key
+from src.instrumentation import metrics
+from src.vector_index import top_k_indices
+
+# Second retrieval stage: a candidate pool (the top candidate_pool documents of the embedding index, or of a BM25 index)
+# is reordered by a reranker before the top_k examples are put in the prompt.
+# "bm25" ranks the pool by lexical similarity, "hybrid" fuses the first-stage and BM25 ranks (reciprocal rank fusion),
+# and "cross_encoder" scores every (paragraph, example) pair with a cross-encoder on the CPU, caching the scores.
+
+# Default cross-encoder (multilingual, small enough for the CPU).
+CROSS_ENCODER_MODEL_NAME = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1'
+
+_WORD = re.compile(r'\w+')
+_BIGRAM = re.compile(r'(?=(\w\w))')
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into BM25 terms: lowercase words for alphabetic scripts,
+    character bigrams for scripts written without spaces (e.g. Japanese and Chinese)
+
+    Args:
+        text (str): Text
+
+    Returns:
+        List[str]: Terms
+    """
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word.isascii() or len(word) == 1:
+            terms.append(word)
+        else:
+            terms.extend(_BIGRAM.findall(word))
+    return terms
+
+class BM25Index:
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        """
+        Okapi BM25 index over the documents (postings are kept as flat arrays sorted by term)
+
+        Args:
+            documents (List[str]): Texts of the documents
+            k1 (float): Term frequency saturation
+            b (float): Document length normalization
+        """
+        self.size = len(documents)
+        self.vocabulary: Dict[str, int] = {}
+        term_ids, frequencies, terms_per_document = [], [], []
+        lengths = np.zeros(self.size, dtype=np.float64)
+        for doc_id, document in enumerate(documents):
+            counts = Counter(tokenize(document))
+            term_ids.extend([self.vocabulary.setdefault(term, len(self.vocabulary)) for term in counts])
+            frequencies.extend(counts.values())
+            terms_per_document.append(len(counts))
+            lengths[doc_id] = sum(counts.values())
+
+        # One posting per (term, document) with its term frequency, sorted by term.
+        posting_terms = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(posting_terms, kind='stable')
+        posting_terms = posting_terms[order]
+        self.posting_docs = np.repeat(np.arange(self.size), terms_per_document)[order]
+        frequencies = np.array(frequencies, dtype=np.float64)[order]
+        self.offsets = np.searchsorted(posting_terms, np.arange(len(self.vocabulary) + 1))
+        document_frequencies = np.diff(self.offsets)
+        idf = np.log(1 + (self.size - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        average_length = lengths.mean() if self.size else 0.0
+        normalized_lengths = 1 - b + b * lengths / average_length if average_length > 0 else np.ones(self.size)
+        # The score of a term in a document does not depend on the query, so it is computed once per posting.
+        self.weights = idf[posting_terms] * frequencies * (k1 + 1) / (frequencies + k1 * normalized_lengths[self.posting_docs])
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        BM25 score of every document for a query
+
+        Args:
+            query (str): Query text
+
+        Returns:
+            np.ndarray: Scores (n_documents)
+        """
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        postings = [np.arange(self.offsets[term_id], self.offsets[term_id + 1]) for term_id in term_ids]
+        if not postings:
+            return np.zeros(self.size)
+        postings = np.concatenate(postings)
+        return np.bincount(self.posting_docs[postings], weights=self.weights[postings], minlength=self.size)
+
+    def search(self, queries: List[str], top_k: int) -> np.ndarray:
+        """
+        Find the documents with the highest BM25 score for each query
+
+        Args:
+            queries (List[str]): Query texts
+            top_k (int): Number of documents per query
+
+        Returns:
+            np.ndarray: Document indices (n_queries x top_k), highest score first
+        """
+        if not queries:
+            return np.empty((0, min(top_k, self.size)), dtype=np.int64)
+        return top_k_indices(np.stack([self.scores(query) for query in queries]), min(top_k, self.size))
+
+class ScoreCache:
+    def __init__(self, file_path: Optional[str] = None, max_entries: int = 200000, save_interval: int = 1000):
+        """
+        LRU cache of reranker scores, optionally saved to a JSON file so that later runs reuse them
+
+        Args:
+            file_path (Optional[str]): Path of the JSON file (kept in memory only if None)
+            max_entries (int): Maximum number of scores, the least recently used ones are evicted first
+            save_interval (int): Number of new scores after which save_if_due() rewrites the file
+        """
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self.scores: OrderedDict = OrderedDict()
+        # Number of scores added since the file was last written.
+        self.unsaved = 0
+        self.lock = threading.Lock()
+        # Serializes the writes of the file, so that an older snapshot never replaces a newer one.
+        self.save_lock = threading.Lock()
+        if file_path is not None and os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                self.scores.update(json.load(f))
+
+    def get(self, key: str) -> Optional[float]:
+        with self.lock:
+            score = self.scores.get(key)
+            if score is None:
+                metrics.increment('rerank_cache_misses')
+                return None
+            self.scores.move_to_end(key)
+            metrics.increment('rerank_cache_hits')
+            return score
+
+    def put(self, key: str, score: float) -> None:
+        with self.lock:
+            self.scores[key] = score
+            self.scores.move_to_end(key)
+            self.unsaved += 1
+            while len(self.scores) > self.max_entries:
+                self.scores.popitem(last=False)
+
+    def save(self) -> None:
+        """
+        Write the scores to the file if any were added since the last save
+        """
+        with self.save_lock:
+            with self.lock:
+                if self.file_path is None or not self.unsaved:
+                    return
+                scores = dict(self.scores)
+                self.unsaved = 0
+            temporary_path = self.file_path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump(scores, f)
+            os.replace(temporary_path, self.file_path)
+
+    def save_if_due(self) -> None:
+        # Rewriting the whole file costs O(cache size), so it is done once per save_interval new scores (and on close).
+        with self.lock:
+            due = self.unsaved >= self.save_interval
+        if due:
+            self.save()
+
+class Reranker:
+    # Whether rerank() needs the BM25 index of the documents.
+    uses_bm25 = False
+
+    def rerank(self, queries: List[str], candidates: np.ndarray, documents: List[str], bm25: Optional[BM25Index] = None) -> np.ndarray:
+        """
+        Reorder the candidate documents of each query
+
+        Args:
+            queries (List[str]): Query texts
+            candidates (np.ndarray): Candidate document indices (n_queries x pool), in the order of the first stage
+            documents (List[str]): Texts of all documents
+            bm25 (Optional[BM25Index]): BM25 index of the documents (given if uses_bm25)
+
+        Returns:
+            np.ndarray: The candidates of each query, best first
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Save the state kept for later runs (e.g. the cached scores)
+        """
+
+class BM25Reranker(Reranker):
+    uses_bm25 = True
+
+    def rerank(self, queries: List[str], candidates: np.ndarray, documents: List[str], bm25: Optional[BM25Index] = None) -> np.ndarray:
+        scores = np.stack([bm25.scores(query)[row] for query, row in zip(queries, candidates)])
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(candidates, order, axis=1)
+
+class HybridReranker(Reranker):
+    uses_bm25 = True
+
+    def __init__(self, bm25_weight: float = 0.5, rank_constant: int = 60):
+        """
+        Reciprocal rank fusion of the first-stage (embedding) ranks and the BM25 ranks within the pool
+
+        Args:
+            bm25_weight (float): Weight of the BM25 rank (the first-stage rank has 1 - bm25_weight)
+            rank_constant (int): Constant added to the ranks (larger values flatten the fusion)
+        """
+        self.bm25_weight = bm25_weight
+        self.rank_constant = rank_constant
+
+    def rerank(self, queries: List[str], candidates: np.ndarray, documents: List[str], bm25: Optional[BM25Index] = None) -> np.ndarray:
+        ranks = np.arange(candidates.shape[1])
+        lexical_scores = np.stack([bm25.scores(query)[row] for query, row in zip(queries, candidates)])
+        lexical_ranks = np.argsort(np.argsort(-lexical_scores, axis=1, kind='stable'), axis=1)
+        fused = (1 - self.bm25_weight) / (self.rank_constant + ranks) + self.bm25_weight / (self.rank_constant + lexical_ranks)
+        order = np.argsort(-fused, axis=1, kind='stable')
+        return np.take_along_axis(candidates, order, axis=1)
+
+class CrossEncoderReranker(Reranker):
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL_NAME, batch_size: int = 32, max_length: int = 512,
+                 cache_path: Optional[str] = None, cache_size: int = 200000, cache_save_interval: int = 1000, model=None):
+        """
+        Cross-encoder reranker (the model is loaded on first use and runs on the CPU unless a device is configured)
+
+        Args:
+            model_name (str): Name of the sentence-transformers CrossEncoder model
+            batch_size (int): Number of pairs scored together
+            max_length (int): Maximum number of tokens of a pair
+            cache_path (Optional[str]): JSON file of the score cache (in memory only if None)
+            cache_size (int): Maximum number of cached scores
+            cache_save_interval (int): Number of new scores between two writes of the cache file (it is also written by close())
+            model: Object with a CrossEncoder-compatible "predict" to use instead of loading the model (e.g. a stub)
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._model = model
+        self.cache = ScoreCache(cache_path, cache_size, cache_save_interval)
+        # The model is loaded and called by one thread at a time (e.g. by the handler threads of the retrieval service).
+        self.model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            with metrics.timer('reranker_load'):
+                self._model = CrossEncoder(self.model_name, max_length=self.max_length, device='cpu')
+        return self._model
+
+    def rerank(self, queries: List[str], candidates: np.ndarray, documents: List[str], bm25: Optional[BM25Index] = None) -> np.ndarray:
+        scores = np.empty(candidates.shape, dtype=np.float64)
+        missing = {}
+        for i, (query, row) in enumerate(zip(queries, candidates)):
+            for j, doc_index in enumerate(row):
+                key = text_key(self.model_name, f"{query}\x00{documents[doc_index]}")
+                score = self.cache.get(key)
+                if score is None:
+                    missing.setdefault(key, (query, documents[doc_index], []))[2].append((i, j))
+                else:
+                    scores[i, j] = score
+        # The uncached pairs of all queries are scored in one call, in mini-batches of batch_size.
+        if missing:
+            with self.model_lock:
+                # Pairs scored by another thread while this one was waiting are taken from the cache.
+                entries = []
+                for key, (query, document, positions) in missing.items():
+                    score = self.cache.get(key)
+                    if score is None:
+                        entries.append((key, (query, document, positions)))
+                    else:
+                        for i, j in positions:
+                            scores[i, j] = score
+                if entries:
+                    predicted = self.model.predict([(query, document) for _, (query, document, _) in entries], batch_size=self.batch_size)
+                    metrics.increment('rerank_pairs_scored', len(entries))
+                    for (key, (_, _, positions)), score in zip(entries, np.asarray(predicted, dtype=np.float64).reshape(-1)):
+                        self.cache.put(key, float(score))
+                        for i, j in positions:
+                            scores[i, j] = score
+            self.cache.save_if_due()
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(candidates, order, axis=1)
+
+    def close(self) -> None:
+        self.cache.save()
+
+RERANKERS = {'bm25': BM25Reranker, 'hybrid': HybridReranker, 'cross_encoder': CrossEncoderReranker}
+
+def check_candidate_source(kind: Optional[str], candidate_source: str) -> None:
+    """
+    Reject the rerankers that can only reproduce the order of BM25 candidates
+    ("bm25" sorts them by the same scores, and "hybrid" would fuse the BM25 ranks with themselves)
+
+    Args:
+        kind (Optional[str]): Kind of the reranker (None without reranking)
+        candidate_source (str): First stage of the candidates ("embedding" or "bm25")
+    """
+    if candidate_source == 'bm25' and kind in ('bm25', 'hybrid'):
+        raise ValueError(f"The {kind} reranker does not change the order of BM25 candidates "
+                         f"(use candidate_source 'embedding' or the cross_encoder reranker).")
+
+def create_reranker(kind: str, **params) -> Reranker:
+    """
+    Create a reranker
+
+    Args:
+        kind (str): "bm25", "hybrid" or "cross_encoder"
+        **params: Parameters of the reranker class
+
+    Returns:
+        Reranker: The reranker
+    """
+    if kind not in RERANKERS:
+        raise ValueError(f"Unknown reranker: {kind} (expected one of {list(RERANKERS)})")
+    return RERANKERS[kind](**params)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Local cache of LLM responses in a SQLite file.
+# Entries are keyed by a hash of the model, the messages and the request parameters, so only identical requests hit.
+
+def request_key(model_name: str, messages: List[Dict[str, str]], params: Dict) -> str:
+    """
+    Compute the cache key of a chat completion request
+
+    Args:
+        model_name (str): Name of the LLM
+        messages (List[Dict[str, str]]): Chat messages
+        params (Dict): Other request parameters (e.g. temperature)
+
+    Returns:
+        str: SHA-256 hex digest of the request
+    """
+    payload = json.dumps({'model': model_name, 'messages': messages, 'params': params}, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    def __init__(self, file_path: str, ttl: Optional[float] = None, max_entries: int = 100000):
+        """
+        Open (or create) the response cache
+
+        Args:
+            file_path (str): Path of the SQLite file
+            ttl (Optional[float]): Lifetime of an entry in seconds (entries never expire if None)
+            max_entries (int): Maximum number of entries, the least recently used ones are evicted first
+        """
+        self.file_path = file_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_created ON responses (created)')
+        self.connection.commit()
+        # Running number of entries, so that an insert does not count the whole table (resynchronized by stats()).
+        self.entries = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a response
+
+        Args:
+            key (str): Cache key of the request
+
+        Returns:
+            Optional[str]: Serialized API response, or None if missing or expired
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.connection.commit()
+                self.entries -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Store a response
+
+        Args:
+            key (str): Cache key of the request
+            response (str): Serialized API response
+        """
+        now = time.time()
+        with self.lock:
+            exists = self.connection.execute('SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone() is not None
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)',
+                (key, response, now, now)
+            )
+            if not exists:
+                self.entries += 1
+            self._evict(now)
+            self.connection.commit()
+
+    def _evict(self, now: float) -> None:
+        # Both deletions only visit the rows they remove (through the "created" and "last_used" indexes).
+        if self.ttl is not None:
+            self.entries -= self.connection.execute('DELETE FROM responses WHERE created < ?', (now - self.ttl,)).rowcount
+        if self.entries > self.max_entries:
+            self.entries -= self.connection.execute(
+                'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)',
+                (self.entries - self.max_entries,)
+            ).rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            self.entries = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self.entries}
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,61 @@
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from src.vector_index import compare_indexes, create_index
+
+# Offline evaluation of the retriever alone (no LLM requests): for each index setting, how often the top-k examples
+# share the labels of the test paragraph, how many of the exact top-k an approximate or compact index finds,
+# and how long one query takes. The measurements are those of vector_index.compare_indexes.
+
+# Labels compared between a test paragraph and its retrieved examples.
+EVAL_LABELS = ['promise_status', 'verification_timeline', 'evidence_status', 'evidence_quality']
+
+def evaluate_retrieval(search_data: List[Dict], test_data: List[Dict], doc_embeddings: np.ndarray, query_embeddings: np.ndarray,
+                       settings: List[Dict], ks: List[int] = (1, 3, 6, 10), labels: List[str] = EVAL_LABELS,
+                       encode_query: Optional[Callable[[str], np.ndarray]] = None, n_encode_queries: int = 100) -> Dict:
+    """
+    Evaluate the retrieval of index settings against the exact float32 search
+
+    Args:
+        search_data (List[Dict]): Search data (documents)
+        test_data (List[Dict]): Test data (queries)
+        doc_embeddings (np.ndarray): Embeddings of the search data
+        query_embeddings (np.ndarray): Embeddings of the test data
+        settings (List[Dict]): Index settings ({"index_type": ..., "index_params": {...}}) to evaluate
+        ks (List[int]): Cut-offs of the label agreement and the recall (e.g. candidate values of top_k)
+        labels (List[str]): Labels compared between queries and documents (labels missing from the search data are skipped)
+        encode_query (Optional[Callable[[str], np.ndarray]]): Encodes one paragraph, to report the query encoding latency
+        n_encode_queries (int): Number of paragraphs encoded one by one for that latency
+
+    Returns:
+        Dict: "settings" (one compare_indexes report per setting with its label agreement, the exact search first)
+            and "query_encoding" (latency of encoding one paragraph); no settings if there are no documents or no queries
+    """
+    # Cut-offs beyond the number of documents are lowered to it, as in compare_indexes.
+    ks = sorted({min(k, len(search_data)) for k in ks if k > 0} - {0})
+    if not ks or not test_data:
+        return {'n_documents': len(search_data), 'n_queries': len(test_data), 'ks': ks, 'settings': []}
+    labels = {
+        label: ([record.get(label) for record in test_data], [record.get(label) for record in search_data])
+        for label in labels if any(label in record for record in search_data)
+    }
+
+    # The exact float32 search is the ground truth of the recall (and is compared with itself for its own row).
+    exact_index = create_index('exact')
+    exact_index.build(doc_embeddings)
+    exact_report = compare_indexes(exact_index, exact_index, query_embeddings, ks=ks, labels=labels, encode_query=encode_query,
+                                   queries=[record['data'] for record in test_data[:n_encode_queries]])
+    query_encoding = exact_report.pop('query_encoding', None)
+    reports = [dict({'index_type': 'exact', 'index_params': {}}, **exact_report)]
+    for setting in settings:
+        index = create_index(setting['index_type'], **setting.get('index_params', {}))
+        try:
+            index.build(doc_embeddings)
+        except ImportError as e:
+            print(f"Skipped {setting}: {e}")
+            continue
+        reports.append(dict(setting, **compare_indexes(exact_index, index, query_embeddings, ks=ks, labels=labels)))
+
+    evaluation = {'n_documents': len(search_data), 'n_queries': len(test_data), 'ks': ks, 'settings': reports}
+    if query_encoding is not None:
+        evaluation['query_encoding'] = query_encoding
+    return evaluation
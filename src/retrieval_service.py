@@ -0,0 +1,270 @@
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import numpy as np
+from src.instrumentation import metrics
+
+# One long-lived process holding a single embedding model and a document index per language dataset.
+# Retrieval and annotation requests are served over a local HTTP API:
+#   GET  /languages                                      -> {"languages": {name: number of documents}}
+#   POST /retrieve {"language", "queries", "top_k"}      -> {"results": [[record, ...], ...]}
+#   POST /annotate {"language", "paragraphs", "top_k"}   -> {"results": [annotation or null, ...], "errors": {index: message}}
+#   GET  /metrics                                        -> timing and token usage report
+# Queries of concurrent requests are encoded together (micro-batching), so the model runs on full batches.
+
+class BatchingEmbedder:
+    def __init__(self, embedder, embedder_name: str, max_batch_size: int = 64, max_wait: float = 0.005):
+        """
+        Wrapper of an embedder that merges the small encode calls of concurrent threads into one batch
+
+        Args:
+            embedder: SentenceTransformer or any object with a compatible "encode"
+            embedder_name (str): Name of the model (used as the key of the embedding cache)
+            max_batch_size (int): Maximum number of texts per merged batch (larger calls are encoded directly)
+            max_wait (float): Maximum time in seconds a call waits for other calls to join its batch
+        """
+        self.embedder = embedder
+        self.embedder_name = embedder_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # Only one encode call runs on the model at a time.
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @property
+    def document_encoder(self):
+        # Bulk encoding (documents and index builds) uses the wrapped model directly: full batches gain nothing from
+        # waiting for queries, and worker processes started from this object would not have its batching thread.
+        return self.embedder
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        with self.lock:
+            return np.asarray(self.embedder.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Encode the texts, together with the texts of other threads waiting at the same time
+
+        Args:
+            texts (List[str]): Texts to be encoded
+            batch_size (int): Mini-batch size of a direct call
+
+        Returns:
+            np.ndarray: Embeddings in the same order as the texts
+        """
+        texts = list(texts)
+        if len(texts) >= self.max_batch_size:
+            return self._encode(texts, batch_size)
+        request = {'texts': texts, 'done': threading.Event()}
+        self.queue.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['embeddings']
+
+    def _run(self) -> None:
+        while True:
+            requests = [self.queue.get()]
+            count = len(requests[0]['texts'])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                count += len(request['texts'])
+
+            try:
+                embeddings = self._encode([text for request in requests for text in request['texts']], self.max_batch_size)
+                metrics.increment('query_batches')
+                metrics.increment('query_batch_texts', count)
+                offset = 0
+                for request in requests:
+                    request['embeddings'] = embeddings[offset:offset + len(request['texts'])]
+                    offset += len(request['texts'])
+            except Exception as e:
+                for request in requests:
+                    request['error'] = e
+            finally:
+                for request in requests:
+                    request['done'].set()
+
+class RetrievalService:
+    def __init__(self, models: Dict, engines: Optional[Dict] = None, host: str = '127.0.0.1', port: int = 8100):
+        """
+        HTTP service of the retrieval (and annotation) for several language datasets
+
+        Args:
+            models (Dict[str, RAGModel]): Prepared RAG model of each language, sharing one BatchingEmbedder
+            engines (Optional[Dict[str, AnnotationEngine]]): Annotation engine of each language (annotation is disabled if None)
+            host (str): Host to bind
+            port (int): Port to bind (0 picks a free port)
+        """
+        self.models = models
+        self.engines = engines or {}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def languages(self) -> Dict[str, int]:
+        return {language: len(model.search_data) for language, model in self.models.items()}
+
+    def retrieve(self, language: str, queries: List[str], top_k: int = 6) -> List[List[Dict]]:
+        """
+        Retrieve the similar data of the queries from the dataset of a language
+
+        Args:
+            language (str): Name of the language dataset
+            queries (List[str]): Input queries
+            top_k (int): Number of documents per query
+
+        Returns:
+            List[List[Dict]]: Relevant documents for each query
+        """
+        with metrics.timer('service_retrieve'):
+            return self.models[language].get_relevant_contexts(queries, top_k=top_k)
+
+    def annotate(self, language: str, paragraphs: List[str], top_k: int = 6) -> Dict:
+        """
+        Retrieve the similar data of the paragraphs and annotate them with the LLM
+
+        Args:
+            language (str): Name of the language dataset
+            paragraphs (List[str]): Input paragraph texts
+            top_k (int): Number of examples per paragraph
+
+        Returns:
+            Dict: "results" (annotation of each paragraph, None if it failed) and "errors" (message by paragraph index)
+        """
+        engine = self.engines[language]
+        contexts = self.retrieve(language, paragraphs, top_k)
+        errors = {}
+
+        def on_error(i: int, error: Exception) -> None:
+            errors[i] = repr(error)
+
+        with metrics.timer('service_annotate'):
+            results = engine.annotate(paragraphs, contexts, on_error=on_error)
+        return {
+            'results': [json.loads(result) if result is not None else None for result in results],
+            'errors': errors,
+        }
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: Dict) -> None:
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                path = self.path.rstrip('/')
+                if path == '/languages':
+                    self._send_json(200, {'languages': service.languages()})
+                elif path == '/metrics':
+                    self._send_json(200, metrics.report())
+                else:
+                    self._send_json(404, {'error': f"Unknown path: {self.path}"})
+
+            def do_POST(self):
+                path = self.path.rstrip('/')
+                if path not in ('/retrieve', '/annotate'):
+                    self._send_json(404, {'error': f"Unknown path: {self.path}"})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                    language = request.get('language')
+                    top_k = int(request.get('top_k', 6))
+                except (ValueError, TypeError) as e:
+                    self._send_json(400, {'error': f"Invalid request: {e}"})
+                    return
+                if language is None:
+                    self._send_json(400, {'error': f"Missing \"language\" (expected one of {list(service.models)})"})
+                    return
+                if language not in service.models:
+                    self._send_json(404, {'error': f"Unknown language: {language} (expected one of {list(service.models)})"})
+                    return
+                try:
+                    if path == '/retrieve':
+                        self._send_json(200, {'results': service.retrieve(language, request.get('queries', []), top_k)})
+                    elif language not in service.engines:
+                        self._send_json(404, {'error': f"Annotation is not enabled for {language}"})
+                    else:
+                        self._send_json(200, service.annotate(language, request.get('paragraphs', []), top_k))
+                except Exception as e:
+                    self._send_json(500, {'error': repr(e)})
+
+        return Handler
+
+    def start(self) -> str:
+        """
+        Serve in a background thread
+
+        Returns:
+            str: Base URL of the service
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        for model in self.models.values():
+            if model.reranker is not None:
+                model.reranker.close()
+
+class RetrievalClient:
+    def __init__(self, base_url: str, timeout: float = 600.0):
+        """
+        Client of a RetrievalService
+
+        Args:
+            base_url (str): Base URL of the service, e.g. "http://127.0.0.1:8100"
+            timeout (float): Timeout of each request in seconds
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path: str, body: Optional[Dict] = None) -> Dict:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Retrieval service error {e.code}: {e.read().decode('utf-8', 'replace')}") from e
+
+    def languages(self) -> Dict[str, int]:
+        return self._request('/languages')['languages']
+
+    def retrieve(self, language: str, queries: List[str], top_k: int = 6) -> List[List[Dict]]:
+        return self._request('/retrieve', {'language': language, 'queries': queries, 'top_k': top_k})['results']
+
+    def annotate(self, language: str, paragraphs: List[str], top_k: int = 6) -> Dict:
+        return self._request('/annotate', {'language': language, 'paragraphs': paragraphs, 'top_k': top_k})
@@ -0,0 +1,657 @@
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# Nearest-neighbour indexes over the document embeddings (cosine similarity).
+# "exact" scans every document, "ivf" (inverted file, built here with k-means) and "hnsw" (requires hnswlib) are approximate.
+# "exact" and "ivf" can store the vectors in reduced precision and/or dimension (see VectorCodec) and score them in that form.
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Scale each embedding to unit length (zero vectors are left as they are)
+
+    Args:
+        embeddings (np.ndarray): Embeddings (n x dim)
+
+    Returns:
+        np.ndarray: Normalized float32 embeddings
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Select the indices of the k highest scores of each row, sorted in descending order of score
+
+    Args:
+        scores (np.ndarray): Scores (n_queries x n_documents)
+        k (int): Number of indices per row
+
+    Returns:
+        np.ndarray: Indices (n_queries x k)
+    """
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+PRECISIONS = ('float32', 'float16', 'int8')
+REDUCTIONS = ('pca', 'matryoshka')
+
+class VectorCodec:
+    def __init__(self, precision: str = 'float32', dims: Optional[int] = None, reduction: str = 'pca', seed: int = 42):
+        """
+        Compact storage of normalized embeddings
+
+        Args:
+            precision (str): "float32", "float16" or "int8" (int8 with one float32 scale per vector)
+            dims (Optional[int]): Number of dimensions kept (all if None)
+            reduction (str): "pca" (projection on the principal components of the documents) or
+                "matryoshka" (the first dims dimensions, for models trained with Matryoshka representation learning)
+            seed (int): Random seed of the sample used to fit the PCA
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision} (expected one of {list(PRECISIONS)})")
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction: {reduction} (expected one of {list(REDUCTIONS)})")
+        self.precision = precision
+        self.dims = dims
+        self.reduction = reduction
+        self.seed = seed
+        self.components = None
+
+    def fit(self, vectors: np.ndarray, sample_size: int = 50000) -> None:
+        """
+        Fit the dimension reduction (only needed for "pca")
+
+        Args:
+            vectors (np.ndarray): Normalized document embeddings
+            sample_size (int): Maximum number of documents used to fit the PCA
+        """
+        self.components = None
+        if self.dims is None or self.dims >= vectors.shape[1] or self.reduction != 'pca':
+            return
+        if len(vectors) > sample_size:
+            vectors = vectors[np.random.default_rng(self.seed).choice(len(vectors), sample_size, replace=False)]
+        # Uncentered, so that the inner products (= cosine similarities) are preserved as well as possible by the projection.
+        _, _, vt = np.linalg.svd(vectors, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:self.dims].T, dtype=np.float32)
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Reduce the dimension of normalized embeddings (documents or queries)
+
+        Args:
+            vectors (np.ndarray): Normalized embeddings (n x dim)
+
+        Returns:
+            np.ndarray: float32 embeddings (n x dims)
+        """
+        if self.components is not None:
+            return vectors @ self.components
+        if self.dims is not None and self.dims < vectors.shape[1]:
+            return normalize_embeddings(vectors[:, :self.dims])
+        return vectors
+
+    def quantize(self, vectors: np.ndarray):
+        """
+        Convert reduced embeddings to the storage precision
+
+        Args:
+            vectors (np.ndarray): float32 embeddings (n x dims)
+
+        Returns:
+            Tuple[np.ndarray, Optional[np.ndarray]]: Stored vectors and their scales (None unless int8)
+        """
+        if self.precision == 'float16':
+            return vectors.astype(np.float16), None
+        if self.precision == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return np.asarray(vectors, dtype=np.float32), None
+
+    def similarities(self, queries: np.ndarray, vectors: np.ndarray, scales: Optional[np.ndarray], chunk_size: int = 1024) -> np.ndarray:
+        """
+        Inner products of reduced float32 queries with stored vectors, converting at most chunk_size vectors at a time
+
+        Args:
+            queries (np.ndarray): Reduced queries (n_queries x dims)
+            vectors (np.ndarray): Stored vectors (n_documents x dims)
+            scales (Optional[np.ndarray]): Scales of the stored vectors (int8 only)
+            chunk_size (int): Number of stored vectors converted to float32 at a time
+
+        Returns:
+            np.ndarray: Similarities (n_queries x n_documents)
+        """
+        if vectors.dtype == np.float32:
+            return queries @ vectors.T
+        similarities = np.empty((len(queries), len(vectors)), dtype=np.float32)
+        for start in range(0, len(vectors), chunk_size):
+            end = start + chunk_size
+            similarities[:, start:end] = queries @ vectors[start:end].astype(np.float32).T
+            if scales is not None:
+                similarities[:, start:end] *= scales[start:end]
+        return similarities
+
+    def encode(self, vectors: np.ndarray):
+        """
+        Fit the codec on normalized document embeddings and return their stored form
+
+        Args:
+            vectors (np.ndarray): Normalized document embeddings
+
+        Returns:
+            Tuple[np.ndarray, Optional[np.ndarray]]: Stored vectors and their scales (None unless int8)
+        """
+        self.fit(vectors)
+        return self.quantize(self.transform(vectors))
+
+    def save(self, directory: str) -> None:
+        if self.components is not None:
+            np.save(os.path.join(directory, 'components.npy'), self.components)
+
+    def load(self, directory: str) -> None:
+        path = os.path.join(directory, 'components.npy')
+        self.components = np.load(path) if os.path.exists(path) else None
+
+class VectorIndex:
+    kind = ''
+
+    def __init__(self, **params):
+        self.params = params
+        self.size = 0
+        self.dim = 0
+        self.fingerprint: Optional[str] = None
+
+    def build(self, embeddings: np.ndarray) -> None:
+        """
+        Index the document embeddings
+
+        Args:
+            embeddings (np.ndarray): Document embeddings (n_documents x dim)
+        """
+        raise NotImplementedError
+
+    def search(self, query_embeddings: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        Find the documents with the highest cosine similarity to each query
+
+        Args:
+            query_embeddings (np.ndarray): Query embeddings (n_queries x dim)
+            top_k (int): Number of documents per query
+
+        Returns:
+            np.ndarray: Document indices (n_queries x min(top_k, n_documents)), most similar first
+        """
+        raise NotImplementedError
+
+    def add(self, embeddings: np.ndarray) -> None:
+        """
+        Append documents to a built index (their indices follow the existing ones)
+
+        Args:
+            embeddings (np.ndarray): Embeddings of the new documents
+        """
+        raise NotImplementedError
+
+    def remove(self, positions: List[int]) -> None:
+        """
+        Remove documents from a built index (the indices of the following documents shift down)
+
+        Args:
+            positions (List[int]): Indices of the documents
+        """
+        raise NotImplementedError
+
+    def memory_bytes(self) -> int:
+        """
+        Size of the arrays held by the index
+
+        Returns:
+            int: Number of bytes (0 for indexes kept by an external library)
+        """
+        arrays = list(vars(self).values())
+        if getattr(self, 'codec', None) is not None:
+            arrays.append(self.codec.components)
+        return int(sum(array.nbytes for array in arrays if isinstance(array, np.ndarray)))
+
+    def save(self, directory: str) -> None:
+        """
+        Save the built index
+
+        Args:
+            directory (str): Directory of the index (created if needed)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._save_data(directory)
+        meta = {'kind': self.kind, 'params': self.params, 'size': self.size, 'dim': self.dim, 'fingerprint': self.fingerprint}
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    def _save_data(self, directory: str) -> None:
+        raise NotImplementedError
+
+    def _load_data(self, directory: str) -> None:
+        raise NotImplementedError
+
+class ExactIndex(VectorIndex):
+    kind = 'exact'
+
+    def __init__(self, chunk_size: int = 1024, precision: str = 'float32', dims: Optional[int] = None, reduction: str = 'pca'):
+        """
+        Brute-force index (one matrix multiply per chunk of queries)
+
+        Args:
+            chunk_size (int): Number of queries scored per matrix multiply (bounds the size of the similarity matrix)
+            precision (str): Storage precision of the vectors ("float32", "float16" or "int8")
+            dims (Optional[int]): Number of dimensions kept (all if None)
+            reduction (str): Dimension reduction ("pca" or "matryoshka")
+        """
+        super().__init__(chunk_size=chunk_size, precision=precision, dims=dims, reduction=reduction)
+        self.chunk_size = chunk_size
+        self.codec = VectorCodec(precision, dims, reduction)
+        self.vectors = None
+        self.scales = None
+
+    def build(self, embeddings: np.ndarray) -> None:
+        vectors = normalize_embeddings(embeddings)
+        self.size, self.dim = vectors.shape
+        self.vectors, self.scales = self.codec.encode(vectors)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int) -> np.ndarray:
+        query_embeddings = self.codec.transform(normalize_embeddings(np.atleast_2d(query_embeddings)))
+        k = min(top_k, self.size)
+        results = []
+        for start in range(0, len(query_embeddings), self.chunk_size):
+            similarities = self.codec.similarities(query_embeddings[start:start + self.chunk_size], self.vectors, self.scales)
+            results.append(top_k_indices(similarities, k))
+        return np.vstack(results) if results else np.empty((0, k), dtype=np.int64)
+
+    def add(self, embeddings: np.ndarray) -> None:
+        vectors, scales = self.codec.quantize(self.codec.transform(normalize_embeddings(embeddings)))
+        self.vectors = np.concatenate([self.vectors, vectors])
+        if self.scales is not None:
+            self.scales = np.concatenate([self.scales, scales])
+        self.size = len(self.vectors)
+
+    def remove(self, positions: List[int]) -> None:
+        self.vectors = np.delete(self.vectors, positions, axis=0)
+        if self.scales is not None:
+            self.scales = np.delete(self.scales, positions)
+        self.size = len(self.vectors)
+
+    def _save_data(self, directory: str) -> None:
+        np.save(os.path.join(directory, 'vectors.npy'), self.vectors)
+        if self.scales is not None:
+            np.save(os.path.join(directory, 'scales.npy'), self.scales)
+        self.codec.save(directory)
+
+    def _load_data(self, directory: str) -> None:
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'))
+        if self.codec.precision == 'int8':
+            self.scales = np.load(os.path.join(directory, 'scales.npy'))
+        self.codec.load(directory)
+
+class IVFIndex(VectorIndex):
+    kind = 'ivf'
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8, n_iter: int = 10, seed: int = 42,
+                 precision: str = 'float32', dims: Optional[int] = None, reduction: str = 'pca'):
+        """
+        Inverted file index: documents are clustered by spherical k-means and only the closest clusters are scanned
+
+        Args:
+            n_lists (Optional[int]): Number of clusters (sqrt of the number of documents if None)
+            n_probe (int): Number of clusters scanned per query (more is slower but more accurate)
+            n_iter (int): Number of k-means iterations
+            seed (int): Random seed of the k-means initialization
+            precision (str): Storage precision of the vectors ("float32", "float16" or "int8")
+            dims (Optional[int]): Number of dimensions kept (all if None)
+            reduction (str): Dimension reduction ("pca" or "matryoshka")
+        """
+        super().__init__(n_lists=n_lists, n_probe=n_probe, n_iter=n_iter, seed=seed, precision=precision, dims=dims, reduction=reduction)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.codec = VectorCodec(precision, dims, reduction, seed)
+        self.centroids = None
+        self.vectors = None
+        self.scales = None
+        self.ids = None
+        self.offsets = None
+
+    def _assign(self, vectors: np.ndarray, chunk_size: int = 4096) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[start:start + chunk_size] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk_size)
+        ])
+
+    def build(self, embeddings: np.ndarray) -> None:
+        vectors = normalize_embeddings(embeddings)
+        self.size, self.dim = vectors.shape
+        # The clusters are computed in the reduced space, where the queries are compared with the centroids.
+        self.codec.fit(vectors)
+        vectors = self.codec.transform(vectors)
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(self.size))), self.size)
+        rng = np.random.default_rng(self.seed)
+        self.centroids = vectors[rng.choice(self.size, n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignments = self._assign(vectors)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, vectors)
+            non_empty = np.bincount(assignments, minlength=n_lists) > 0
+            self.centroids[non_empty] = normalize_embeddings(sums[non_empty])
+
+        # Store the vectors grouped by cluster, so that each cluster is a contiguous slice.
+        assignments = self._assign(vectors)
+        self.ids = np.argsort(assignments, kind='stable')
+        self.vectors, self.scales = self.codec.quantize(vectors[self.ids])
+        self.offsets = np.searchsorted(assignments[self.ids], np.arange(n_lists + 1))
+
+    def search(self, query_embeddings: np.ndarray, top_k: int) -> np.ndarray:
+        query_embeddings = self.codec.transform(normalize_embeddings(np.atleast_2d(query_embeddings)))
+        k = min(top_k, self.size)
+        cluster_order = np.argsort(-(query_embeddings @ self.centroids.T), axis=1)
+        results = np.empty((len(query_embeddings), k), dtype=np.int64)
+        for i, query in enumerate(query_embeddings):
+            # Scan at least n_probe clusters, and more if they hold fewer than k documents.
+            slices = []
+            count = 0
+            for probed, cluster in enumerate(cluster_order[i]):
+                if probed >= self.n_probe and count >= k:
+                    break
+                start, end = self.offsets[cluster], self.offsets[cluster + 1]
+                slices.append(np.arange(start, end))
+                count += end - start
+            candidates = np.concatenate(slices)
+            scales = self.scales[candidates] if self.scales is not None else None
+            scores = self.codec.similarities(query[None, :], self.vectors[candidates], scales)[0]
+            results[i] = self.ids[candidates[top_k_indices(scores[None, :], k)[0]]]
+        return results
+
+    def _regroup(self, vectors: np.ndarray, scales: Optional[np.ndarray], ids: np.ndarray, assignments: np.ndarray) -> None:
+        order = np.argsort(assignments, kind='stable')
+        self.vectors = vectors[order]
+        self.scales = scales[order] if scales is not None else None
+        self.ids = ids[order]
+        self.offsets = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        self.size = len(self.ids)
+
+    def add(self, embeddings: np.ndarray) -> None:
+        # New documents join the closest existing cluster (the centroids are only recomputed by a rebuild).
+        vectors = self.codec.transform(normalize_embeddings(embeddings))
+        codes, scales = self.codec.quantize(vectors)
+        assignments = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        self._regroup(
+            np.concatenate([self.vectors, codes]),
+            np.concatenate([self.scales, scales]) if self.scales is not None else None,
+            np.concatenate([self.ids, np.arange(self.size, self.size + len(codes))]),
+            np.concatenate([assignments, self._assign(vectors)])
+        )
+
+    def remove(self, positions: List[int]) -> None:
+        positions = np.unique(positions)
+        assignments = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        keep = ~np.isin(self.ids, positions)
+        ids = self.ids[keep]
+        self._regroup(
+            self.vectors[keep],
+            self.scales[keep] if self.scales is not None else None,
+            ids - np.searchsorted(positions, ids),
+            assignments[keep]
+        )
+
+    def _save_data(self, directory: str) -> None:
+        arrays = {'centroids': self.centroids, 'vectors': self.vectors, 'ids': self.ids, 'offsets': self.offsets}
+        if self.scales is not None:
+            arrays['scales'] = self.scales
+        np.savez(os.path.join(directory, 'ivf.npz'), **arrays)
+        self.codec.save(directory)
+
+    def _load_data(self, directory: str) -> None:
+        data = np.load(os.path.join(directory, 'ivf.npz'))
+        self.centroids, self.vectors, self.ids, self.offsets = data['centroids'], data['vectors'], data['ids'], data['offsets']
+        self.scales = data['scales'] if 'scales' in data else None
+        self.codec.load(directory)
+
+class HNSWIndex(VectorIndex):
+    kind = 'hnsw'
+
+    def __init__(self, M: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        """
+        Hierarchical navigable small world graph (requires the optional "hnswlib" package)
+
+        Args:
+            M (int): Number of links per node
+            ef_construction (int): Size of the candidate list while building
+            ef_search (int): Size of the candidate list while searching (more is slower but more accurate)
+        """
+        super().__init__(M=M, ef_construction=ef_construction, ef_search=ef_search)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+        # hnswlib label of each document position (increasing, removed documents are only marked as deleted in the graph).
+        self.labels = None
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The 'hnsw' index requires hnswlib (pip install hnswlib).") from e
+        return hnswlib
+
+    def build(self, embeddings: np.ndarray) -> None:
+        vectors = normalize_embeddings(embeddings)
+        self.size, self.dim = vectors.shape
+        self.index = self._hnswlib().Index(space='cosine', dim=self.dim)
+        self.index.init_index(max_elements=max(1, self.size), M=self.M, ef_construction=self.ef_construction)
+        self.labels = np.arange(self.size, dtype=np.int64)
+        self.index.add_items(vectors, self.labels)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int) -> np.ndarray:
+        k = min(top_k, self.size)
+        self.index.set_ef(max(self.ef_search, k))
+        labels, _ = self.index.knn_query(normalize_embeddings(np.atleast_2d(query_embeddings)), k=k)
+        return np.searchsorted(self.labels, labels.astype(np.int64))
+
+    def add(self, embeddings: np.ndarray) -> None:
+        # New documents get labels after every label used so far (deleted ones included), which keeps the labels sorted.
+        count = self.index.get_current_count()
+        labels = np.arange(count, count + len(embeddings), dtype=np.int64)
+        if count + len(labels) > self.index.get_max_elements():
+            self.index.resize_index(max(count + len(labels), 2 * self.index.get_max_elements()))
+        self.index.add_items(normalize_embeddings(embeddings), labels)
+        self.labels = np.concatenate([self.labels, labels])
+        self.size = len(self.labels)
+
+    def remove(self, positions: List[int]) -> None:
+        # The nodes stay in the graph (to keep it connected) but are no longer returned.
+        positions = np.unique(positions)
+        for label in self.labels[positions]:
+            self.index.mark_deleted(int(label))
+        self.labels = np.delete(self.labels, positions)
+        self.size = len(self.labels)
+
+    def _save_data(self, directory: str) -> None:
+        self.index.save_index(os.path.join(directory, 'hnsw.bin'))
+        np.save(os.path.join(directory, 'labels.npy'), self.labels)
+
+    def _load_data(self, directory: str) -> None:
+        self.index = self._hnswlib().Index(space='cosine', dim=self.dim)
+        self.index.load_index(os.path.join(directory, 'hnsw.bin'))
+        self.labels = np.load(os.path.join(directory, 'labels.npy'))
+
+INDEX_TYPES = {index_class.kind: index_class for index_class in (ExactIndex, IVFIndex, HNSWIndex)}
+
+def create_index(kind: str = 'exact', **params) -> VectorIndex:
+    """
+    Create an empty index of the given type
+
+    Args:
+        kind (str): "exact", "ivf" or "hnsw"
+        **params: Parameters of the index type
+
+    Returns:
+        VectorIndex: Index to be built
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {kind} (expected one of {list(INDEX_TYPES)})")
+    return INDEX_TYPES[kind](**params)
+
+def read_index_meta(directory: str) -> Optional[Dict]:
+    """
+    Read the header of a saved index (type, parameters, size, dimension and fingerprint) without loading its data
+
+    Args:
+        directory (str): Directory of the index
+
+    Returns:
+        Optional[Dict]: Contents of meta.json, or None if no index is saved there
+    """
+    path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_index(directory: str, meta: Optional[Dict] = None) -> VectorIndex:
+    """
+    Load an index saved with VectorIndex.save
+
+    Args:
+        directory (str): Directory of the index
+        meta (Optional[Dict]): Header already read with read_index_meta (read here if None)
+
+    Returns:
+        VectorIndex: Built index
+    """
+    if meta is None:
+        meta = read_index_meta(directory)
+    index = create_index(meta['kind'], **meta['params'])
+    index.size = meta['size']
+    index.dim = meta['dim']
+    index.fingerprint = meta['fingerprint']
+    index._load_data(directory)
+    return index
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """
+    Summarize latencies
+
+    Args:
+        seconds (List[float]): Latency of each call in seconds
+
+    Returns:
+        Dict[str, float]: Mean and 50th/90th/95th/99th percentiles in milliseconds
+    """
+    values = np.asarray(seconds, dtype=np.float64) * 1000
+    if values.size == 0:
+        return {}
+    summary = {'mean_ms': float(values.mean())}
+    for q in (50, 90, 95, 99):
+        summary[f'p{q}_ms'] = float(np.percentile(values, q))
+    return summary
+
+def label_agreement(query_labels: List, document_labels: List, neighbours: np.ndarray, ks: List[int]) -> Dict[str, float]:
+    """
+    Label agreement of the retrieved documents with their query, for several k at once
+
+    Args:
+        query_labels (List): Label of each query
+        document_labels (List): Label of each document
+        neighbours (np.ndarray): Document indices (n_queries x max_k), most similar first
+        ks (List[int]): Cut-offs (at most max_k)
+
+    Returns:
+        Dict[str, float]: "agreement@k" (mean fraction of the top-k with the query's label),
+            "majority@k" (fraction of queries whose label is the most frequent in the top-k, ties go to the first category in sorted order)
+            and "chance" (agreement expected from random documents)
+    """
+    categories = sorted({str(label) for label in document_labels} | {str(label) for label in query_labels})
+    index = {category: code for code, category in enumerate(categories)}
+    query_codes = np.array([index[str(label)] for label in query_labels])
+    document_codes = np.array([index[str(label)] for label in document_labels])
+    neighbour_codes = document_codes[neighbours]
+
+    matches = np.cumsum(neighbour_codes == query_codes[:, None], axis=1)
+    votes = np.cumsum(np.eye(len(categories), dtype=np.int32)[neighbour_codes], axis=1)
+    results = {}
+    for k in ks:
+        results[f'agreement@{k}'] = float((matches[:, k - 1] / k).mean())
+        results[f'majority@{k}'] = float((votes[:, k - 1].argmax(axis=1) == query_codes).mean())
+    query_share = np.bincount(query_codes, minlength=len(categories)) / len(query_codes)
+    document_share = np.bincount(document_codes, minlength=len(categories)) / len(document_codes)
+    results['chance'] = float(query_share @ document_share)
+    return results
+
+def compare_indexes(exact_index: VectorIndex, approximate_index: VectorIndex, query_embeddings: np.ndarray, top_k: int = 6,
+                    ks: Optional[List[int]] = None, labels: Optional[Dict[str, Tuple[List, List]]] = None,
+                    encode_query: Optional[Callable[[str], np.ndarray]] = None, queries: Optional[List[str]] = None) -> Dict:
+    """
+    Measure the recall and the latency of an approximate index against the exact one,
+    and optionally the label agreement of its results and the latency of encoding a query
+
+    Args:
+        exact_index (VectorIndex): Exact index (ground truth)
+        approximate_index (VectorIndex): Index to be compared, built on the same embeddings
+        query_embeddings (np.ndarray): Query embeddings
+        top_k (int): Number of documents per query
+        ks (Optional[List[int]]): Cut-offs of the recall and the label agreement (only top_k if None)
+        labels (Optional[Dict[str, Tuple[List, List]]]): Labels of the queries and of the documents, by label name
+        encode_query (Optional[Callable[[str], np.ndarray]]): Encodes one query text, to measure the query encoding latency
+        queries (Optional[List[str]]): Query texts encoded one by one with encode_query
+
+    Returns:
+        Dict: recall@k (the top-k overlap with the exact index) for each k, per-query search latency
+            (mean, p50, p90, p95, p99 in milliseconds) and memory (MB) of both indexes,
+            "labels" (label_agreement of the approximate index for each label) if labels are given
+            and "query_encoding" (latency summary) if encode_query is given;
+            empty if there are no documents, no queries or no positive cut-off
+    """
+    # Cut-offs beyond the number of documents are lowered to it.
+    ks = sorted({min(k, exact_index.size) for k in (ks or [top_k]) if k > 0} - {0})
+    if not ks or len(query_embeddings) == 0:
+        return {}
+    max_k = ks[-1]
+
+    def timed_search(index: VectorIndex):
+        results = np.empty((len(query_embeddings), max_k), dtype=np.int64)
+        seconds = []
+        for i, query in enumerate(query_embeddings):
+            start = time.perf_counter()
+            results[i] = index.search(query[None, :], max_k)[0]
+            seconds.append(time.perf_counter() - start)
+        return results, seconds
+
+    exact_results, exact_seconds = timed_search(exact_index)
+    approximate_results, approximate_seconds = timed_search(approximate_index)
+    report = {}
+    for k in ks:
+        overlap = [len(set(e[:k]) & set(a[:k])) / k for e, a in zip(exact_results, approximate_results)]
+        report[f'recall@{k}'] = float(np.mean(overlap))
+    report.update({f'exact_{key}': value for key, value in latency_summary(exact_seconds).items()})
+    report.update({f'approximate_{key}': value for key, value in latency_summary(approximate_seconds).items()})
+    report['exact_mb'] = exact_index.memory_bytes() / 2 ** 20
+    report['approximate_mb'] = approximate_index.memory_bytes() / 2 ** 20
+    if labels:
+        report['labels'] = {name: label_agreement(query_labels, document_labels, approximate_results, ks)
+                            for name, (query_labels, document_labels) in labels.items()}
+    if encode_query is not None and queries:
+        seconds = []
+        for query in queries:
+            start = time.perf_counter()
+            encode_query(query)
+            seconds.append(time.perf_counter() - start)
+        report['query_encoding'] = latency_summary(seconds)
+    return report
@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from src.agreement import category_counts, compute_agreement, encode_ratings, fleiss_kappa, krippendorff_alpha
+
+def test_krippendorff_alpha_of_the_textbook_example():
+    # Nominal reliability data of Krippendorff (2011), "Computing Krippendorff's Alpha-Reliability": alpha = 0.743.
+    ratings = [
+        [1, 2, 3, 3, 2, 1, 4, 1, 2, None, None, None],
+        [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, None, 3],
+        [None, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, None],
+        [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, None],
+    ]
+    codes, categories = encode_ratings([np.array(column, dtype=object) for column in ratings])
+    assert categories == [1, 2, 3, 4, 5]
+    alpha = krippendorff_alpha(category_counts(codes[None], len(categories)))
+    assert alpha[0, 0] == pytest.approx(0.743, abs=5e-4)
+
+def test_fleiss_kappa_of_the_textbook_example():
+    # 10 subjects rated by 14 raters into 5 categories (Fleiss' kappa example on Wikipedia): kappa = 0.210.
+    counts = np.array([
+        [0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+        [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7],
+    ], dtype=np.float64)
+    assert fleiss_kappa(counts[None])[0, 0] == pytest.approx(0.20993, abs=5e-5)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_cohen_kappa_matches_sklearn(seed):
+    cohen_kappa_score = pytest.importorskip('sklearn.metrics').cohen_kappa_score
+    rng = np.random.default_rng(seed)
+    labels = np.array(['Yes', 'No', 'N/A', None], dtype=object)
+    columns = [labels[rng.choice(4, size=80, p=[0.45, 0.35, 0.15, 0.05])] for _ in range(3)]
+    codes, categories = encode_ratings(columns)
+    results = compute_agreement(codes[None], len(categories), metrics=('cohen',))
+    for a in range(3):
+        for b in range(a + 1, 3):
+            both = [i for i in range(80) if columns[a][i] is not None and columns[b][i] is not None]
+            expected = cohen_kappa_score(columns[a][both].astype(str), columns[b][both].astype(str))
+            assert results['cohen'][0, 0, a, b] == pytest.approx(expected, abs=1e-12)
+            assert results['cohen_items'][0, 0, a, b] == len(both)
+
+def test_missing_ratings_are_not_a_category():
+    codes, categories = encode_ratings([np.array(['Yes', 'No', None], dtype=object), np.array(['Yes', 'No', 'Yes'], dtype=object)])
+    assert categories == ['No', 'Yes']
+    assert codes[2, 0] == -1
+    # The third item has a single rating and is left out: the two remaining items agree perfectly.
+    assert fleiss_kappa(category_counts(codes[None], len(categories)))[0, 0] == pytest.approx(1.0)
@@ -0,0 +1,88 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from src.batch_api import BatchAnnotator, BatchBackend, LocalFileBatchBackend
+
+class FailingOnceBackend(BatchBackend):
+    # Ends the first submitted batch with the given status, then answers like the local backend.
+    def __init__(self, directory: str, first_status: str):
+        self.local = LocalFileBatchBackend(directory)
+        self.first_status = first_status
+        self.submitted = []
+
+    def submit(self, request_path: str) -> str:
+        batch_id = self.local.submit(request_path)
+        self.submitted.append(batch_id)
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return self.first_status if batch_id == self.submitted[0] else self.local.status(batch_id)
+
+    def download(self, batch_id: str, output_path: str) -> None:
+        self.local.download(batch_id, output_path)
+
+@pytest.mark.parametrize('first_status', ['failed', 'expired', 'cancelled'])
+def test_rerun_after_unfinished_batch_submits_new_batch(tmp_path, first_status):
+    backend = FailingOnceBackend(str(tmp_path / 'backend'), first_status)
+    rag_model = SimpleNamespace(model_name='gpt-4o', completion_params={'temperature': 0})
+    annotator = BatchAnnotator(rag_model, backend, str(tmp_path / 'batch'), poll_interval=0)
+    requests = [('0', [{'role': 'user', 'content': 'paragraph'}])]
+
+    with pytest.raises(RuntimeError, match=first_status):
+        annotator.run_batches([requests])
+    assert annotator._load_state() == {}
+
+    outputs = annotator.run_batches([requests])
+    assert len(backend.submitted) == 2
+    assert outputs['0']['response']['status_code'] == 200
+    assert list(annotator._load_state().values()) == [backend.submitted[1]]
+
+class RecordingBackend(LocalFileBatchBackend):
+    # Keeps every batch running for the first polls, and records the order of the calls.
+    def __init__(self, directory: str, running_polls: int = 2):
+        super().__init__(directory, responder=lambda messages: '{"promise_status": "Yes"}')
+        self.running_polls = running_polls
+        self.calls = []
+        self.polls = {}
+
+    def submit(self, request_path: str) -> str:
+        batch_id = super().submit(request_path)
+        self.calls.append(('submit', batch_id))
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        self.calls.append(('status', batch_id))
+        self.polls[batch_id] = self.polls.get(batch_id, 0) + 1
+        return 'in_progress' if self.polls[batch_id] <= self.running_polls else super().status(batch_id)
+
+def test_chunks_are_submitted_before_waiting(tmp_path):
+    backend = RecordingBackend(str(tmp_path / 'backend'))
+    rag_model = SimpleNamespace(model_name='gpt-4o', completion_params={'temperature': 0})
+    annotator = BatchAnnotator(rag_model, backend, str(tmp_path / 'batch'), poll_interval=0)
+    chunks = [[(str(i), [{'role': 'user', 'content': f"paragraph {i}"}])] for i in range(3)]
+
+    outputs = annotator.run_batches(chunks)
+    assert sorted(outputs) == ['0', '1', '2']
+    assert [call for call, _ in backend.calls[:3]] == ['submit'] * 3
+    assert all(call == 'status' for call, _ in backend.calls[3:])
+    # Batches are polled together: 3 rounds of 3 polls.
+    assert len(backend.calls) == 3 + 3 * 3
+    assert sorted(annotator._load_state().values()) == sorted(batch_id for call, batch_id in backend.calls[:3])
+
+def test_failed_chunk_is_resubmitted_alone(tmp_path):
+    backend = FailingOnceBackend(str(tmp_path / 'backend'), 'failed')
+    rag_model = SimpleNamespace(model_name='gpt-4o', completion_params={'temperature': 0})
+    annotator = BatchAnnotator(rag_model, backend, str(tmp_path / 'batch'), poll_interval=0)
+    chunks = [[(str(i), [{'role': 'user', 'content': f"paragraph {i}"}])] for i in range(2)]
+
+    with pytest.raises(RuntimeError, match='failed'):
+        annotator.run_batches(chunks)
+    assert list(annotator._load_state().values()) == [backend.submitted[1]]
+
+    outputs = annotator.run_batches(chunks)
+    assert len(backend.submitted) == 3
+    assert sorted(outputs) == ['0', '1']
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from src.checkpoint import PredictionCheckpoint, paragraph_id
+from src.evaluator import load_aligned_data
+
+ITEMS = [{'data': f"Paragraph {i}.", 'promise_status': 'Yes'} for i in range(3)]
+
+def test_resume_keeps_the_saved_predictions(tmp_path):
+    path = str(tmp_path / 'predictions.jsonl')
+    with PredictionCheckpoint(path) as checkpoint:
+        checkpoint.write(ITEMS[0], {'promise_status': 'Yes'})
+    with PredictionCheckpoint(path, resume=True) as checkpoint:
+        assert checkpoint.is_done(ITEMS[0]) and not checkpoint.is_done(ITEMS[1])
+        checkpoint.write(ITEMS[1], {'promise_status': 'No'})
+    with PredictionCheckpoint(path) as checkpoint:
+        # Without resume the file is started over.
+        assert not checkpoint.is_done(ITEMS[0])
+    assert os.path.getsize(path) == 0
+
+def test_partial_last_line_is_truncated_on_resume(tmp_path):
+    path = tmp_path / 'predictions.jsonl'
+    complete = json.dumps({'promise_status': 'Yes', 'id': paragraph_id(ITEMS[0])}) + '\n'
+    path.write_text(complete + '{"promise_status": "N', encoding='utf-8')
+    with PredictionCheckpoint(str(path), resume=True) as checkpoint:
+        assert checkpoint.completed == {paragraph_id(ITEMS[0])}
+        checkpoint.write(ITEMS[1], {'promise_status': 'No'})
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert lines[0] == complete.strip()
+    assert [json.loads(line)['id'] for line in lines] == [paragraph_id(ITEMS[0]), paragraph_id(ITEMS[1])]
+
+def test_partial_line_without_newline_before_it(tmp_path):
+    path = tmp_path / 'predictions.jsonl'
+    path.write_text(json.dumps({'id': paragraph_id(ITEMS[0])}), encoding='utf-8')
+    with PredictionCheckpoint(str(path), resume=True) as checkpoint:
+        checkpoint.write(ITEMS[1], {})
+    assert [json.loads(line)['id'] for line in path.read_text(encoding='utf-8').splitlines()] == [paragraph_id(ITEMS[0]), paragraph_id(ITEMS[1])]
+
+def test_incomplete_checkpoint_is_not_evaluated_unless_allowed(tmp_path):
+    true_path = tmp_path / 'test.json'
+    true_path.write_text(json.dumps(ITEMS), encoding='utf-8')
+    pred_path = str(tmp_path / 'predictions.jsonl')
+    with PredictionCheckpoint(pred_path) as checkpoint:
+        checkpoint.write(ITEMS[2], {'promise_status': 'No'})
+        checkpoint.write(ITEMS[0], {'promise_status': 'Yes'})
+
+    with pytest.raises(ValueError, match='Only 2 of 3'):
+        load_aligned_data(str(true_path), pred_path)
+    true_data, pred_data = load_aligned_data(str(true_path), pred_path, allow_partial=True)
+    assert true_data == [ITEMS[0], ITEMS[2]]
+    assert [item['promise_status'] for item in pred_data] == ['Yes', 'No']
+
+    with PredictionCheckpoint(pred_path, resume=True) as checkpoint:
+        checkpoint.write(ITEMS[1], {'promise_status': 'No'})
+    true_data, pred_data = load_aligned_data(str(true_path), pred_path)
+    assert len(true_data) == len(pred_data) == 3
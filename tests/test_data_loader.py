@@ -0,0 +1,27 @@
+import json
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from src.data_loader import iter_json_data
+
+def test_number_cut_at_chunk_boundary(tmp_path):
+    path = tmp_path / 'numbers.json'
+    path.write_text('[12.5, 3]', encoding='utf-8')
+    for chunk_size in range(1, 10):
+        assert list(iter_json_data(str(path), chunk_size=chunk_size)) == [12.5, 3]
+
+@pytest.mark.parametrize('seed', range(20))
+def test_scalar_arrays_with_small_chunks(tmp_path, seed):
+    rng = random.Random(seed)
+    scalars = [0, -7, 12.5, 1e-07, -3.25e+20, 6.02e23, True, False, None, '', 'a,b]', 'ユニコード', '\\"']
+    values = [rng.choice(scalars) for _ in range(rng.randint(0, 30))]
+    separators = [',', ', ', ' ,\n', '\t,']
+    text = '[' + rng.choice(['', ' ', '\n']) + rng.choice(separators).join(json.dumps(value) for value in values) + rng.choice(['', ' ', '\n']) + ']'
+    path = tmp_path / 'scalars.json'
+    path.write_text(text, encoding='utf-8')
+    for chunk_size in (1, 2, 3, 4, 7):
+        assert list(iter_json_data(str(path), chunk_size=chunk_size)) == json.loads(text)
@@ -0,0 +1,44 @@
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from scripts.run_benchmarks import generate_corpus
+from src.data_preprocessor import iter_hash_folds, iter_hash_split, split_data
+
+STRATIFY = ['promise_status', 'evidence_quality']
+
+@pytest.mark.parametrize('test_size', [0.1, 0.2, 0.35])
+def test_stratified_split_keeps_every_stratum_within_one_record(test_size):
+    seen, tested = {}, {}
+    for is_test, record in iter_hash_split(generate_corpus(2000), test_size, stratify=STRATIFY):
+        stratum = tuple(record.get(field) for field in STRATIFY)
+        seen[stratum] = seen.get(stratum, 0) + 1
+        tested[stratum] = tested.get(stratum, 0) + is_test
+        # At any point of the stream, not only at the end.
+        assert abs(tested[stratum] - test_size * seen[stratum]) < 1
+    assert len(seen) > 3
+
+def test_unstratified_split_only_depends_on_the_key():
+    records = generate_corpus(500)
+    assignments = {record['data']: is_test for is_test, record in iter_hash_split(records, 0.2)}
+    shuffled = records[:]
+    random.Random(0).shuffle(shuffled)
+    extended = shuffled + generate_corpus(100, seed=7)
+    for is_test, record in iter_hash_split(extended, 0.2):
+        if record['data'] in assignments:
+            assert is_test == assignments[record['data']]
+    assert 0.15 < sum(assignments.values()) / len(assignments) < 0.25
+
+def test_stratified_folds_are_balanced():
+    counts = {}
+    for fold, record in iter_hash_folds(generate_corpus(1000), n_folds=5, stratify=STRATIFY):
+        counts.setdefault(tuple(record.get(field) for field in STRATIFY), [0] * 5)[fold] += 1
+    assert all(max(fold_counts) - min(fold_counts) <= 1 for fold_counts in counts.values())
+
+def test_split_data_matches_train_test_split():
+    train_test_split = pytest.importorskip('sklearn.model_selection').train_test_split
+    data = [{'data': str(i)} for i in range(103)]
+    assert split_data(data, 0.2, 42) == tuple(train_test_split(data, test_size=0.2, random_state=42))
@@ -0,0 +1,56 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from src.embedding_cache import EmbeddingCache
+
+def encode(texts):
+    # One distinct vector per text, so that a vector stored in the wrong row is noticed.
+    return np.array([[len(text), sum(map(ord, text)) % 97, 1.0] for text in texts], dtype=np.float32)
+
+def test_reload_returns_cached_vectors_without_encoding(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    expected = cache.encode(['a', 'bb', 'ccc'], encode)
+
+    def fail(texts):
+        raise AssertionError(f"encoded again: {texts}")
+
+    reloaded = EmbeddingCache(str(tmp_path), 'model')
+    assert len(reloaded) == 3
+    np.testing.assert_array_equal(reloaded.encode(['ccc', 'a', 'bb'], fail), expected[[2, 0, 1]])
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'model', max_entries=2)
+    cache.encode(['a'], encode)
+    cache.encode(['bb'], encode)
+    cache.encode(['a'], encode)
+    cache.encode(['ccc'], encode)
+
+    encoded = []
+    def recording(texts):
+        encoded.extend(texts)
+        return encode(texts)
+
+    reloaded = EmbeddingCache(str(tmp_path), 'model', max_entries=2)
+    np.testing.assert_array_equal(reloaded.encode(['a', 'ccc', 'bb'], recording), encode(['a', 'ccc', 'bb']))
+    assert encoded == ['bb']
+
+def test_crash_after_reusing_a_row_does_not_map_the_evicted_key(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path), 'model', max_entries=2)
+    cache.encode(['a', 'bb'], encode)
+
+    # The process dies after the new vector overwrote the evicted row but before encode() writes the index.
+    store = EmbeddingCache._store
+    def crashing_store(self, vectors):
+        store(self, vectors)
+        raise KeyboardInterrupt
+    monkeypatch.setattr(EmbeddingCache, '_store', crashing_store)
+    with pytest.raises(KeyboardInterrupt):
+        cache.encode(['ccc'], encode)
+    monkeypatch.undo()
+
+    reloaded = EmbeddingCache(str(tmp_path), 'model', max_entries=2)
+    np.testing.assert_array_equal(reloaded.encode(['a', 'bb'], encode), encode(['a', 'bb']))
@@ -0,0 +1,49 @@
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from src.evaluator import CATEGORICAL_ELEMENTS, calculate_f1_scores, check_parity, rouge_l_score
+
+WORDS = ['we', 'will', 'reduce', 'CO2', 'emissions', 'by', '30%', 'in', '2030', 'the', 'company', '再生可能エネルギー']
+
+def random_text(rng: random.Random) -> str:
+    sentences = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))) for _ in range(rng.randint(1, 3))]
+    return rng.choice(['. ', '.', '.  ']).join(sentences) + rng.choice(['', '.'])
+
+def random_records(rng: random.Random, n: int):
+    labels = {
+        'promise_status': ['Yes', 'No'],
+        'verification_timeline': ['already', 'within_2_years', 'between_2_and_5_years', 'more_than_5_years', 'N/A'],
+        'evidence_status': ['Yes', 'No', 'N/A'],
+        'evidence_quality': ['Clear', 'Not Clear', 'Misleading', 'N/A'],
+    }
+    return [dict({element: rng.choice(values) for element, values in labels.items()},
+                 promise_string=rng.choice(['', random_text(rng)]), evidence_string=random_text(rng)) for _ in range(n)]
+
+@pytest.mark.parametrize('seed', range(10))
+def test_rouge_l_matches_the_rouge_package(seed):
+    Rouge = pytest.importorskip('rouge').Rouge
+    rng = random.Random(seed)
+    for _ in range(20):
+        hypothesis, reference = random_text(rng), random_text(rng)
+        expected = Rouge().get_scores(hypothesis, reference)[0]['rouge-l']
+        assert rouge_l_score(hypothesis, reference) == pytest.approx(expected, abs=1e-12)
+
+@pytest.mark.parametrize('seed', range(10))
+def test_scores_match_the_reference_implementations(seed):
+    pytest.importorskip('rouge')
+    pytest.importorskip('sklearn')
+    rng = random.Random(seed)
+    differences = check_parity(random_records(rng, 50), random_records(rng, 50))
+    assert set(differences) >= set(CATEGORICAL_ELEMENTS)
+    assert max(differences.values()) < 1e-9
+
+def test_f1_leaves_out_na_except_for_promise_status():
+    true_data = [{'promise_status': 'Yes', 'evidence_status': 'N/A'}, {'promise_status': 'N/A', 'evidence_status': 'Yes'}]
+    pred_data = [{'promise_status': 'Yes', 'evidence_status': 'Yes'}, {'promise_status': 'Yes', 'evidence_status': 'Yes'}]
+    scores = calculate_f1_scores(true_data, pred_data)
+    assert scores['promise_status'] == pytest.approx(1 / 3)
+    assert scores['evidence_status'] == 1.0
@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from src.output_parser import OutputParseError, extract_json_object, parse_annotation
+from src.rag_model import RAGModel
+
+ANNOTATION = {
+    'data': 'We will cut emissions by 30% by 2030.',
+    'promise_status': 'Yes',
+    'promise_string': 'We will cut emissions by 30% by 2030.',
+    'verification_timeline': 'more_than_5_years',
+    'evidence_status': 'No',
+    'evidence_string': None,
+    'evidence_quality': 'N/A',
+}
+
+def test_annotation_after_thoughts_and_in_code_fences():
+    text = ("The paragraph states a target {not JSON}. For example {\"a\": 1} is not an annotation.\n"
+            "```json\n" + json.dumps(ANNOTATION, indent=2) + "\n```\nThis is my answer.")
+    assert parse_annotation(text) == ANNOTATION
+
+def test_last_labeled_object_wins():
+    first = dict(ANNOTATION, promise_status='No')
+    assert parse_annotation(json.dumps(first) + ' corrected: ' + json.dumps(ANNOTATION)) == ANNOTATION
+
+def test_braces_inside_strings():
+    annotation = dict(ANNOTATION, promise_string='a {brace} and a "quote" }')
+    assert parse_annotation('Answer: ' + json.dumps(annotation)) == annotation
+
+def test_trailing_commas_are_repaired():
+    text = json.dumps(ANNOTATION)[:-1] + ',}'
+    assert extract_json_object(text) == (ANNOTATION, True)
+
+def test_labels_are_normalized_and_missing_strings_filled():
+    text = json.dumps(dict({k: v for k, v in ANNOTATION.items() if k != 'evidence_string'},
+                           verification_timeline='More than 5 years', evidence_quality='n/a'))
+    assert parse_annotation(text) == ANNOTATION
+
+@pytest.mark.parametrize('text, problem', [
+    ('No JSON here.', 'does not contain a JSON object'),
+    (json.dumps(dict(ANNOTATION, promise_status='Maybe')), '"promise_status" must be one of'),
+    (json.dumps({k: v for k, v in ANNOTATION.items() if k != 'evidence_status'}), '"evidence_status" is missing'),
+    (json.dumps(dict(ANNOTATION, evidence_string=3)), '"evidence_string" must be a string or null'),
+])
+def test_invalid_outputs(text, problem):
+    with pytest.raises(OutputParseError) as error:
+        parse_annotation(text)
+    assert any(problem in p for p in error.value.problems)
+
+def completions(*contents):
+    sent = []
+    def complete(messages):
+        sent.append(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=contents[len(sent) - 1]))])
+    return sent, complete
+
+def test_invalid_answer_is_asked_again_with_its_problems():
+    rag_model = RAGModel('key', 'gpt-4o', embedder=object(), max_repairs=1)
+    messages = [{'role': 'user', 'content': 'Annotate.'}]
+    invalid = json.dumps(dict(ANNOTATION, promise_status='Maybe'))
+    sent, complete = completions(invalid, json.dumps(ANNOTATION))
+    assert json.loads(rag_model.complete_with_repairs(messages, complete)) == ANNOTATION
+    assert sent[1][:2] == messages + [{'role': 'assistant', 'content': invalid}]
+    assert '"promise_status" must be one of' in sent[1][2]['content']
+
+def test_repairs_are_limited():
+    rag_model = RAGModel('key', 'gpt-4o', embedder=object(), max_repairs=1)
+    sent, complete = completions('no json', 'still no json', json.dumps(ANNOTATION))
+    with pytest.raises(OutputParseError):
+        rag_model.complete_with_repairs([{'role': 'user', 'content': 'Annotate.'}], complete)
+    assert len(sent) == 2
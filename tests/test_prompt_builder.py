@@ -0,0 +1,47 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.prompt_builder import PromptBuilder
+
+EXAMPLES = [{'data': f"Example paragraph number {i} about emissions.", 'promise_status': 'Yes', 'evidence_string': None} for i in range(6)]
+
+def make_builder(max_prompt_tokens=None) -> PromptBuilder:
+    return PromptBuilder("System prompt.", "Instruction.\n", "\n\nAnalyze:\n{paragraph}\n", max_prompt_tokens=max_prompt_tokens)
+
+def prompt_tokens(builder: PromptBuilder, messages) -> int:
+    return sum(builder.count_tokens(message['content']) for message in messages)
+
+def test_examples_are_dropped_from_the_end_to_fit_the_budget():
+    unlimited = make_builder()
+    full = unlimited.build("A paragraph.", EXAMPLES)
+    budget = prompt_tokens(unlimited, full) - 1
+    builder = make_builder(budget)
+    messages = builder.build("A paragraph.", EXAMPLES)
+
+    assert prompt_tokens(builder, messages) <= budget
+    kept = [example for example in EXAMPLES if builder.format_example(example) in messages[1]['content']]
+    assert kept == EXAMPLES[:len(kept)] and 0 < len(kept) < len(EXAMPLES)
+    summary = builder.summary()
+    assert summary['examples_dropped'] == len(EXAMPLES) - len(kept)
+    assert summary['over_budget'] == 0 and summary['max_prompt_tokens'] <= budget
+
+def test_paragraph_over_the_budget_is_sent_without_examples():
+    builder = make_builder(10)
+    messages = builder.build("A long paragraph. " * 20, EXAMPLES)
+    assert messages[1]['content'].startswith("Instruction.\n\n\nAnalyze:")
+    assert builder.summary()['over_budget'] == 1
+
+def test_compact_examples_leave_out_null_fields():
+    assert make_builder().format_example(EXAMPLES[0]) == '{"data":"Example paragraph number 0 about emissions.","promise_status":"Yes"}'
+
+def test_statistics_are_counted_across_threads():
+    builder = make_builder(200)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: builder.build(f"Paragraph {i}.", EXAMPLES), range(400)))
+    summary = builder.summary()
+    assert summary['prompts'] == 400
+    builder.reset()
+    assert builder.summary() == {'prompts': 0}
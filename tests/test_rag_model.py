@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from scripts.run_benchmarks import StubEmbedder, generate_corpus
+from src.rag_model import RAGModel
+
+@pytest.mark.parametrize('use_store', [False, True])
+def test_empty_search_data_returns_no_contexts(tmp_path, use_store):
+    rag_model = RAGModel('key', 'gpt-4o', embedder=StubEmbedder(),
+                         document_store_dir=str(tmp_path / 'store') if use_store else None)
+    rag_model.prepare_documents([])
+    assert rag_model.get_relevant_contexts(['first query', 'second query']) == [[], []]
+    assert rag_model.get_relevant_context('query') == []
+
+def test_contexts_follow_the_order_of_the_queries():
+    search_data = generate_corpus(50)
+    rag_model = RAGModel('key', 'gpt-4o', embedder=StubEmbedder())
+    rag_model.prepare_documents(search_data)
+    queries = [search_data[3]['data'], search_data[17]['data']]
+    contexts = rag_model.get_relevant_contexts(queries, top_k=4)
+    assert [len(row) for row in contexts] == [4, 4]
+    assert contexts[0][0] is search_data[3] and contexts[1][0] is search_data[17]
@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from scripts.run_analysis import build_rag_model
+from scripts.run_benchmarks import StubEmbedder
+from src.rag_model import RAGModel
+from src.reranker import BM25Index, check_candidate_source, create_reranker
+
+DOCUMENTS = [
+    "we will reduce emissions by 2030",
+    "the board met four times",
+    "water usage fell by ten percent",
+    "we plan to plant trees and reduce emissions",
+    "employees received safety training",
+]
+
+class WordOverlapModel:
+    # Stands in for a CrossEncoder: the score of a pair is the number of shared words.
+    def __init__(self):
+        self.pairs = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.pairs += len(pairs)
+        return [len(set(query.split()) & set(document.split())) for query, document in pairs]
+
+@pytest.mark.parametrize('kind', ['bm25', 'hybrid'])
+def test_lexical_rerankers_are_rejected_over_bm25_candidates(kind):
+    with pytest.raises(ValueError, match=kind):
+        check_candidate_source(kind, 'bm25')
+    with pytest.raises(ValueError):
+        build_rag_model({'openai_api_key': 'key', 'model_name': 'gpt-4o', 'reranker': kind, 'candidate_source': 'bm25'})
+    check_candidate_source(kind, 'embedding')
+
+@pytest.mark.parametrize('kind', [None, 'cross_encoder'])
+def test_other_settings_are_accepted_over_bm25_candidates(kind):
+    check_candidate_source(kind, 'bm25')
+
+def test_unknown_candidate_source_and_reranker():
+    with pytest.raises(ValueError, match='candidate_source'):
+        RAGModel('key', 'gpt-4o', embedder=StubEmbedder(), candidate_source='random')
+    with pytest.raises(ValueError, match='Unknown reranker'):
+        create_reranker('colbert')
+
+@pytest.mark.parametrize('kind', ['bm25', 'hybrid', 'cross_encoder'])
+def test_rerankers_reorder_the_candidates_they_are_given(kind):
+    params = {'model': WordOverlapModel()} if kind == 'cross_encoder' else {}
+    reranker = create_reranker(kind, **params)
+    queries = ["reduce emissions", "safety training"]
+    candidates = np.array([[1, 2, 3, 0], [0, 4, 2, 1]])
+    reranked = reranker.rerank(queries, candidates, DOCUMENTS, BM25Index(DOCUMENTS) if reranker.uses_bm25 else None)
+    assert [sorted(row) for row in reranked.tolist()] == [sorted(row) for row in candidates.tolist()]
+    if kind != 'hybrid':
+        assert set(reranked[0, :2]) == {0, 3} and reranked[1, 0] == 4
+
+def test_cross_encoder_scores_are_cached_across_runs(tmp_path):
+    cache_path = str(tmp_path / 'scores.json')
+    model = WordOverlapModel()
+    reranker = create_reranker('cross_encoder', model=model, cache_path=cache_path)
+    candidates = np.array([[0, 1, 2]])
+    first = reranker.rerank(["reduce emissions"], candidates, DOCUMENTS)
+    reranker.rerank(["reduce emissions"], candidates, DOCUMENTS)
+    assert model.pairs == 3
+    reranker.close()
+
+    model = WordOverlapModel()
+    reranker = create_reranker('cross_encoder', model=model, cache_path=cache_path)
+    np.testing.assert_array_equal(reranker.rerank(["reduce emissions"], candidates, DOCUMENTS), first)
+    assert model.pairs == 0
+
+def test_rag_model_keeps_top_k_of_the_reranked_pool():
+    search_data = [{'data': document} for document in DOCUMENTS]
+    rag_model = RAGModel('key', 'gpt-4o', embedder=StubEmbedder(), candidate_pool=5,
+                         reranker=create_reranker('cross_encoder', model=WordOverlapModel()))
+    rag_model.prepare_documents(search_data)
+    contexts = rag_model.get_relevant_contexts(["we reduce emissions by 2030"], top_k=2)
+    assert [context['data'] for context in contexts[0]] == [DOCUMENTS[0], DOCUMENTS[3]]
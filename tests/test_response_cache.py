@@ -0,0 +1,47 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.response_cache import ResponseCache, request_key
+
+MESSAGES = [{'role': 'system', 'content': 'You are an expert.'}, {'role': 'user', 'content': '日本語の段落'}]
+
+def test_request_key_is_deterministic():
+    key = request_key('gpt-4o', MESSAGES, {'temperature': 0, 'seed': 1})
+    assert key == request_key('gpt-4o', [dict(message) for message in MESSAGES], {'seed': 1, 'temperature': 0})
+    assert len(key) == 64
+
+def test_request_key_changes_with_any_part_of_the_request():
+    key = request_key('gpt-4o', MESSAGES, {'temperature': 0})
+    assert key != request_key('gpt-4o-mini', MESSAGES, {'temperature': 0})
+    assert key != request_key('gpt-4o', MESSAGES[:1], {'temperature': 0})
+    assert key != request_key('gpt-4o', MESSAGES[::-1], {'temperature': 0})
+    assert key != request_key('gpt-4o', [MESSAGES[0], dict(MESSAGES[1], content='日本語の段落 ')], {'temperature': 0})
+    assert key != request_key('gpt-4o', MESSAGES, {'temperature': 0.5})
+    assert key != request_key('gpt-4o', MESSAGES, {})
+
+def test_responses_survive_a_reopen(tmp_path):
+    path = str(tmp_path / 'responses.sqlite')
+    key = request_key('gpt-4o', MESSAGES, {'temperature': 0})
+    cache = ResponseCache(path)
+    assert cache.get(key) is None
+    cache.put(key, '{"choices": []}')
+    cache.close()
+
+    cache = ResponseCache(path)
+    assert cache.get(key) == '{"choices": []}'
+    assert cache.stats() == {'hits': 1, 'misses': 0, 'entries': 1}
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'), max_entries=2)
+    cache.put('a', '1')
+    cache.put('b', '2')
+    cache.put('a', '1')
+    cache.get('a')
+    cache.put('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1' and cache.get('c') == '3'
+    assert cache.stats()['entries'] == cache.entries == 2
+    cache.close()
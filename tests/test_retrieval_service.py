@@ -0,0 +1,46 @@
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from scripts.run_benchmarks import StubEmbedder, generate_corpus
+from src.rag_model import RAGModel
+from src.retrieval_service import RetrievalService
+
+@pytest.fixture
+def service():
+    rag_model = RAGModel('key', 'gpt-4o', embedder=StubEmbedder())
+    rag_model.prepare_documents(generate_corpus(30))
+    service = RetrievalService({'ja': rag_model}, port=0)
+    service.start()
+    yield service
+    service.stop()
+
+def post(service: RetrievalService, path: str, body: dict):
+    request = urllib.request.Request(service.base_url + path, data=json.dumps(body).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_retrieve(service):
+    status, body = post(service, '/retrieve', {'language': 'ja', 'queries': ['a', 'b'], 'top_k': 3})
+    assert status == 200 and [len(results) for results in body['results']] == [3, 3]
+
+@pytest.mark.parametrize('path, body, status, error', [
+    ('/unknown', {'language': 'ja'}, 404, 'Unknown path'),
+    ('/unknown', {}, 404, 'Unknown path'),
+    ('/retrieve', {'queries': ['a']}, 400, 'Missing "language"'),
+    ('/retrieve', {'language': 'en', 'queries': ['a']}, 404, 'Unknown language: en'),
+    ('/retrieve', {'language': 'ja', 'top_k': 'many'}, 400, 'Invalid request'),
+    ('/annotate', {'language': 'ja', 'paragraphs': ['a']}, 404, 'Annotation is not enabled'),
+])
+def test_errors(service, path, body, status, error):
+    response_status, response = post(service, path, body)
+    assert response_status == status and response['error'].startswith(error)
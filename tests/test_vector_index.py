@@ -0,0 +1,129 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from scripts.run_benchmarks import StubEmbedder, generate_corpus
+from src.rag_model import RAGModel
+from src.retrieval_eval import evaluate_retrieval
+from src.vector_index import compare_indexes, create_index, load_index, read_index_meta
+
+SETTINGS = [
+    ('exact', {}),
+    ('exact', {'precision': 'int8'}),
+    ('exact', {'precision': 'float16', 'dims': 16}),
+    ('ivf', {'n_lists': 8, 'n_probe': 2}),
+    ('ivf', {'n_lists': 8, 'n_probe': 2, 'precision': 'int8'}),
+]
+
+def random_embeddings(n: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+@pytest.mark.parametrize('kind, params', SETTINGS)
+def test_save_and_load_round_trip(tmp_path, kind, params):
+    index = create_index(kind, **params)
+    index.build(random_embeddings(200))
+    index.fingerprint = 'abc'
+    index.save(str(tmp_path))
+
+    meta = read_index_meta(str(tmp_path))
+    assert (meta['kind'], meta['size'], meta['dim'], meta['fingerprint']) == (kind, 200, 32, 'abc')
+    loaded = load_index(str(tmp_path))
+    assert loaded.params == index.params
+    queries = random_embeddings(20, seed=1)
+    np.testing.assert_array_equal(loaded.search(queries, 5), index.search(queries, 5))
+
+def test_no_saved_index():
+    assert read_index_meta('/nonexistent/index') is None
+
+def make_rag_model(dim: int = 256, **index_settings) -> RAGModel:
+    return RAGModel('key', 'gpt-4o', embedder=StubEmbedder(dim), **index_settings)
+
+def test_saved_index_is_reused_only_with_the_same_fingerprint(tmp_path, monkeypatch):
+    search_data = generate_corpus(60)
+    index_path = str(tmp_path / 'index')
+    make_rag_model().prepare_documents(search_data, index_path=index_path)
+    fingerprint = read_index_meta(index_path)['fingerprint']
+
+    loads = []
+    monkeypatch.setattr('src.rag_model.load_index', lambda path, meta: loads.append(meta) or load_index(path, meta))
+    make_rag_model().prepare_documents(search_data, index_path=index_path)
+    assert len(loads) == 1
+
+    # Another embedding dimension, index setting or document set builds a new index.
+    for rag_model, data in [(make_rag_model(dim=128), search_data),
+                            (make_rag_model(index_params={'precision': 'int8'}), search_data),
+                            (make_rag_model(index_type='ivf'), search_data),
+                            (make_rag_model(), search_data[:-1])]:
+        rag_model.prepare_documents(data, index_path=index_path)
+        assert read_index_meta(index_path)['fingerprint'] != fingerprint
+        fingerprint = read_index_meta(index_path)['fingerprint']
+    assert len(loads) == 1
+
+# Settings that keep enough of each vector for a document to be its own nearest neighbour.
+UPDATABLE = [(kind, params) for kind, params in SETTINGS if 'dims' not in params] + [('hnsw', {})]
+
+@pytest.mark.parametrize('kind, params', UPDATABLE)
+def test_add_and_remove_keep_document_positions(tmp_path, kind, params):
+    if kind == 'hnsw':
+        pytest.importorskip('hnswlib')
+    embeddings = random_embeddings(300)
+    index = create_index(kind, **params)
+    index.build(embeddings[:200])
+    index.add(embeddings[200:])
+    removed = [0, 7, 7, 150, 250, 299]
+    index.remove(removed)
+    remaining = np.delete(embeddings, np.unique(removed), axis=0)
+    assert index.size == len(remaining)
+
+    # Every remaining document is found at its new position by its own embedding.
+    np.testing.assert_array_equal(index.search(remaining, 1)[:, 0], np.arange(len(remaining)))
+    index.save(str(tmp_path))
+    loaded = load_index(str(tmp_path))
+    np.testing.assert_array_equal(loaded.search(remaining[::10], 3), index.search(remaining[::10], 3))
+
+    new = random_embeddings(5, seed=3)
+    loaded.add(new)
+    np.testing.assert_array_equal(loaded.search(new, 1)[:, 0], np.arange(len(remaining), len(remaining) + 5))
+
+def test_updated_index_matches_a_rebuilt_one():
+    embeddings = random_embeddings(120)
+    updated = create_index('exact')
+    updated.build(embeddings[:100])
+    updated.remove([3, 50])
+    updated.add(embeddings[100:])
+    rebuilt = create_index('exact')
+    rebuilt.build(np.concatenate([np.delete(embeddings[:100], [3, 50], axis=0), embeddings[100:]]))
+    queries = random_embeddings(10, seed=2)
+    np.testing.assert_array_equal(updated.search(queries, 6), rebuilt.search(queries, 6))
+
+def test_compare_indexes_with_fewer_documents_than_k():
+    index = create_index('exact')
+    index.build(random_embeddings(3))
+    report = compare_indexes(index, index, random_embeddings(4, seed=1), ks=[1, 6, 10])
+    assert [key for key in report if key.startswith('recall@')] == ['recall@1', 'recall@3']
+    assert report['recall@3'] == 1.0
+
+def test_compare_indexes_without_documents_or_queries():
+    empty = create_index('exact')
+    empty.build(np.empty((0, 32), dtype=np.float32))
+    assert compare_indexes(empty, empty, random_embeddings(4), ks=[1, 6]) == {}
+    index = create_index('exact')
+    index.build(random_embeddings(10))
+    assert compare_indexes(index, index, np.empty((0, 32), dtype=np.float32)) == {}
+    assert compare_indexes(index, index, random_embeddings(4), ks=[0]) == {}
+
+def test_evaluate_retrieval_with_few_or_no_documents():
+    search_data = generate_corpus(4)
+    test_data = generate_corpus(3, seed=1)
+    embedder = StubEmbedder(32)
+    embed = lambda records: embedder.encode([record['data'] for record in records])
+    evaluation = evaluate_retrieval(search_data, test_data, embed(search_data), embed(test_data), [{'index_type': 'exact', 'index_params': {'precision': 'int8'}}], ks=[1, 6])
+    assert evaluation['ks'] == [1, 4]
+    assert [report['index_params'] for report in evaluation['settings']] == [{}, {'precision': 'int8'}]
+    assert 'agreement@4' in evaluation['settings'][1]['labels']['promise_status']
+
+    evaluation = evaluate_retrieval([], test_data, np.empty((0, 32), dtype=np.float32), embed(test_data), [{'index_type': 'exact'}])
+    assert evaluation == {'n_documents': 0, 'n_queries': 3, 'ks': [], 'settings': []}